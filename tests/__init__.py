@@ -10,3 +10,29 @@ holoviews.extension("bokeh")
 ROOT_DIR = pathlib.Path(__file__).resolve().parent.parent
 TEST_DIR = ROOT_DIR / "tests"
 DATA_DIR = TEST_DIR / "data"
+
+
+def create_schism_file(path, no_times, lon_offset=0.0, start="2024-01-01"):
+    """Write a tiny SCHISM output file: two triangles and a quad."""
+    import numpy as np
+    import pandas as pd
+    import xarray as xr
+
+    # SCHISM uses one-based indices and a fill value for the 4th node of triangles
+    face_nodes = np.array([[1, 2, 3, -1], [2, 4, 3, -1], [2, 5, 6, 4]], dtype=np.int32)
+    lon = np.array([0.0, 1.0, 0.0, 1.0, 2.0, 2.0]) + lon_offset
+    lat = np.array([0.0, 0.0, 1.0, 1.0, 0.0, 1.0])
+    time = pd.date_range(start, periods=no_times, freq="h")
+    ds = xr.Dataset(
+        data_vars=dict(
+            SCHISM_hgrid_face_nodes=(("nSCHISM_hgrid_face", "nMaxSCHISM_hgrid_face_nodes"), face_nodes),
+            SCHISM_hgrid_node_x=(("nSCHISM_hgrid_node",), lon),
+            SCHISM_hgrid_node_y=(("nSCHISM_hgrid_node",), lat),
+            SCHISM_hgrid_edge_nodes=(("nSCHISM_hgrid_edge", "two"), np.ones((8, 2), dtype=np.int32)),
+            elev=(("time", "nSCHISM_hgrid_node"), np.random.default_rng(0).random((no_times, len(lon)))),
+        ),
+        coords=dict(time=time),
+    )
+    ds.SCHISM_hgrid_face_nodes.encoding["_FillValue"] = -1
+    ds.to_netcdf(path)
+    return path
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import concurrent.futures
+
 import geoviews as gv
 import holoviews as hv
+import numpy as np
 import pytest
+import xarray as xr
 
+import thalassa
+from . import create_schism_file
 from . import DATA_DIR
 from thalassa import api
+from thalassa import cache
 from thalassa import normalization
+from thalassa import spatial
+from thalassa import topology
+from thalassa import utils
 
 ADCIRC_NC = DATA_DIR / "fort.63.nc"
 SELAFIN = DATA_DIR / "iceland.slf"
 
+
 @pytest.mark.parametrize(
     "file,variable",
     [
@@ -61,3 +72,206 @@ def test_get_tiles():
     tiles = api.get_tiles()
     hv.render(tiles, backend="bokeh")
     assert isinstance(tiles, gv.WMTS), type(tiles)
+
+
+def test_tap_and_pointer_timeseries_share_the_cache():
+    ds = api.open_dataset(SELAFIN)
+    raster = api.get_raster(api.create_trimesh(ds.isel(time=0), variable="S"))
+    tap_ts = api.get_tap_timeseries(ds, "S", raster)
+    pointer_ts = api.get_pointer_timeseries(ds, "S", raster)
+    cache.TIMESERIES_CACHE.clear()
+    for dmap in (tap_ts, pointer_ts):
+        hv.render(dmap, backend="bokeh")
+        dmap.event(x=-2400000, y=9000000)
+        curve = dmap[()]
+        assert len(curve) == len(ds.time)
+    info = cache.TIMESERIES_CACHE.info()
+    assert info["misses"] == 1
+    assert info["hits"] == 1
+
+
+def test_timeseries_cache_distinguishes_modified_variables():
+    ds = api.open_dataset(SELAFIN)
+    modified = ds.assign(S=ds.S * 2)
+    assert api._get_dataset_key(ds, "S") == api._get_dataset_key(api.open_dataset(SELAFIN), "S")
+    assert api._get_dataset_key(ds, "S") != api._get_dataset_key(modified, "S")
+    assert api._get_dataset_key(modified, "S") != api._get_dataset_key(ds.assign(S=ds.S * 2), "S")
+    raster = api.get_raster(api.create_trimesh(ds.isel(time=0), variable="S"))
+    curves = []
+    for dataset in (ds, modified):
+        dmap = api.get_tap_timeseries(dataset, "S", raster)
+        assert api._DMAP_DATASETS[dmap] is dataset
+        hv.render(dmap, backend="bokeh")
+        dmap.event(x=-2400000, y=9000000)
+        curves.append(dmap[()].dframe().S.values)
+    assert np.allclose(curves[1], 2 * curves[0])
+
+
+def test_create_trimesh_reuses_mesh_geometry():
+    ds = api.open_dataset(SELAFIN)
+    api._MESH_GEOMETRY_CACHE.clear()
+    trimesh0 = api.create_trimesh(ds.isel(time=0), variable="S")
+    trimesh1 = api.create_trimesh(ds.isel(time=1), variable="S")
+    assert api._MESH_GEOMETRY_CACHE.info()["hits"] == 1
+    assert list(api._get_mesh_nodes(ds).columns) == ["lon", "lat", "index"]
+    assert np.array_equal(trimesh0.nodes.data.lon, trimesh1.nodes.data.lon)
+    assert np.array_equal(trimesh1.nodes.data.S, ds.S.isel(time=1).values)
+
+
+def test_create_trimesh_does_not_copy_the_mesh_geometry():
+    ds = api.open_dataset(SELAFIN)
+    trimesh = api.create_trimesh(ds.isel(time=0), variable="S")
+    geometry = api._MESH_GEOMETRY_CACHE.get(utils.get_mesh_hash(ds))
+    assert np.shares_memory(trimesh.nodes.data.lon.values, geometry["lon"])
+    assert np.shares_memory(trimesh.nodes.data.lat.values, geometry["lat"])
+    assert [dim.name for dim in trimesh.nodes.kdims] == ["lon", "lat", "index"]
+    assert [dim.name for dim in trimesh.nodes.vdims] == ["S"]
+
+
+def test_wireframe_draws_each_edge_once():
+    ds = api.open_dataset(SELAFIN)
+    edgepaths = api._get_edgepaths(ds)
+    assert isinstance(edgepaths, gv.EdgePaths)
+    # One segment (two nodes and a `nan` separator) per edge, instead of a closed path per triangle
+    no_edges = len(topology.get_mesh_topology(ds).edges)
+    assert len(edgepaths.data[0]) == 3 * no_edges - 1
+    assert no_edges < 3 * ds.sizes["triface"]
+    assert isinstance(api.get_wireframe(ds), hv.DynamicMap)
+
+
+def test_create_time_trimesh():
+    ds = api.open_dataset(SELAFIN)
+    dmap = api.create_time_trimesh(ds, "S", prefetch=1)
+    times = ds.time.values
+    assert list(dmap.kdims[0].values) == list(times)
+    trimesh = dmap[times[1]]
+    # The next frames are being prefetched in the background while we read
+    with utils.get_read_lock(ds):
+        expected = ds.S.isel(time=1).values
+    assert isinstance(trimesh, gv.TriMesh)
+    assert np.array_equal(trimesh.nodes.data.S, expected)
+    raster = api.get_raster(dmap, variable="S")
+    hv.render(raster, backend="bokeh")
+
+
+def test_create_time_trimesh_prefetching_and_reads_are_serialized():
+    ds = api.open_dataset(SELAFIN)
+    expected = api.open_dataset(SELAFIN).S.values
+    dmap = api.create_time_trimesh(ds, "S", prefetch=3)
+    times = ds.time.values
+    indices = np.arange(0, ds.sizes["node"], 7)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        with utils.get_read_lock(ds):
+            # The prefetcher waits for the reads of the callers
+            future = executor.submit(dmap.__getitem__, times[0])
+            with pytest.raises(concurrent.futures.TimeoutError):
+                future.result(timeout=0.2)
+            assert np.array_equal(ds.S.isel(time=0).values, expected[0])
+        assert np.array_equal(future.result().nodes.data.S, expected[0])
+    # Reading timeseries while the next frames are being prefetched
+    for i, time in enumerate(times):
+        assert np.array_equal(dmap[time].nodes.data.S, expected[i])
+        subset, _ = spatial.load_nodes(ds, ["S"], indices)
+        assert np.array_equal(subset.S.values, expected[:, indices])
+
+
+def test_create_time_trimesh_requires_time_dimension():
+    ds = api.open_dataset(SELAFIN)
+    with pytest.raises(ValueError) as exc:
+        api.create_time_trimesh(ds.isel(time=0), "S")
+    assert "(time, node)" in str(exc.value)
+
+
+def test_viewport_dmap_loads_only_the_visible_nodes():
+    ds = api.open_dataset(SELAFIN, chunks={}).isel(time=0)
+    dmap = api._create_viewport_dmap(ds, "S")
+    # Nothing is loaded before the plot reports its ranges, but the extent is the one of the mesh
+    placeholder = dmap[()]
+    assert np.isnan(placeholder.nodes.data.S).all()
+    assert list(placeholder.nodes.range("lon")) == api._get_mesh_nodes(ds).lon.agg(["min", "max"]).tolist()
+    x_range, y_range = api._get_transformer().transform((-22, -21), (63, 64))
+    dmap.event(x_range=x_range, y_range=y_range)
+    trimesh = dmap[()]
+    nodes = trimesh.nodes.data
+    assert 0 < len(nodes) < len(ds.node)
+    assert trimesh.array([0, 1, 2]).max() < len(nodes)
+    full = api._get_mesh_nodes(ds, "S").set_index(["lon", "lat"])
+    assert np.array_equal(full.loc[list(zip(nodes.lon, nodes.lat)), "S"].values, nodes.S.values)
+    # A small pan is covered by the margin and doesn't reload anything
+    dmap.event(x_range=(x_range[0] + 1000, x_range[1] + 1000), y_range=y_range)
+    assert dmap[()] is trimesh
+    raster = api.get_raster(ds, "S", viewport=True)
+    hv.render(raster, backend="bokeh")
+
+
+def test_viewport_dmap_narrows_the_loaded_extent_when_zooming_in():
+    ds = api.open_dataset(SELAFIN, chunks={}).isel(time=0)
+    transform = api._get_transformer().transform
+    wide = transform((-24, -14), (63, 66.5))
+    zoomed = transform((-22, -21), (63, 64))
+    dmap = api._create_viewport_dmap(ds, "S")
+    dmap.event(x_range=wide[0], y_range=wide[1])
+    wide_nodes = len(dmap[()].nodes)
+    dmap.event(x_range=zoomed[0], y_range=zoomed[1])
+    fresh = api._create_viewport_dmap(ds, "S")
+    fresh.event(x_range=zoomed[0], y_range=zoomed[1])
+    assert len(dmap[()].nodes) == len(fresh[()].nodes) < wide_nodes
+
+
+@pytest.mark.parametrize("mesh_cache", [False, True])
+def test_open_dataset_fill_value(tmp_path, mesh_cache):
+    # The fill value is the one of the file, i.e. it is compared to the one-based indices
+    path = create_schism_file(tmp_path / "fill.nc", no_times=2)
+    expected = api.open_dataset(path)
+    ds = xr.open_dataset(path, mask_and_scale=False)
+    ds["SCHISM_hgrid_face_nodes"] = ds.SCHISM_hgrid_face_nodes.where(ds.SCHISM_hgrid_face_nodes > 0, 999999)
+    ds.SCHISM_hgrid_face_nodes.attrs.pop("_FillValue")
+    ds.to_netcdf(tmp_path / "out2d_1.nc")
+    opened = api.open_dataset(tmp_path / "out2d_1.nc", mesh_cache=mesh_cache, fill_value=999999)
+    np.testing.assert_array_equal(opened.triface_nodes, expected.triface_nodes)
+    combined = thalassa.open_mfdataset(tmp_path / "out2d_*.nc", mesh_cache=mesh_cache, fill_value=999999)
+    np.testing.assert_array_equal(combined.triface_nodes, expected.triface_nodes)
+    # Without the fill value, the padding would be used as a node index
+    with pytest.raises(ValueError) as exc:
+        api.open_dataset(tmp_path / "out2d_1.nc", mesh_cache=mesh_cache).triface_nodes.values
+    assert "fill_value" in str(exc.value)
+
+
+def test_open_mfdataset(tmp_path):
+    for day in range(3):
+        create_schism_file(tmp_path / f"out2d_{day + 1}.nc", no_times=4, start=f"2024-01-0{day + 1}")
+    ds = thalassa.open_mfdataset(tmp_path / "out2d_*.nc")
+    assert normalization.is_normalized(ds)
+    assert ds.sizes["time"] == 12
+    assert (ds.time.diff("time") > np.timedelta64(0)).all()
+    # The data are lazy
+    assert ds.elev.chunks is not None
+    single = api.open_dataset(tmp_path / "out2d_2.nc")
+    np.testing.assert_array_equal(ds.elev.isel(time=slice(4, 8)), single.elev)
+    np.testing.assert_array_equal(ds.triface_nodes, single.triface_nodes)
+    serial = thalassa.open_mfdataset(sorted(tmp_path.glob("out2d_*.nc")), parallel=False)
+    assert utils.get_mesh_hash(serial) == utils.get_mesh_hash(ds)
+
+
+def test_open_mfdataset_different_meshes(tmp_path):
+    create_schism_file(tmp_path / "out2d_1.nc", no_times=2)
+    create_schism_file(tmp_path / "out2d_2.nc", no_times=2, lon_offset=1, start="2024-01-02")
+    with pytest.raises(ValueError) as exc:
+        thalassa.open_mfdataset(tmp_path / "out2d_*.nc")
+    assert "does not match the mesh" in str(exc.value)
+
+
+def test_open_mfdataset_reordered_triangles(tmp_path):
+    # The files only differ in the order of two triangles in the middle of the connectivity
+    ds = xr.open_dataset(create_schism_file(tmp_path / "base.nc", no_times=2), mask_and_scale=False)
+    face_nodes = np.tile(ds.SCHISM_hgrid_face_nodes.values[:2], (5000, 1))
+    ds = ds.isel(nSCHISM_hgrid_face=[0]).drop_vars("SCHISM_hgrid_face_nodes")
+    ds["SCHISM_hgrid_face_nodes"] = (("nSCHISM_hgrid_face", "nMaxSCHISM_hgrid_face_nodes"), face_nodes)
+    ds.SCHISM_hgrid_face_nodes.attrs["_FillValue"] = -1
+    ds.to_netcdf(tmp_path / "out2d_1.nc")
+    face_nodes[[4999, 5000]] = face_nodes[[5000, 4999]]
+    ds["SCHISM_hgrid_face_nodes"].values = face_nodes
+    ds.to_netcdf(tmp_path / "out2d_2.nc")
+    with pytest.raises(ValueError) as exc:
+        thalassa.open_mfdataset(tmp_path / "out2d_*.nc")
+    assert "does not match the mesh" in str(exc.value)
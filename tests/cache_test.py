@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from thalassa import cache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    lru = cache.LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert "b" not in lru
+    assert "a" in lru
+    assert "c" in lru
+    assert len(lru) == 2
+
+
+def test_lru_cache_memory_budget():
+    lru = cache.LRUCache(maxsize=100, max_bytes=100, sizeof=lambda value: value.nbytes)
+    lru.put("a", np.zeros(5))  # 40 bytes
+    lru.put("b", np.zeros(5))  # 40 bytes
+    lru.put("c", np.zeros(5))  # 40 bytes -> "a" gets evicted
+    assert "a" not in lru
+    assert lru.nbytes == 80
+    # items larger than the budget are not cached
+    lru.put("d", np.zeros(100))
+    assert "d" not in lru
+    assert lru.nbytes == 80
+
+
+def test_lru_cache_info():
+    lru = cache.LRUCache(maxsize=2)
+    assert lru.get_or_create("a", lambda: 1) == 1
+    assert lru.get_or_create("a", lambda: 2) == 1
+    assert lru.get("missing") is None
+    info = lru.info()
+    assert info["hits"] == 1
+    assert info["misses"] == 2
+    assert info["size"] == 1
+    lru.clear()
+    assert lru.info()["hits"] == 0
+    assert len(lru) == 0
+
+
+def test_lru_cache_invalid_arguments():
+    with pytest.raises(ValueError):
+        cache.LRUCache(maxsize=0)
+    with pytest.raises(ValueError):
+        cache.LRUCache(max_bytes=10)
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def session_cache_dir(tmp_path_factory):
+    """Keep the on-disk caches of module/session scoped fixtures out of the user's cache directory."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        path = tmp_path_factory.mktemp("cache")
+        monkeypatch.setenv("THALASSA_CACHE_DIR", str(path))
+        yield path
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Give each test an empty cache directory (formats, raster weights, meshes, ...)."""
+    monkeypatch.setenv("THALASSA_CACHE_DIR", str(tmp_path / "cache"))
+    yield tmp_path / "cache"
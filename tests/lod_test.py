@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import holoviews as hv
+import numpy as np
+import pytest
+
+import thalassa
+from . import DATA_DIR
+from thalassa import api
+from thalassa import lod
+from thalassa import utils
+
+
+SELAFIN = DATA_DIR / "iceland.slf"
+
+
+@pytest.fixture(scope="module")
+def grid():
+    # A regular 200x200 grid with a spacing of 1, split into triangles
+    size = 200
+    x, y = np.meshgrid(np.arange(size, dtype=float), np.arange(size, dtype=float))
+    nodes = np.arange(size * size).reshape(size, size)
+    a, b, c, d = (
+        nodes[:-1, :-1].ravel(),
+        nodes[:-1, 1:].ravel(),
+        nodes[1:, 1:].ravel(),
+        nodes[1:, :-1].ravel(),
+    )
+    triangles = np.concatenate([np.column_stack((a, b, c)), np.column_stack((a, c, d))])
+    return x.ravel(), y.ravel(), triangles
+
+
+def test_mesh_pyramid_levels(grid):
+    x, y, triangles = grid
+    pyramid = lod.MeshPyramid(x, y, triangles, min_resolution=16, max_resolution=128)
+    assert len(pyramid) == 5
+    sizes = [len(level.x) for level in pyramid.levels]
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[0] == len(x)
+    for level in pyramid.levels:
+        assert level.node_map.shape == x.shape
+        assert level.node_map.max() == len(level.x) - 1
+        assert level.triangles.max() < len(level.x)
+        # No degenerate triangles
+        a, b, c = level.triangles.T
+        assert ((a != b) & (b != c) & (a != c)).all()
+
+
+def test_mesh_level_restrict(grid):
+    x, y, triangles = grid
+    level = lod.MeshPyramid(x, y, triangles, min_resolution=16, max_resolution=16).levels[-1]
+    assert np.allclose(level.restrict(np.ones_like(x)), 1)
+    # The nodes are placed on the centroid of the merged nodes
+    assert np.allclose(level.restrict(x, how="mean"), level.x)
+    assert (level.restrict(x, how="max") >= level.x).all()
+    values = x.copy()
+    values[level.node_map == 0] = np.nan
+    assert np.isnan(level.restrict(values)[0])
+    with pytest.raises(ValueError) as exc:
+        level.restrict(x, how="median")
+    assert "Unknown restriction" in str(exc.value)
+
+
+def test_mesh_pyramid_select_level(grid):
+    x, y, triangles = grid
+    pyramid = lod.MeshPyramid(x, y, triangles, min_resolution=16, max_resolution=128)
+    # The pixels are smaller than the grid spacing: use the original mesh
+    assert pyramid.select_level(None, None, width=800, height=800) == 0
+    # A tiny canvas: use a coarse level whose cells are not larger than the pixels
+    level = pyramid.select_level(None, None, width=20, height=20)
+    assert level > 0
+    assert pyramid.levels[level].cell_size <= 199 / 20
+    # Zooming in needs a finer level
+    assert pyramid.select_level((0, 20), (0, 20), width=20, height=20) < level
+
+
+@pytest.fixture
+def slf_pyramid():
+    # The mesh is too coarse for the default pyramid, so use a pyramid with coarser levels
+    ds = api.open_dataset(SELAFIN).isel(time=0)
+    nodes = api._get_mesh_nodes(ds)
+    pyramid = lod.MeshPyramid(nodes.lon, nodes.lat, ds.triface_nodes.values, min_resolution=32)
+    lod._PYRAMID_CACHE.put(utils.get_mesh_hash(ds), pyramid)
+    yield ds, pyramid
+    lod._PYRAMID_CACHE.clear()
+
+
+def test_get_mesh_pyramid_is_cached():
+    ds = api.open_dataset(SELAFIN)
+    pyramid = lod.get_mesh_pyramid(ds)
+    assert lod.get_mesh_pyramid(ds[["lon", "lat", "triface_nodes"]]) is pyramid
+    # The default pyramid has no levels for small meshes
+    assert len(pyramid) == 1
+    lod._PYRAMID_CACHE.clear()
+
+
+def test_lod_dmap_follows_the_view(slf_pyramid):
+    ds, pyramid = slf_pyramid
+    assert len(pyramid) > 1
+    dmap = api._create_lod_dmap(ds, variable="S")
+    dmap.event(width=40, height=30)
+    coarse = dmap[()]
+    assert len(coarse.nodes) < len(ds.node)
+    assert np.allclose(coarse.nodes.data.S, pyramid.levels[-1].restrict(ds.S.values))
+    dmap.event(width=4000, height=3000)
+    assert len(dmap[()].nodes) == len(ds.node)
+
+
+def test_plot_lod(slf_pyramid):
+    ds, _ = slf_pyramid
+    dmap = thalassa.plot(ds, variable="S", lod=True, show_mesh=True, show_nodes=True)
+    hv.render(dmap, backend="bokeh")
+    with pytest.raises(ValueError) as exc:
+        thalassa.plot(api.open_dataset(SELAFIN), variable="S", lod=True, animate="time")
+    assert "lod" in str(exc.value)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import numpy as np
+import xarray as xr
+
+from . import create_schism_file
+from . import DATA_DIR
+from thalassa import api
+from thalassa import utils
+
+
+def _is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+def test_open_dataset_mesh_cache(tmp_path, cache_dir, monkeypatch):
+    path = create_schism_file(tmp_path / "cycle_00.nc", no_times=3)
+    expected = api.open_dataset(path)
+    first = api.open_dataset(path, mesh_cache=True)
+    xr.testing.assert_identical(first, expected)
+    entries = [entry for entry in cache_dir.joinpath("mesh").iterdir() if entry.name != "sources"]
+    assert len(entries) == 1
+    assert len(list(cache_dir.joinpath("mesh", "sources").iterdir())) == 1
+    # The connectivity of cached meshes is not processed again: Neither for the same file,
+    # nor for another file on the same mesh
+    monkeypatch.setattr(utils, "split_quads", None)
+    other = create_schism_file(tmp_path / "cycle_06.nc", no_times=5)
+    for reopened in (api.open_dataset(path, mesh_cache=True), api.open_dataset(other, mesh_cache=True)):
+        assert _is_memory_mapped(reopened.triface_nodes.data)
+        np.testing.assert_array_equal(reopened.triface_nodes, expected.triface_nodes)
+        np.testing.assert_array_equal(reopened.face_nodes, expected.face_nodes)
+        assert utils.get_mesh_hash(reopened) == utils.get_mesh_hash(expected)
+    assert len(list(cache_dir.joinpath("mesh", "sources").iterdir())) == 2
+
+
+def test_mesh_cache_different_mesh(tmp_path, cache_dir):
+    first = api.open_dataset(create_schism_file(tmp_path / "a.nc", no_times=3), mesh_cache=True)
+    second = api.open_dataset(
+        create_schism_file(tmp_path / "b.nc", no_times=3, lon_offset=1),
+        mesh_cache=True,
+    )
+    assert utils.get_mesh_hash(first) != utils.get_mesh_hash(second)
+    np.testing.assert_array_equal(second.lon, first.lon + 1)
+    nodes = api._get_mesh_nodes(second)
+    np.testing.assert_allclose(nodes.lon[0], api._get_transformer().transform(1, 0)[0])
+
+
+def test_mesh_cache_reordered_triangles(tmp_path, cache_dir):
+    # A mesh that is large enough to have "middle" triangles, i.e. neither at the start nor at the end
+    path = create_schism_file(tmp_path / "a.nc", no_times=3)
+    ds = xr.open_dataset(path, mask_and_scale=False)
+    face_nodes = np.tile(ds.SCHISM_hgrid_face_nodes.values[:2], (5000, 1))
+    ds = ds.isel(nSCHISM_hgrid_face=[0]).drop_vars("SCHISM_hgrid_face_nodes")
+    ds["SCHISM_hgrid_face_nodes"] = (("nSCHISM_hgrid_face", "nMaxSCHISM_hgrid_face_nodes"), face_nodes)
+    ds.SCHISM_hgrid_face_nodes.attrs["_FillValue"] = -1
+    ds.to_netcdf(tmp_path / "b.nc")
+    face_nodes[[4999, 5000]] = face_nodes[[5000, 4999]]
+    ds["SCHISM_hgrid_face_nodes"].values = face_nodes
+    ds.to_netcdf(tmp_path / "c.nc")
+    first = api.open_dataset(tmp_path / "b.nc", mesh_cache=True)
+    second = api.open_dataset(tmp_path / "c.nc", mesh_cache=True)
+    entries = [entry for entry in cache_dir.joinpath("mesh").iterdir() if entry.name != "sources"]
+    assert len(entries) == 2
+    np.testing.assert_array_equal(second.face_nodes[4999], first.face_nodes[5000])
+    np.testing.assert_array_equal(second.triface_nodes, api.open_dataset(tmp_path / "c.nc").triface_nodes)
+
+
+def test_mesh_cache_telemac():
+    expected = api.open_dataset(DATA_DIR / "iceland.slf")
+    api.open_dataset(DATA_DIR / "iceland.slf", mesh_cache=True)
+    cached = api.open_dataset(DATA_DIR / "iceland.slf", mesh_cache=True)
+    assert _is_memory_mapped(cached.triface_nodes.data)
+    xr.testing.assert_equal(cached, expected)
+
+
+def test_mesh_cache_invalid_entry(tmp_path, cache_dir):
+    path = create_schism_file(tmp_path / "cycle_00.nc", no_times=3)
+    api.open_dataset(path, mesh_cache=True)
+    (entry,) = [entry for entry in cache_dir.joinpath("mesh").iterdir() if entry.name != "sources"]
+    (entry / "triface_nodes.npy").write_bytes(b"garbage")
+    ds = api.open_dataset(path, mesh_cache=True)
+    assert ds.sizes["triface"] == 4
+    # The entry has been recreated
+    assert (entry / "triface_nodes.npy").stat().st_size > len(b"garbage")
+    assert _is_memory_mapped(api.open_dataset(path, mesh_cache=True).triface_nodes.data)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import numpy as np
 import pytest
 import xarray as xr
 
@@ -8,11 +9,20 @@ from thalassa import api
 from thalassa import normalization
 from thalassa.normalization import THALASSA_FORMATS
 
+
 @pytest.mark.parametrize(
     "ds,expected_fmt",
     [
-        pytest.param(api.open_dataset(DATA_DIR / "fort.63.nc", normalize=False), THALASSA_FORMATS.ADCIRC, id="ADCIRC"),
-        pytest.param(api.open_dataset(DATA_DIR / "iceland.slf", normalize=False), THALASSA_FORMATS.TELEMAC, id="TELEMAC"),
+        pytest.param(
+            api.open_dataset(DATA_DIR / "fort.63.nc", normalize=False),
+            THALASSA_FORMATS.ADCIRC,
+            id="ADCIRC",
+        ),
+        pytest.param(
+            api.open_dataset(DATA_DIR / "iceland.slf", normalize=False),
+            THALASSA_FORMATS.TELEMAC,
+            id="TELEMAC",
+        ),
         pytest.param(xr.Dataset(), THALASSA_FORMATS.UNKNOWN, id="Unknown"),
     ],
 )
@@ -32,3 +42,56 @@ def test_infer_format(ds, expected_fmt):
 def test_can_be_inferred(path, expected):
     result = normalization.can_be_inferred(path)
     assert result == expected
+
+
+def _create_generic(path, engine):
+    ds = xr.Dataset(
+        data_vars=dict(
+            triface_nodes=(("triface", "three"), np.array([[0, 1, 2]])),
+            depth=(("node",), np.ones(3)),
+        ),
+        coords=dict(lon=(("node",), np.arange(3.0)), lat=(("node",), np.arange(3.0))),
+    )
+    ds.to_netcdf(path, engine=engine)
+    return path
+
+
+@pytest.mark.parametrize("engine", ["netcdf4", "scipy"])
+def test_sniff_format_reads_the_header(cache_dir, tmp_path, engine):
+    path = _create_generic(tmp_path / "generic.nc", engine)
+    assert normalization._read_header(path) is not None
+    assert normalization.sniff_format(path) == THALASSA_FORMATS.GENERIC
+    header = normalization._read_header(DATA_DIR / "iceland.slf")
+    assert normalization.infer_format(header) == THALASSA_FORMATS.TELEMAC
+
+
+def test_sniff_format_cache(cache_dir, tmp_path, monkeypatch):
+    path = _create_generic(tmp_path / "generic.nc", "netcdf4")
+    unknown = tmp_path / "unknown.nc"
+    unknown.write_bytes(b"CDF\x01 but not really")
+    assert normalization.sniff_format(path) == THALASSA_FORMATS.GENERIC
+    assert normalization.can_be_inferred(unknown) is False
+    assert (cache_dir / "formats.json").exists()
+    # Cached results don't need to read the files
+    monkeypatch.setattr(normalization, "_read_header", None)
+    assert normalization.sniff_format(path) == THALASSA_FORMATS.GENERIC
+    assert normalization.can_be_inferred(unknown) is False
+    monkeypatch.undo()
+    # A modified file is sniffed again
+    monkeypatch.setenv("THALASSA_CACHE_DIR", str(cache_dir))
+    xr.Dataset().to_netcdf(path)
+    assert normalization.sniff_format(path) == THALASSA_FORMATS.UNKNOWN
+
+
+def test_normalize_is_lazy_and_idempotent():
+    raw = api.open_dataset(DATA_DIR / "iceland.slf", normalize=False)
+    ds = normalization.normalize(raw)
+    assert normalization.is_normalized(ds)
+    assert not normalization.is_normalized(raw)
+    # The connectivity is not computed until it is needed
+    assert ds.face_nodes.chunks is not None
+    assert ds.triface_nodes.chunks is not None
+    assert normalization.normalize(ds) is ds
+    assert normalization.load_mesh(ds) is ds
+    assert ds.triface_nodes.chunks is None
+    assert np.array_equal(ds.triface_nodes.values, raw.attrs["ikle2"] - 1)
@@ -25,6 +25,20 @@ def test_sanity_check_multiple_dimensions(fort_ds):
     assert "the only dimension of 'zeta' is `node`" in str(exc.value)
 
 
+def test_sanity_check_animate(fort_ds):
+    thalassa.plotting._sanity_check(ds=fort_ds, variable="zeta", animate="time")
+    with pytest.raises(ValueError) as exc:
+        thalassa.plotting._sanity_check(ds=fort_ds.isel(time=0), variable="zeta", animate="time")
+    assert "(time, node)" in str(exc.value)
+
+
+def test_plot_animate_time():
+    ds = thalassa.open_dataset(DATA_DIR / "iceland.slf")
+    dmap = thalassa.plot(ds=ds, variable="S", animate="time", show_mesh=True)
+    assert isinstance(dmap, hv.DynamicMap)
+    assert [kdim.name for kdim in dmap.kdims] == ["time"]
+
+
 def test_plot(fort_ds):
     dmap = thalassa.plot(ds=fort_ds.isel(time=0), variable="zeta")
     assert isinstance(dmap, hv.DynamicMap)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import datashader
+import numpy as np
+import pandas as pd
+import pytest
+
+from . import DATA_DIR
+from thalassa import api
+from thalassa import raster
+
+
+SELAFIN = DATA_DIR / "iceland.slf"
+
+
+@pytest.fixture(autouse=True)
+def clear_weights_cache():
+    raster._RASTER_WEIGHTS_CACHE.clear()
+
+
+@pytest.fixture(scope="module")
+def slf_ds():
+    ds = api.open_dataset(SELAFIN)
+    return ds.isel(time=0)
+
+
+def test_raster_weights_interpolate_linear_fields_exactly(slf_ds):
+    weights = raster.get_raster_weights(slf_ds, width=120, height=80)
+    nodes = api._get_mesh_nodes(slf_ds)
+    x = weights.render(nodes.lon.to_numpy())
+    assert x.dims == ("y", "x")
+    assert x.shape == (80, 120)
+    assert weights.covered.any()
+    covered = weights.covered.reshape(80, 120)
+    assert np.allclose(x.values[covered], np.broadcast_to(x.x.values, x.shape)[covered])
+    assert np.isnan(x.values[~covered]).all()
+
+
+def test_raster_weights_match_datashader(slf_ds):
+    extent = raster.get_mesh_extent(slf_ds)
+    image = raster.render(slf_ds, "S", width=200, height=150, extent=extent)
+    nodes = api._get_mesh_nodes(slf_ds, "S")
+    simplices = pd.DataFrame(slf_ds.triface_nodes.values, columns=["v0", "v1", "v2"])
+    canvas = datashader.Canvas(
+        plot_width=200,
+        plot_height=150,
+        x_range=(extent[0], extent[2]),
+        y_range=(extent[1], extent[3]),
+    )
+    expected = canvas.trimesh(nodes[["lon", "lat", "S"]], simplices, agg=datashader.mean("S"))
+    both = np.isfinite(image.values) & np.isfinite(expected.values)
+    # The pixels on the boundary of the mesh may differ, but the vast majority must match
+    assert both.sum() > 0.9 * np.isfinite(expected.values).sum()
+    assert np.allclose(image.values[both], expected.values[both], rtol=1e-3, atol=1e-3)
+
+
+def test_raster_weights_disk_cache(slf_ds, cache_dir):
+    weights = raster.get_raster_weights(slf_ds, width=50, height=40)
+    files = list((cache_dir / "raster").glob("*.npz"))
+    assert len(files) == 1
+    raster._RASTER_WEIGHTS_CACHE.clear()
+    loaded = raster.get_raster_weights(slf_ds, width=50, height=40)
+    assert loaded is not weights
+    assert loaded.extent == weights.extent
+    assert (loaded.matrix != weights.matrix).nnz == 0
+    # Other variables/timesteps of the same mesh reuse the in-memory weights
+    assert raster.get_raster_weights(slf_ds[["lon", "lat", "triface_nodes"]], width=50, height=40) is loaded
+
+
+def test_render_requires_node_variable(slf_ds):
+    with pytest.raises(ValueError) as exc:
+        raster.render(slf_ds.expand_dims("time"), "S", width=10, height=10)
+    assert "`node`" in str(exc.value)
+
+
+def test_get_raster_weights_backend(slf_ds):
+    dmap = api.get_raster(slf_ds, "S", backend="weights", width=100, height=80)
+    image = dmap[()]
+    assert image.data.S.shape == (80, 100)
+
+
+def test_get_raster_unknown_backend(slf_ds):
+    with pytest.raises(ValueError) as exc:
+        api.get_raster(slf_ds, "S", backend="matplotlib")
+    assert "datashader, weights" in str(exc.value)
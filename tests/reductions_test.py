@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import pathlib
+import shutil
+
+import holoviews as hv
+import numpy as np
+import pytest
+
+import thalassa
+from . import DATA_DIR
+from thalassa import reductions
+from thalassa import store
+
+
+SELAFIN = DATA_DIR / "iceland.slf"
+
+
+@pytest.fixture(scope="module")
+def slf_ds():
+    return thalassa.open_dataset(SELAFIN)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_reduce_matches_numpy(slf_ds, workers):
+    values = slf_ds.S.values.astype(np.float64)
+    # A tiny memory budget forces many chunks
+    reduced = thalassa.reduce(
+        slf_ds,
+        "S",
+        ops=["max", "min", "sum", "mean", "std", "count", "median", "p99"],
+        workers=workers,
+        max_memory=100_000,
+    )
+    assert np.allclose(reduced.S_max, values.max(axis=0))
+    assert np.allclose(reduced.S_min, values.min(axis=0))
+    assert np.allclose(reduced.S_sum, values.sum(axis=0))
+    assert np.allclose(reduced.S_mean, values.mean(axis=0))
+    assert np.allclose(reduced.S_std, values.std(axis=0))
+    assert np.array_equal(reduced.S_count, np.full(len(slf_ds.node), len(slf_ds.time)))
+    assert np.allclose(reduced.S_median, np.median(values, axis=0))
+    assert np.allclose(reduced.S_p99, np.percentile(values, 99, axis=0))
+    assert reduced.S_p99.attrs["thalassa_reduction"] == "p99"
+    assert "time" not in reduced.dims
+    assert reduced.S_max.dims == ("node",)
+    assert isinstance(thalassa.plot(reduced, "S_max"), hv.DynamicMap)
+
+
+def test_reduce_ignores_nan_and_slices_time(slf_ds):
+    ds = slf_ds.copy()
+    ds["S"] = ds.S.where(ds.S > ds.S.mean())
+    times = ds.time.values[2:5]
+    reduced = thalassa.reduce(ds, "S", ops=["max", "mean", "p50"], time_slice=slice(times[0], times[-1]))
+    expected = ds.S.sel(time=slice(times[0], times[-1]))
+    assert np.allclose(reduced.S_max, expected.max("time"), equal_nan=True)
+    assert np.allclose(reduced.S_mean, expected.mean("time"), equal_nan=True)
+    assert np.allclose(reduced.S_p50, expected.median("time"), equal_nan=True)
+
+
+def test_reduce_reads_percentiles_from_store(tmp_path):
+    path = tmp_path / "iceland.slf"
+    shutil.copy(SELAFIN, path)
+    ds = thalassa.open_dataset(path)
+    store.build_timeseries_store(ds, ["S"])
+    array = np.load(store.get_store_path(path) / "S.npy", mmap_mode="r+")
+    array[:] = 42
+    array.flush()
+    del array
+    reduced = thalassa.reduce(ds, "S", ops=["max", "p90"])
+    assert (reduced.S_p90 == 42).all()
+    assert not (reduced.S_max == 42).all()
+
+
+def test_reduce_reopens_the_source_per_worker(tmp_path, monkeypatch):
+    path = tmp_path / "iceland.slf"
+    shutil.copy(SELAFIN, path)
+    ds = thalassa.open_dataset(path)
+    opened = []
+    open_dataset = thalassa.api.open_dataset
+
+    def spy(*args, **kwargs):
+        opened.append(args)
+        return open_dataset(*args, **kwargs)
+
+    monkeypatch.setattr(thalassa.api, "open_dataset", spy)
+    reduced = thalassa.reduce(ds, "S", ops=["max"], workers=3, max_memory=100_000)
+    assert len(opened) == 3
+    assert np.allclose(reduced.S_max, ds.S.values.max(axis=0))
+
+
+def test_reduce_builds_a_temporary_store_for_percentiles(tmp_path, monkeypatch):
+    path = tmp_path / "iceland.slf"
+    shutil.copy(SELAFIN, path)
+    ds = thalassa.open_dataset(path)
+    paths = []
+    build = store.build_timeseries_store
+
+    def spy(*args, **kwargs):
+        paths.append(kwargs["path"])
+        return build(*args, **kwargs)
+
+    monkeypatch.setattr(store, "build_timeseries_store", spy)
+    reduced = thalassa.reduce(ds, "S", ops=["p90"], workers=2, max_memory=100_000)
+    assert len(paths) == 1
+    assert not pathlib.Path(paths[0]).exists()
+    assert not store.get_store_path(path).exists()
+    assert np.allclose(reduced.S_p90, np.percentile(ds.S.values, 90, axis=0))
+
+
+@pytest.mark.parametrize("ops", [["foo"], ["p101"], []])
+def test_reduce_invalid_ops(slf_ds, ops):
+    with pytest.raises(ValueError):
+        reductions.reduce(slf_ds, "S", ops=ops)
+
+
+def test_reduce_invalid_variable(slf_ds):
+    with pytest.raises(ValueError) as exc:
+        thalassa.reduce(slf_ds.isel(time=0), "S")
+    assert "(time, node)" in str(exc.value)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import thalassa
+from . import DATA_DIR
+from thalassa import render
+
+
+SELAFIN = DATA_DIR / "iceland.slf"
+
+
+@pytest.fixture(scope="module")
+def slf_ds():
+    return thalassa.open_dataset(SELAFIN)
+
+
+@pytest.mark.parametrize("engine", ["datashader", "weights"])
+def test_render_frames_in_process(slf_ds, tmp_path, engine):
+    times = slf_ds.time.values[:2]
+    timings = thalassa.render_frames(
+        slf_ds,
+        "S",
+        tmp_path / "frames",
+        times=times,
+        width=120,
+        height=90,
+        engine=engine,
+        processes=0,
+    )
+    assert list(timings.columns) == ["time", "path", "load", "render"]
+    assert len(timings) == 2
+    for path in timings.path:
+        assert path.exists()
+        with Image.open(path) as image:
+            assert image.size == (120, 90)
+            pixels = np.asarray(image)
+        # Some pixels are outside of the mesh, i.e. transparent
+        assert (pixels[..., 3] == 0).any()
+        assert (pixels[..., 3] > 0).any()
+
+
+def test_render_frames_bounds_the_pending_frames(slf_ds, tmp_path, monkeypatch):
+    counts = dict(submitted=0, rendered=0, max_pending=0)
+    get_frame_name = render._get_frame_name
+    render_frame = render._render_frame
+
+    def _get_frame_name(variable, timestamp):
+        counts["submitted"] += 1
+        counts["max_pending"] = max(counts["max_pending"], counts["submitted"] - counts["rendered"])
+        return get_frame_name(variable, timestamp)
+
+    def _render_frame(values, path):
+        time.sleep(0.05)
+        result = render_frame(values, path)
+        counts["rendered"] += 1
+        return result
+
+    monkeypatch.setattr(render, "_get_frame_name", _get_frame_name)
+    monkeypatch.setattr(render, "_render_frame", _render_frame)
+    render._WORKER["sentinel"] = True
+    try:
+        timings = thalassa.render_frames(slf_ds, "S", tmp_path, width=40, height=30, processes=0)
+        # The state of the current process is restored
+        assert render._WORKER == {"sentinel": True}
+    finally:
+        render._WORKER.clear()
+    assert len(timings) == counts["rendered"] == len(slf_ds.time)
+    # At most two frames per worker are in flight
+    assert counts["max_pending"] <= 2
+
+
+def test_render_frames_process_pool(slf_ds, tmp_path):
+    timings = thalassa.render_frames(slf_ds.isel(time=0), "S", tmp_path, width=60, height=40, processes=1)
+    assert len(timings) == 1
+    assert timings.path[0].name == "S.png"
+    assert timings.render[0] > 0
+
+
+def test_render_frames_invalid_variable(slf_ds, tmp_path):
+    with pytest.raises(ValueError) as exc:
+        thalassa.render_frames(slf_ds, "triface_nodes", tmp_path)
+    assert "can be rendered" in str(exc.value)
+
+
+def test_main(tmp_path):
+    render.main([str(SELAFIN), "S", str(tmp_path), "--width", "50", "--height", "40", "--processes", "0"])
+    assert len(list(tmp_path.glob("S_*.png"))) == len(thalassa.open_dataset(SELAFIN).time)
+
+
+def test_get_tile_extent():
+    bound = render._MERCATOR_BOUND
+    assert render.get_tile_extent(0, 0, 0) == (-bound, -bound, bound, bound)
+    assert render.get_tile_extent(1, 0, 0) == (-bound, 0, 0, bound)
+    assert render.get_tile_extent(1, 1, 1) == (0, -bound, bound, 0)
+
+
+def test_export_tiles(slf_ds, tmp_path):
+    ds = slf_ds.isel(time=slice(0, 2))
+    stats = render.export_tiles(ds, "S", tmp_path, min_zoom=2, max_zoom=6, processes=0)
+    assert list(stats.zoom.unique()) == [2, 3, 4, 5, 6]
+    assert (stats.existing == 0).all()
+    assert (stats.written > 0).all()
+    assert (stats.written <= stats.tiles).all()
+    # Iceland is tiny; the tiles outside of the mesh are skipped
+    assert stats.tiles.max() < 4**6 / 100
+    timestamps = sorted(path.name for path in tmp_path.iterdir())
+    assert len(timestamps) == 2
+    tiles = list((tmp_path / timestamps[0]).glob("*/*/*.png"))
+    assert len(tiles) == stats.written[stats.time == stats.time[0]].sum()
+    with Image.open(tiles[0]) as image:
+        assert image.size == (render.TILE_SIZE, render.TILE_SIZE)
+    # Re-running the export reuses the existing tiles
+    again = render.export_tiles(ds, "S", tmp_path, min_zoom=2, max_zoom=6, processes=0)
+    assert (again.written == 0).all()
+    assert again.existing.sum() == stats.written.sum()
+
+
+def test_export_tiles_builds_the_locator_once(slf_ds, tmp_path, monkeypatch):
+    built = []
+    init = render.spatial.TriangleLocator.__init__
+
+    def __init__(self, *args, **kwargs):
+        built.append(True)
+        init(self, *args, **kwargs)
+
+    monkeypatch.setattr(render.spatial.TriangleLocator, "__init__", __init__)
+    stats = render.export_tiles(slf_ds.isel(time=0), "S", tmp_path, min_zoom=4, max_zoom=6, processes=0)
+    assert stats.written.sum() > 0
+    assert len(built) == 1
+
+
+def test_interrupted_export_leaves_no_partial_tiles(slf_ds, tmp_path, monkeypatch):
+    def save(self, fp, *args, **kwargs):
+        with open(fp, "wb") as fd:
+            fd.write(b"truncated")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(Image.Image, "save", save)
+    with pytest.raises(KeyboardInterrupt):
+        render.export_tiles(slf_ds.isel(time=0), "S", tmp_path, min_zoom=4, max_zoom=4, processes=0)
+    monkeypatch.undo()
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
+    stats = render.export_tiles(slf_ds.isel(time=0), "S", tmp_path, min_zoom=4, max_zoom=4, processes=0)
+    assert (stats.existing == 0).all()
+    assert (stats.written > 0).all()
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import holoviews as hv
+import numpy as np
+import pytest
+
+import thalassa
+from . import DATA_DIR
+from thalassa import api
+from thalassa import spatial
+from thalassa import utils
+
+
+SELAFIN = DATA_DIR / "iceland.slf"
+
+
+@pytest.fixture(scope="module")
+def slf_ds():
+    ds = api.open_dataset(SELAFIN)
+    return ds
+
+
+def test_get_index_of_nearest_node_matches_brute_force(slf_ds):
+    lons = np.linspace(-25, -12, 7)
+    lats = np.linspace(57, 70, 7)
+    for lon, lat in zip(lons, lats):
+        expected = int((abs(slf_ds.lon - lon) ** 2 + abs(slf_ds.lat - lat) ** 2).argmin())
+        assert utils.get_index_of_nearest_node(slf_ds, lon, lat) == expected
+
+
+def test_get_node_index_is_cached_per_mesh(slf_ds):
+    index1 = spatial.get_node_index(slf_ds)
+    index2 = spatial.get_node_index(slf_ds[["lon", "lat", "S"]])
+    assert index1 is index2
+    assert len(index1) == len(slf_ds.node)
+    assert spatial.get_node_index(slf_ds, metric="haversine") is not index1
+
+
+def test_node_index_batched_query(slf_ds):
+    node_index = spatial.get_node_index(slf_ds)
+    lons = slf_ds.lon.values[:100]
+    lats = slf_ds.lat.values[:100]
+    distances, indices = node_index.query(lons, lats)
+    assert indices.shape == (100,)
+    assert np.allclose(distances, 0)
+    assert np.allclose(slf_ds.lon.values[indices], lons)
+
+
+def test_node_index_haversine_across_idl():
+    ds = utils.generate_thalassa_ds(
+        nodes=range(3),
+        triface_nodes=[[0, 1, 2]],
+        lons=[179.9, 170, -170],
+        lats=[0, 0, 0],
+    )
+    # On the plane, -179.9 is closer to -170 but on the sphere it is next to 179.9
+    assert utils.get_index_of_nearest_node(ds, -179.9, 0) == 2
+    assert utils.get_index_of_nearest_node(ds, -179.9, 0, metric="haversine") == 0
+    distances, _ = spatial.get_node_index(ds, metric="haversine").query(-179.9, 0)
+    assert distances == pytest.approx(0.2 * np.pi / 180 * spatial.EARTH_RADIUS)
+
+
+def test_node_index_unknown_metric():
+    with pytest.raises(ValueError) as exc:
+        spatial.NodeIndex([0], [0], metric="manhattan")
+    assert "Unknown metric" in str(exc.value)
+
+
+def test_extract_points(slf_ds):
+    lons = [-20, -19, -20]
+    lats = [65, 66, 65]
+    stations = thalassa.extract_points(slf_ds, lons, lats, variables=["S"], names=["a", "b", "c"])
+    assert dict(stations.sizes) == {"station": 3, "time": len(slf_ds.time)}
+    assert stations.S.dims == ("time", "station")
+    assert list(stations.location.values) == ["a", "b", "c"]
+    for i, (lon, lat) in enumerate(zip(lons, lats)):
+        node_index = utils.get_index_of_nearest_node(slf_ds, lon, lat)
+        assert stations.node[i] == node_index
+        assert np.array_equal(stations.S.isel(station=i), slf_ds.S.isel(node=node_index))
+    pins = api.get_station_pins(stations)
+    assert len(pins) == 3
+
+
+@pytest.mark.parametrize("method", ["nearest", "barycentric"])
+def test_extract_points_station_api(slf_ds, method):
+    stations = thalassa.extract_points(
+        slf_ds,
+        [-20, -19],
+        [65, 66],
+        variables=["S"],
+        names=["a", "b"],
+        method=method,
+    )
+    pins = api.get_station_pins(stations)
+    timeseries = api.get_station_timeseries(stations, pins)
+    table = api.get_station_table(stations, pins)
+    # Nothing is selected yet
+    assert len(timeseries[()].Curve.S) == 0
+    assert len(table[()]) == 0
+    timeseries.event(index=[1])
+    curve = timeseries[()].Curve.S
+    np.testing.assert_array_equal(curve.dimension_values("S"), stations.S.isel(station=1))
+    assert curve.opts.get().kwargs["title"] == "b"
+    table.event(index=[1])
+    rows = table[()].dframe().set_index("attribute").value
+    assert rows["location"] == "b"
+    assert rows["lon"] == -19
+    hv.render(timeseries, backend="bokeh")
+    hv.render(table, backend="bokeh")
+
+
+def test_extract_points_mismatched_input(slf_ds):
+    with pytest.raises(ValueError) as exc:
+        thalassa.extract_points(slf_ds, [1, 2], [1])
+    assert "same size" in str(exc.value)
+
+
+def test_triangle_locator_barycentric_weights():
+    # Two triangles forming the square [0, 2] x [0, 2]
+    locator = spatial.TriangleLocator(x=[0, 2, 2, 0], y=[0, 0, 2, 2], triangles=[[0, 1, 2], [0, 2, 3]])
+    triangles, weights = locator.locate([1.5, 0.5, 2, 3], [0.5, 1.5, 2, 3])
+    assert list(triangles) == [0, 1, 0, -1]
+    assert np.allclose(weights[0], [0.25, 0.5, 0.25])
+    assert np.allclose(weights[1], [0.25, 0.25, 0.5])
+    assert np.allclose(weights[2], [0, 0, 1])
+    assert np.isnan(weights[3]).all()
+    assert list(locator.contains([1, 5], [1, 5])) == [True, False]
+
+
+def test_triangle_locator_interpolates_coordinates(slf_ds):
+    locator = spatial.get_triangle_locator(slf_ds)
+    assert spatial.get_triangle_locator(slf_ds) is locator
+    rng = np.random.default_rng(42)
+    xs = rng.uniform(slf_ds.lon.min(), slf_ds.lon.max(), 1000)
+    ys = rng.uniform(slf_ds.lat.min(), slf_ds.lat.max(), 1000)
+    triangles, weights = locator.locate(xs, ys)
+    inside = triangles >= 0
+    assert inside.any()
+    nodes = slf_ds.triface_nodes.values[triangles[inside]]
+    assert np.allclose((slf_ds.lon.values[nodes] * weights[inside]).sum(axis=1), xs[inside])
+    assert np.allclose((slf_ds.lat.values[nodes] * weights[inside]).sum(axis=1), ys[inside])
+
+
+def test_extract_points_barycentric(slf_ds):
+    lon, lat = float(slf_ds.lon[5]), float(slf_ds.lat[5])
+    stations = thalassa.extract_points(slf_ds, [lon, 0], [lat, 0], variables=["S"], method="barycentric")
+    assert stations.S.dims == ("time", "station")
+    assert stations.weight.dims == ("station", "three")
+    assert np.allclose(stations.S.isel(station=0), slf_ds.S.isel(node=5))
+    assert stations.triface[1] == -1
+    assert stations.S.isel(station=1).isnull().all()
+
+
+def test_triangle_locator_save_load(slf_ds, tmp_path):
+    locator = spatial.get_triangle_locator(slf_ds)
+    locator.save(tmp_path / "locator")
+    loaded = spatial.TriangleLocator.load(tmp_path / "locator")
+    assert isinstance(loaded.indices, np.memmap)
+    assert (loaded.nx, loaded.ny, loaded.dx, loaded.dy) == (locator.nx, locator.ny, locator.dx, locator.dy)
+    xs, ys = slf_ds.lon.values[:100] + 0.001, slf_ds.lat.values[:100]
+    for expected, actual in zip(locator.locate(xs, ys), loaded.locate(xs, ys)):
+        assert np.array_equal(expected, actual, equal_nan=True)
+    assert np.array_equal(loaded.query_bbox(-22, 63, -20, 64.5), locator.query_bbox(-22, 63, -20, 64.5))
+
+
+def test_triangle_locator_query_bbox(slf_ds):
+    locator = spatial.get_triangle_locator(slf_ds)
+    bbox = (-22, 63, -20, 64.5)
+    x = slf_ds.lon.values[slf_ds.triface_nodes.values]
+    y = slf_ds.lat.values[slf_ds.triface_nodes.values]
+    expected = np.flatnonzero(
+        (x.max(axis=1) >= bbox[0])
+        & (x.min(axis=1) <= bbox[2])
+        & (y.max(axis=1) >= bbox[1])
+        & (y.min(axis=1) <= bbox[3]),
+    )
+    assert len(expected) > 0
+    assert np.array_equal(locator.query_bbox(*bbox), expected)
+    assert len(locator.query_bbox(100, 0, 101, 1)) == 0
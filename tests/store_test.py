@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import thalassa
+from . import create_schism_file
+from . import DATA_DIR
+from thalassa import store
+
+
+@pytest.fixture
+def slf_path(tmp_path):
+    path = tmp_path / "iceland.slf"
+    shutil.copy(DATA_DIR / "iceland.slf", path)
+    return path
+
+
+def test_build_timeseries_store(slf_path):
+    ds = thalassa.open_dataset(slf_path)
+    path = store.build_timeseries_store(ds, ["S"], max_memory=1)
+    assert path == store.get_store_path(slf_path)
+    indices = np.array([0, 10, 3000])
+    values = store.read_nodes(ds, "S", indices)
+    assert values.shape == (3, len(ds.time))
+    assert np.array_equal(values, ds.S.isel(node=indices).values.T)
+
+
+def test_build_timeseries_store_in_background(slf_path):
+    ds = thalassa.open_dataset(slf_path)
+    future = store.build_timeseries_store_in_background(ds, ["S"])
+    assert future.result() == store.get_store_path(slf_path)
+    assert store.read_nodes(ds, "S", np.array([1])) is not None
+
+
+def test_read_nodes_without_store(slf_path):
+    ds = thalassa.open_dataset(slf_path)
+    assert store.read_nodes(ds, "S", np.array([1])) is None
+
+
+def test_read_nodes_ignores_store_of_different_nodes(slf_path):
+    ds = thalassa.open_dataset(slf_path)
+    store.build_timeseries_store(ds, ["S"])
+    cropped = ds.isel(node=slice(0, 100))
+    assert store.read_nodes(cropped, "S", np.array([1])) is None
+    assert store.read_nodes(ds.isel(time=slice(0, 2)), "S", np.array([1])) is None
+
+
+def test_rebuilding_a_variable_does_not_revalidate_the_others(tmp_path):
+    # A file with two variables
+    raw = xr.load_dataset(create_schism_file(tmp_path / "raw.nc", no_times=3))
+    path = tmp_path / "out2d_1.nc"
+    raw.assign(elev2=raw.elev * 2).to_netcdf(path)
+    ds = thalassa.open_dataset(path)
+    store.build_timeseries_store(ds, ["elev", "elev2"])
+    assert store.read_nodes(ds, "elev", np.array([1])) is not None
+    # Modify the source file
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert store.read_nodes(ds, "elev", np.array([1])) is None
+    store.build_timeseries_store(ds, ["elev2"])
+    assert store.read_nodes(ds, "elev2", np.array([1])) is not None
+    assert store.read_nodes(ds, "elev", np.array([1])) is None
+
+
+def test_interrupted_build_leaves_no_valid_variable(slf_path, monkeypatch):
+    ds = thalassa.open_dataset(slf_path)
+    store.build_timeseries_store(ds, ["S"])
+
+    def replace(src, dst):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(store.os, "replace", replace)
+    with pytest.raises(KeyboardInterrupt):
+        store.build_timeseries_store(ds, ["S"])
+    monkeypatch.undo()
+    assert store.read_nodes(ds, "S", np.array([1])) is None
+
+
+def test_extract_points_reads_from_store(slf_path):
+    ds = thalassa.open_dataset(slf_path)
+    expected = thalassa.extract_points(ds, [-21.6], [62.6], variables=["S"])
+    store.build_timeseries_store(ds, ["S"])
+    # Tamper with the store, in order to make sure that the data are read from it
+    array = np.load(store.get_store_path(slf_path) / "S.npy", mmap_mode="r+")
+    array[:] = 42
+    array.flush()
+    del array
+    stations = thalassa.extract_points(ds, [-21.6], [62.6], variables=["S"])
+    assert (stations.S == 42).all()
+    assert not expected.S.equals(stations.S)
+
+
+@pytest.mark.parametrize("chunks", [None, {}])
+def test_store_is_not_used_for_modified_variables(slf_path, chunks):
+    ds = thalassa.open_dataset(slf_path, chunks=chunks)
+    store.build_timeseries_store(ds, ["S"])
+    assert store.read_nodes(ds, "S", np.array([1])) is not None
+    modified = ds.assign(S=ds.S * 2)
+    assert store.read_nodes(modified, "S", np.array([1])) is None
+    stations = thalassa.extract_points(modified, [-21.6], [62.6], variables=["S"])
+    expected = thalassa.extract_points(ds, [-21.6], [62.6], variables=["S"])
+    np.testing.assert_allclose(stations.S, expected.S * 2)
+    reduced = thalassa.reduce(modified, "S", ops=["p90"], max_memory=100_000)
+    np.testing.assert_allclose(reduced.S_p90, np.percentile(ds.S.values * 2, 90, axis=0))
+    with pytest.raises(ValueError) as exc:
+        store.build_timeseries_store(modified, ["S"])
+    assert "modified in memory" in str(exc.value)
+
+
+def test_build_timeseries_store_invalid_variable(slf_path):
+    ds = thalassa.open_dataset(slf_path)
+    with pytest.raises(ValueError) as exc:
+        store.build_timeseries_store(ds, ["lon"])
+    assert "(time, node)" in str(exc.value)
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import pickle
+
+import numpy as np
+import pytest
+
+import thalassa
+from thalassa import topology
+from thalassa import utils
+
+
+@pytest.fixture
+def ds():
+    # A 2x2 square of nodes split into two triangles, plus a triangle attached to the right edge
+    return utils.generate_thalassa_ds(
+        nodes=range(5),
+        triface_nodes=[[0, 1, 2], [1, 3, 2], [1, 4, 3]],
+        lons=[0, 1, 0, 1, 2],
+        lats=[0, 0, 1, 1, 0.5],
+    )
+
+
+def test_mesh_topology(ds):
+    mesh = topology.get_mesh_topology(ds)
+    assert isinstance(mesh, thalassa.MeshTopology)
+    assert (mesh.no_nodes, mesh.no_faces) == (5, 3)
+    assert mesh.edges.tolist() == [[0, 1], [0, 2], [1, 2], [1, 3], [1, 4], [2, 3], [3, 4]]
+    assert [mesh.get_edge_faces(edge).tolist() for edge in range(len(mesh.edges))] == [
+        [0],
+        [0],
+        [0, 1],
+        [1, 2],
+        [2],
+        [1],
+        [2],
+    ]
+    assert mesh.boundary_edges.tolist() == [[0, 1], [0, 2], [1, 4], [2, 3], [3, 4]]
+    node_faces = [mesh.get_node_faces(node).tolist() for node in range(5)]
+    assert node_faces == [[0], [0, 1, 2], [0, 1], [1, 2], [2]]
+    assert [mesh.get_node_neighbours(node).tolist() for node in range(5)] == [
+        [1, 2],
+        [0, 2, 3, 4],
+        [0, 1, 3],
+        [1, 2, 4],
+        [1, 3],
+    ]
+    for name in topology._STRUCTURES:
+        assert getattr(mesh, name).dtype == np.int32
+    # The topology is cached per mesh
+    assert topology.get_mesh_topology(ds.copy()) is mesh
+
+
+def test_mesh_topology_is_lazy(ds):
+    mesh = topology.MeshTopology(ds.triface_nodes.values)
+    assert mesh._edges is None and mesh._node_faces is None
+    nbytes = mesh.nbytes
+    mesh.boundary_edges
+    assert mesh._edges is not None and mesh._node_faces is None
+    assert mesh.nbytes > nbytes
+    assert not hasattr(mesh, "__dict__")
+
+
+def test_mesh_topology_serialization(ds, tmp_path):
+    mesh = topology.MeshTopology(ds.triface_nodes.values, no_nodes=6)
+    mesh.save(tmp_path / "topology.npz")
+    loaded = topology.MeshTopology.load(tmp_path / "topology.npz")
+    unpickled = pickle.loads(pickle.dumps(mesh))
+    for other in (loaded, unpickled):
+        assert other.no_nodes == 6
+        for name in ("triangles", *topology._STRUCTURES):
+            np.testing.assert_array_equal(getattr(other, name), getattr(mesh, name))
+    # The isolated node has neither faces nor neighbours
+    assert loaded.get_node_faces(5).size == loaded.get_node_neighbours(5).size == 0
+
+
+def test_mesh_topology_invalid():
+    with pytest.raises(ValueError) as exc:
+        topology.MeshTopology(np.zeros((3, 4), dtype=int))
+    assert "connectivity" in str(exc.value)
+    # Node indices out of bounds would crash the kernels
+    with pytest.raises(ValueError) as exc:
+        topology.MeshTopology(np.array([[0, 1, 5]]), no_nodes=3)
+    assert "Invalid node indices" in str(exc.value)
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
+import dask.array as da
 import numpy as np
 import pandas as pd
 import pytest
 import shapely
 import xarray as xr
 
+from . import create_schism_file
 from . import DATA_DIR
 from thalassa import api
 from thalassa import utils
@@ -22,6 +24,66 @@ def test_crop():
     assert len(cropped_ds.node) == 1363
 
 
+def _create_grid_ds(size=20):
+    """A `size x size` grid of nodes, two triangles per cell."""
+    lons, lats = np.meshgrid(np.arange(float(size)), np.arange(float(size)))
+    cells = np.arange(size * size).reshape(size, size)[:-1, :-1].ravel()
+    lower = np.c_[cells, cells + 1, cells + size]
+    upper = np.c_[cells + 1, cells + size + 1, cells + size]
+    return utils.generate_thalassa_ds(
+        nodes=range(size * size),
+        triface_nodes=np.r_[lower, upper],
+        lons=lons.ravel().tolist(),
+        lats=lats.ravel().tolist(),
+        time_range=pd.date_range("2001-01-01", periods=3),
+        elevation=(("time", "node"), da.random.random((3, size * size), chunks=(1, 100))),
+    )
+
+
+def _crop_brute_force(ds, geometry):
+    lons, lats = ds.lon.values, ds.lat.values
+    nodes = np.flatnonzero(shapely.intersects_xy(geometry, lons, lats))
+    triface_nodes = ds.triface_nodes.values
+    return nodes, triface_nodes[np.isin(triface_nodes, nodes).all(axis=1)]
+
+
+def test_crop_is_lazy():
+    ds = _create_grid_ds()
+    cropped = utils.crop(ds, bbox=shapely.box(2.5, 3, 7, 9.5))
+    assert isinstance(cropped.elevation.data, da.Array)
+    nodes, triface_nodes = _crop_brute_force(ds, shapely.box(2.5, 3, 7, 9.5))
+    assert np.array_equal(cropped.node, nodes)
+    assert np.array_equal(nodes[cropped.triface_nodes.values], triface_nodes)
+    assert np.array_equal(cropped.elevation.values, ds.elevation.values[:, nodes])
+    assert len(cropped.triface) == 2 * 4 * 6
+
+
+def test_crop_polygon():
+    ds = _create_grid_ds()
+    polygon = shapely.Polygon([(0, 0), (12, 0), (0, 12)])
+    cropped = utils.crop(ds, bbox=polygon)
+    nodes, triface_nodes = _crop_brute_force(ds, polygon)
+    # The nodes on the diagonal are kept
+    assert len(nodes) == 13 * 14 // 2
+    assert np.array_equal(cropped.node, nodes)
+    assert np.array_equal(nodes[cropped.triface_nodes.values], triface_nodes)
+    assert len(cropped.triface) == 12 * 12
+
+
+def test_crop_regions():
+    ds = _create_grid_ds()
+    # More than 64 (overlapping) regions, so that the bitsets need more than one word
+    regions = {f"box_{i}": shapely.box(i % 15, i // 15, i % 15 + 4, i // 15 + 3) for i in range(70)}
+    regions["polygon"] = shapely.Polygon([(0, 0), (12, 0), (0, 12)])
+    regions["empty"] = (100, 100, 101, 101)
+    subsets = utils.crop_regions(ds, regions)
+    assert list(subsets) == list(regions)
+    for name, region in regions.items():
+        xr.testing.assert_identical(subsets[name], utils.crop(ds, region))
+    assert subsets["empty"].sizes["node"] == 0
+    assert subsets["box_0"].sizes["triface"] == 2 * 4 * 3
+
+
 def test_generate_thalassa_ds():
     ds = utils.generate_thalassa_ds(
         nodes=range(3),
@@ -132,6 +194,34 @@ def test_drop_elements_crossing_idl_no_elements_crossing_no_elements_dropped():
     assert orig_ds.equals(ds)
 
 
+def test_drop_elements_crossing_idl_wrap():
+    orig_ds = utils.generate_thalassa_ds(
+        nodes=range(4),
+        triface_nodes=[[0, 1, 2], [1, 2, 3]],
+        lons=[-178, -179, -179, 179],
+        lats=[11, 10, 12, 11],
+        depth=(("node"), [1, 2, 3, 4]),
+    )
+    ds = utils.drop_elements_crossing_idl(orig_ds, wrap=True)
+    # The western nodes of the crossing element are duplicated at +360 and the eastern ones at -360
+    assert np.array_equal(ds.lon, [-178, -179, -179, 179, 181, 181, -181])
+    assert np.array_equal(ds.depth, [1, 2, 3, 4, 2, 3, 4])
+    assert np.array_equal(ds.triface_nodes, [[0, 1, 2], [4, 5, 3], [1, 2, 6]])
+
+
+@pytest.mark.parametrize("lons", [[-5, -5, 175], [-175, -175, 5]])
+def test_drop_elements_crossing_idl_wrap_too_wide(lons):
+    orig_ds = utils.generate_thalassa_ds(
+        nodes=range(3),
+        triface_nodes=[[0, 1, 2]],
+        lons=lons,
+        lats=[10, 12, 11],
+    )
+    ds = utils.drop_elements_crossing_idl(orig_ds, wrap=True)
+    assert ds.sizes["node"] == 3
+    assert ds.triface_nodes.shape == (0, 3)
+
+
 def test_generate_mesh_polygon():
     ds = utils.generate_thalassa_ds(
         nodes=range(4),
@@ -141,3 +231,160 @@ def test_generate_mesh_polygon():
     )
     gdf = utils.generate_mesh_polygon(ds)
     assert gdf.geometry[0].area == 4
+
+
+def test_get_mesh_outline():
+    ds = _create_grid_ds()
+    # Drop the triangles of a ring of cells and of a column of cells,
+    # so that the mesh has two parts and one of them has a hole with an island
+    centers_x = ds.lon.values[ds.triface_nodes.values].mean(axis=1)
+    centers_y = ds.lat.values[ds.triface_nodes.values].mean(axis=1)
+    in_hole = (np.abs(centers_x - 5) < 3) & (np.abs(centers_y - 5) < 3)
+    in_island = (np.abs(centers_x - 5) < 1) & (np.abs(centers_y - 5) < 1)
+    in_gap = (centers_x > 12) & (centers_x < 14)
+    ds = ds.isel(triface=np.flatnonzero(~(in_hole & ~in_island) & ~in_gap))
+    outline = utils.get_mesh_outline(ds)
+    triangles = shapely.polygons(np.stack((ds.lon.values, ds.lat.values), axis=-1)[ds.triface_nodes.values])
+    expected = shapely.coverage_union_all(triangles)
+    assert outline.area == expected.area == 19 * 19 - 6 * 6 + 2 * 2 - 2 * 19
+    assert shapely.equals(outline, expected)
+    # The outline is cached per mesh
+    assert utils.get_mesh_outline(ds.copy()) is outline
+
+
+def test_get_mesh_outline_pinched():
+    # Two triangles which share a single node
+    ds = utils.generate_thalassa_ds(
+        nodes=range(5),
+        triface_nodes=[[0, 1, 2], [2, 3, 4]],
+        lons=[0, 1, 1, 2, 2],
+        lats=[0, 0, 1, 1, 2],
+    )
+    outline = utils.get_mesh_outline(ds)
+    assert outline.is_valid
+    assert len(outline.geoms) == 2
+    assert outline.area == 1
+
+
+def test_get_mesh_hash_is_memoized_for_derived_datasets(monkeypatch):
+    ds = _create_grid_ds()
+    digest = utils.get_mesh_hash(ds)
+
+    def sha1(*args, **kwargs):
+        raise AssertionError("The mesh was hashed again")
+
+    with monkeypatch.context() as m:
+        m.setattr(utils.hashlib, "sha1", sha1)
+        assert utils.get_mesh_hash(ds.isel(time=1)) == digest
+        assert utils.get_mesh_hash(ds[["lon", "lat", "triface_nodes"]]) == digest
+    # Datasets with a different mesh get a different hash
+    assert utils.get_mesh_hash(ds.isel(triface=slice(1, None))) != digest
+    assert utils.get_mesh_hash(ds.assign(lon=ds.lon + 1)) != digest
+
+
+def test_is_point_in_the_mesh():
+    ds = utils.generate_thalassa_ds(
+        nodes=range(4),
+        triface_nodes=[[0, 1, 2], [1, 2, 3]],
+        lons=[10, 10, 12, 12],
+        lats=[20, 22, 20, 22],
+    )
+    assert utils.is_point_in_the_mesh(ds, 11, 21)
+    assert utils.is_point_in_the_mesh(ds, 10, 20)
+    assert not utils.is_point_in_the_mesh(ds, 13, 21)
+
+
+def test_is_point_in_the_mesh_global_mesh():
+    # The elements cross the IDL, so in lon/lat they span [-170, 170]
+    ds = utils.generate_thalassa_ds(
+        nodes=range(4),
+        triface_nodes=[[0, 1, 2], [1, 3, 2]],
+        lons=[170, -170, 170, -170],
+        lats=[0, 0, 10, 10],
+    )
+    assert utils.is_point_in_the_mesh(ds, 175, 5)
+    assert utils.is_point_in_the_mesh(ds, -175, 5)
+    assert not utils.is_point_in_the_mesh(ds, 0, 5)
+    assert not utils.is_point_in_the_mesh(ds, 175, 15)
+
+
+def test_split_quads():
+    face_nodes = np.array([[0, 1, 2, np.nan], [1, 3, 4, 2], [3, 5, 4, np.nan]])
+    expected = np.array([[0, 1, 2], [1, 3, 4], [3, 5, 4], [1, 4, 2]])
+    assert np.array_equal(utils.split_quads(face_nodes), expected)
+    # dask arrays stay lazy
+    lazy = utils.split_quads(da.from_array(face_nodes, chunks=2))
+    assert isinstance(lazy, da.Array)
+    assert np.array_equal(lazy.compute(), expected)
+
+
+@pytest.mark.parametrize(
+    "fill_value,missing",
+    [
+        pytest.param(None, np.nan, id="nan"),
+        pytest.param(None, -1, id="negative"),
+        pytest.param(999999, 999999, id="fill_value"),
+    ],
+)
+def test_triangulate(fill_value, missing):
+    face_nodes = np.array(
+        [
+            [0, 1, 2, missing, missing],
+            [1, 3, 4, 2, missing],
+            [0, 5, 6, 7, 8],
+        ],
+    )
+    if not np.isnan(missing):
+        face_nodes = face_nodes.astype(np.int64)
+    expected = np.array([[0, 1, 2], [1, 3, 4], [0, 5, 6], [1, 4, 2], [0, 6, 7], [0, 7, 8]])
+    triangles = utils.triangulate(face_nodes, fill_value=fill_value)
+    assert triangles.dtype == np.int32
+    assert np.array_equal(triangles, expected)
+    lazy = utils.triangulate(da.from_array(face_nodes, chunks=(2, 2)), fill_value=fill_value)
+    assert isinstance(lazy, da.Array)
+    assert np.array_equal(lazy.compute(), expected)
+
+
+def test_triangulate_reads_dask_faces_once():
+    face_nodes = np.array([[0, 1, 2, -1], [1, 3, 4, 2]] * 4)
+    reads = []
+
+    def read(block):
+        reads.append(block.shape)
+        return block
+
+    lazy = da.from_array(face_nodes, chunks=(2, 4)).map_blocks(read, meta=face_nodes[:0])
+    triangles = utils.triangulate(lazy)
+    assert len(reads) == 4
+    np.testing.assert_array_equal(triangles.compute(), utils.triangulate(face_nodes))
+    assert len(reads) == 4
+
+
+def test_get_triangles_loads_the_connectivity_once(tmp_path):
+    # Triangle-only meshes whose connectivity is in memory are not deferred at all
+    assert api.open_dataset(DATA_DIR / "iceland.slf").triface_nodes.chunks is None
+    ds = api.open_dataset(create_schism_file(tmp_path / "out2d_1.nc", no_times=2))
+    derived = ds.isel(time=0)
+    assert derived.triface_nodes.chunks is not None
+    api.create_trimesh(derived, "elev")
+    # The connectivity has been loaded in place, i.e. for all the datasets which share it
+    assert derived.triface_nodes.chunks is None
+    assert ds.triface_nodes.chunks is None
+    np.testing.assert_array_equal(utils.get_triangles(ds), [[0, 1, 2], [1, 3, 2], [1, 4, 5], [1, 5, 3]])
+
+
+def test_triangulate_checks_the_node_indices():
+    face_nodes = np.array([[0, 1, 2, 999999], [1, 3, 4, 2]])
+    with pytest.raises(ValueError) as exc:
+        utils.triangulate(face_nodes, no_nodes=5)
+    assert "refer to node 999999" in str(exc.value)
+    lazy = utils.triangulate(da.from_array(face_nodes, chunks=(1, 4)), no_nodes=5)
+    with pytest.raises(ValueError):
+        lazy.compute()
+    assert utils.triangulate(face_nodes, fill_value=999999, no_nodes=5).max() == 4
+
+
+def test_triangulate_invalid_face():
+    with pytest.raises(ValueError) as exc:
+        utils.triangulate(np.array([[0, 1, -1, -1]]))
+    assert "less than 3 vertices" in str(exc.value)
@@ -7,23 +7,35 @@ from __future__ import annotations
 import importlib.metadata
 
 from .api import open_dataset
+from .api import open_mfdataset
 from .normalization import normalize
 from .plotting import plot
 from .plotting import plot_mesh
 from .plotting import plot_nodes
 from .plotting import plot_ts
+from .reductions import reduce
+from .render import render_frames
+from .spatial import extract_points
+from .topology import MeshTopology
 from .utils import crop
+from .utils import crop_regions
 
 
 __version__ = importlib.metadata.version("thalassa")
 
 __all__: list[str] = [
     "__version__",
+    "MeshTopology",
     "crop",
+    "crop_regions",
+    "extract_points",
     "normalize",
     "open_dataset",
+    "open_mfdataset",
     "plot",
     "plot_nodes",
     "plot_mesh",
     "plot_ts",
+    "reduce",
+    "render_frames",
 ]
@@ -0,0 +1,499 @@
+# Numba kernels
+#
+# This module imports `numba` at the top level, which is slow. Therefore it should only be imported lazily,
+# i.e. inside the functions that need it.
+from __future__ import annotations
+
+import typing as T
+
+import numba
+import numpy as np
+import numpy.typing as npt
+
+Array = npt.NDArray[T.Any]
+
+
+@numba.njit(cache=True)
+def _bin_range(
+    xmin: float,
+    xmax: float,
+    ymin: float,
+    ymax: float,
+    x0: float,
+    y0: float,
+    dx: float,
+    dy: float,
+    nx: int,
+    ny: int,
+) -> tuple[int, int, int, int]:
+    i0 = min(max(int((xmin - x0) / dx), 0), nx - 1)
+    i1 = min(max(int((xmax - x0) / dx), 0), nx - 1)
+    j0 = min(max(int((ymin - y0) / dy), 0), ny - 1)
+    j1 = min(max(int((ymax - y0) / dy), 0), ny - 1)
+    return i0, i1, j0, j1
+
+
+@numba.njit(cache=True)
+def bin_triangles(
+    x: Array,
+    y: Array,
+    triangles: Array,
+    x0: float,
+    y0: float,
+    dx: float,
+    dy: float,
+    nx: int,
+    ny: int,
+) -> tuple[Array, Array]:
+    """
+    Assign each triangle to all the bins its bounding box overlaps.
+
+    Return a CSR structure, i.e. ``offsets`` and ``indices``: the triangles of bin ``b`` are
+    ``indices[offsets[b]:offsets[b + 1]]``. Bins are numbered row-major, i.e. ``b = j * nx + i``.
+    """
+    ntri = triangles.shape[0]
+    counts = np.zeros(nx * ny + 1, dtype=np.int64)
+    for t in range(ntri):
+        a, b, c = triangles[t, 0], triangles[t, 1], triangles[t, 2]
+        xmin = min(x[a], x[b], x[c])
+        xmax = max(x[a], x[b], x[c])
+        ymin = min(y[a], y[b], y[c])
+        ymax = max(y[a], y[b], y[c])
+        i0, i1, j0, j1 = _bin_range(xmin, xmax, ymin, ymax, x0, y0, dx, dy, nx, ny)
+        for j in range(j0, j1 + 1):
+            for i in range(i0, i1 + 1):
+                counts[j * nx + i + 1] += 1
+    offsets = np.cumsum(counts)
+    indices = np.empty(offsets[-1], dtype=np.int64)
+    cursor = offsets[:-1].copy()
+    for t in range(ntri):
+        a, b, c = triangles[t, 0], triangles[t, 1], triangles[t, 2]
+        xmin = min(x[a], x[b], x[c])
+        xmax = max(x[a], x[b], x[c])
+        ymin = min(y[a], y[b], y[c])
+        ymax = max(y[a], y[b], y[c])
+        i0, i1, j0, j1 = _bin_range(xmin, xmax, ymin, ymax, x0, y0, dx, dy, nx, ny)
+        for j in range(j0, j1 + 1):
+            for i in range(i0, i1 + 1):
+                indices[cursor[j * nx + i]] = t
+                cursor[j * nx + i] += 1
+    return offsets, indices
+
+
+@numba.njit(cache=True, parallel=True)
+def locate_points(
+    px: Array,
+    py: Array,
+    x: Array,
+    y: Array,
+    triangles: Array,
+    offsets: Array,
+    indices: Array,
+    x0: float,
+    y0: float,
+    dx: float,
+    dy: float,
+    nx: int,
+    ny: int,
+    eps: float,
+) -> tuple[Array, Array]:
+    """
+    Return the index of the triangle containing each point and the barycentric weights of the point.
+
+    Points which are not contained in any triangle get ``-1`` as index and ``nan`` weights.
+    """
+    npoints = px.shape[0]
+    found = np.full(npoints, -1, dtype=np.int64)
+    weights = np.full((npoints, 3), np.nan, dtype=np.float64)
+    for p in numba.prange(npoints):
+        xp = px[p]
+        yp = py[p]
+        i = int(np.floor((xp - x0) / dx))
+        j = int(np.floor((yp - y0) / dy))
+        # Points exactly on the max edge of the grid belong to the last bin
+        if i == nx and xp <= x0 + nx * dx:
+            i = nx - 1
+        if j == ny and yp <= y0 + ny * dy:
+            j = ny - 1
+        if i < 0 or i >= nx or j < 0 or j >= ny:
+            continue
+        b = j * nx + i
+        for k in range(offsets[b], offsets[b + 1]):
+            t = indices[k]
+            n0, n1, n2 = triangles[t, 0], triangles[t, 1], triangles[t, 2]
+            x0_, y0_ = x[n0], y[n0]
+            x1_, y1_ = x[n1], y[n1]
+            x2_, y2_ = x[n2], y[n2]
+            det = (y1_ - y2_) * (x0_ - x2_) + (x2_ - x1_) * (y0_ - y2_)
+            if det == 0:
+                continue
+            l0 = ((y1_ - y2_) * (xp - x2_) + (x2_ - x1_) * (yp - y2_)) / det
+            l1 = ((y2_ - y0_) * (xp - x2_) + (x0_ - x2_) * (yp - y2_)) / det
+            l2 = 1.0 - l0 - l1
+            if l0 >= -eps and l1 >= -eps and l2 >= -eps:
+                found[p] = t
+                weights[p, 0] = l0
+                weights[p, 1] = l1
+                weights[p, 2] = l2
+                break
+    return found, weights
+
+
+@numba.njit(cache=True)
+def _is_missing(value: T.Any, fill_value: int, use_fill_value: bool) -> bool:
+    # nan (i.e. masked), negative (e.g. zero-based `-1`), or the explicit fill value
+    return value != value or value < 0 or (use_fill_value and value == fill_value)
+
+
+@numba.njit(cache=True)
+def count_extra_triangles(faces: Array, fill_value: int, use_fill_value: bool) -> int:
+    """Return the number of triangles, besides the first one, that fan triangulation creates per face."""
+    count = 0
+    for f in range(faces.shape[0]):
+        no_vertices = 0
+        for v in range(faces.shape[1]):
+            if not _is_missing(faces[f, v], fill_value, use_fill_value):
+                no_vertices += 1
+        if no_vertices > 3:
+            count += no_vertices - 3
+    return count
+
+
+@numba.njit(cache=True)
+def triangulate(
+    faces: Array,
+    fill_value: int,
+    use_fill_value: bool,
+    first: bool,
+    extra: bool,
+) -> Array:
+    """
+    Split the polygons of ``faces`` to triangles using fan triangulation, i.e. ``(v0, vi, vi+1)``.
+
+    The output contains the first triangle of each face (if ``first``), followed by the remaining
+    triangles of all the faces (if ``extra``). Missing vertices are skipped.
+    """
+    nfaces = faces.shape[0]
+    no_first = nfaces if first else 0
+    no_extra = count_extra_triangles(faces, fill_value, use_fill_value) if extra else 0
+    triangles = np.empty((no_first + no_extra, 3), dtype=np.int32)
+    vertices = np.empty(faces.shape[1], dtype=np.int32)
+    cursor = no_first
+    for f in range(nfaces):
+        no_vertices = 0
+        for v in range(faces.shape[1]):
+            value = faces[f, v]
+            if not _is_missing(value, fill_value, use_fill_value):
+                vertices[no_vertices] = np.int32(value)
+                no_vertices += 1
+        if no_vertices < 3:
+            raise ValueError("Found a face with less than 3 vertices")
+        if first:
+            triangles[f, 0] = vertices[0]
+            triangles[f, 1] = vertices[1]
+            triangles[f, 2] = vertices[2]
+        if extra:
+            for v in range(2, no_vertices - 1):
+                triangles[cursor, 0] = vertices[0]
+                triangles[cursor, 1] = vertices[v]
+                triangles[cursor, 2] = vertices[v + 1]
+                cursor += 1
+    return triangles
+
+
+@numba.njit(cache=True)
+def crop_nodes(
+    x: Array,
+    y: Array,
+    xmin: float,
+    ymin: float,
+    xmax: float,
+    ymax: float,
+) -> tuple[Array, Array]:
+    """
+    Return the indices of the nodes that are within the bbox and a dense lookup table which maps
+    the old node indices to the new ones; the nodes outside of the bbox are mapped to ``-1``.
+    """
+    lookup = np.full(x.shape[0], -1, dtype=np.int32)
+    count = 0
+    for n in range(x.shape[0]):
+        if xmin <= x[n] <= xmax and ymin <= y[n] <= ymax:
+            lookup[n] = count
+            count += 1
+    indices = np.empty(count, dtype=np.int64)
+    for n in range(x.shape[0]):
+        if lookup[n] >= 0:
+            indices[lookup[n]] = n
+    return indices, lookup
+
+
+@numba.njit(cache=True)
+def crop_triangles(triangles: Array, lookup: Array) -> tuple[Array, Array]:
+    """
+    Return the indices of the triangles whose nodes are all kept by ``lookup`` and the remapped triangles.
+    """
+    ntri = triangles.shape[0]
+    keep = np.empty(ntri, dtype=np.bool_)
+    count = 0
+    for t in range(ntri):
+        keep[t] = (
+            lookup[triangles[t, 0]] >= 0 and lookup[triangles[t, 1]] >= 0 and lookup[triangles[t, 2]] >= 0
+        )
+        if keep[t]:
+            count += 1
+    indices = np.empty(count, dtype=np.int64)
+    remapped = np.empty((count, 3), dtype=triangles.dtype)
+    cursor = 0
+    for t in range(ntri):
+        if keep[t]:
+            indices[cursor] = t
+            for v in range(3):
+                remapped[cursor, v] = lookup[triangles[t, v]]
+            cursor += 1
+    return indices, remapped
+
+
+@numba.njit(cache=True)
+def crop_regions_triangles(triangles: Array, bits: Array, no_regions: int) -> tuple[Array, Array]:
+    """
+    Assign each triangle to all the regions which contain all of its nodes.
+
+    ``bits`` contains one bitset per node; bit ``r % 64`` of word ``r // 64`` is set if the node
+    is in region ``r``. Return a CSR structure, i.e. ``offsets`` and ``indices``: the triangles
+    of region ``r`` are ``indices[offsets[r]:offsets[r + 1]]``, in ascending order.
+    """
+    ntri = triangles.shape[0]
+    words = bits.shape[1]
+    counts = np.zeros(no_regions + 1, dtype=np.int64)
+    for t in range(ntri):
+        a, b, c = triangles[t, 0], triangles[t, 1], triangles[t, 2]
+        for w in range(words):
+            common = bits[a, w] & bits[b, w] & bits[c, w]
+            bit = 0
+            while common:
+                if common & np.uint64(1):
+                    counts[w * 64 + bit + 1] += 1
+                common >>= np.uint64(1)
+                bit += 1
+    offsets = np.cumsum(counts)
+    indices = np.empty(offsets[-1], dtype=np.int64)
+    cursors = offsets[:-1].copy()
+    for t in range(ntri):
+        a, b, c = triangles[t, 0], triangles[t, 1], triangles[t, 2]
+        for w in range(words):
+            common = bits[a, w] & bits[b, w] & bits[c, w]
+            bit = 0
+            while common:
+                if common & np.uint64(1):
+                    r = w * 64 + bit
+                    indices[cursors[r]] = t
+                    cursors[r] += 1
+                common >>= np.uint64(1)
+                bit += 1
+    return offsets, indices
+
+
+# The classes of `classify_idl_triangles()`
+IDL_NOT_CROSSING = 0
+IDL_WRAPPABLE = 1
+IDL_NOT_WRAPPABLE = 2
+
+
+@numba.njit(cache=True)
+def _crosses_idl(lon_a: float, lon_b: float, max_lon: float) -> bool:
+    return lon_a * lon_b < 0 and abs(lon_a - lon_b) >= max_lon
+
+
+@numba.njit(cache=True, parallel=True)
+def classify_idl_triangles(lon: Array, triangles: Array, max_lon: float) -> Array:
+    """
+    Classify the triangles according to whether they cross the International Date Line (IDL).
+
+    A triangle crosses the IDL if two of its nodes have a different longitudinal sign and are
+    at least ``max_lon`` apart. Crossing triangles are ``IDL_WRAPPABLE`` if they span less than 180
+    degrees once the longitudes of their western nodes are shifted by 360 degrees, otherwise
+    they are ``IDL_NOT_WRAPPABLE``.
+    """
+    ntri = triangles.shape[0]
+    classes = np.zeros(ntri, dtype=np.int8)
+    for t in numba.prange(ntri):
+        lon_a = lon[triangles[t, 0]]
+        lon_b = lon[triangles[t, 1]]
+        lon_c = lon[triangles[t, 2]]
+        if (
+            _crosses_idl(lon_a, lon_b, max_lon)
+            or _crosses_idl(lon_a, lon_c, max_lon)
+            or _crosses_idl(lon_b, lon_c, max_lon)
+        ):
+            wrapped_a = lon_a + 360 if lon_a < 0 else lon_a
+            wrapped_b = lon_b + 360 if lon_b < 0 else lon_b
+            wrapped_c = lon_c + 360 if lon_c < 0 else lon_c
+            span = max(wrapped_a, wrapped_b, wrapped_c) - min(wrapped_a, wrapped_b, wrapped_c)
+            classes[t] = IDL_WRAPPABLE if span < 180 else IDL_NOT_WRAPPABLE
+    return classes
+
+
+@numba.njit(cache=True)
+def _get_node_edges(edges: Array, no_nodes: int) -> tuple[Array, Array]:
+    """Return the edges of each node, as a CSR structure, i.e. ``offsets`` and ``node_edges``."""
+    no_edges = edges.shape[0]
+    counts = np.zeros(no_nodes + 1, dtype=np.int64)
+    for e in range(no_edges):
+        counts[edges[e, 0] + 1] += 1
+        counts[edges[e, 1] + 1] += 1
+    offsets = np.cumsum(counts)
+    node_edges = np.empty(2 * no_edges, dtype=np.int64)
+    cursors = offsets[:-1].copy()
+    for e in range(no_edges):
+        for v in range(2):
+            node = edges[e, v]
+            node_edges[cursors[node]] = e
+            cursors[node] += 1
+    return offsets, node_edges
+
+
+@numba.njit(cache=True)
+def _pop_unused_edge(node: int, offsets: Array, node_edges: Array, used: Array) -> int:
+    """Mark the first unused edge of ``node`` as used and return it, or return ``-1`` if there is none."""
+    for k in range(offsets[node], offsets[node + 1]):
+        e: int = node_edges[k]
+        if not used[e]:
+            used[e] = True
+            return e
+    return -1
+
+
+@numba.njit(cache=True)
+def _cut_off_ring(trail: Array, p: int, length: int, current: int, nodes: Array, cursor: int) -> int:
+    """
+    Append the loop ``trail[p:length] + [current]`` to ``nodes``, unless it is degenerate (i.e. it has
+    less than 3 edges), and return the new end of ``nodes``.
+    """
+    if length - p < 3:
+        return cursor
+    for k in range(p, length):
+        nodes[cursor] = trail[k]
+        cursor += 1
+    nodes[cursor] = current
+    return cursor + 1
+
+
+@numba.njit(cache=True)
+def walk_rings(edges: Array, no_nodes: int) -> tuple[Array, Array]:
+    """
+    Chain the (undirected) ``edges`` into simple closed rings.
+
+    Whenever the walk reaches a node that is already part of the current trail (e.g. a node where
+    two parts of the mesh touch), the loop is cut off as a separate ring; this way rings never touch
+    themselves. Return a CSR structure, i.e. ``offsets`` and ``nodes``: the nodes of ring ``r`` are
+    ``nodes[offsets[r]:offsets[r + 1]]``, with the first node repeated at the end.
+    Chains which can't be closed are skipped.
+    """
+    no_edges = edges.shape[0]
+    node_offsets, node_edges = _get_node_edges(edges, no_nodes)
+    used = np.zeros(no_edges, dtype=np.bool_)
+    # The current trail and the position of each node in it (`-1` if the node is not part of it)
+    trail = np.empty(no_edges + 1, dtype=np.int64)
+    position = np.full(no_nodes, -1, dtype=np.int64)
+    # A ring of `k` edges has `k + 1` nodes
+    nodes = np.empty(2 * no_edges, dtype=np.int64)
+    offsets = np.zeros(no_edges + 1, dtype=np.int64)
+    no_rings = 0
+    cursor = 0
+    for e in range(no_edges):
+        if used[e]:
+            continue
+        used[e] = True
+        trail[0] = edges[e, 0]
+        position[edges[e, 0]] = 0
+        length = 1
+        current = edges[e, 1]
+        while current >= 0:
+            p = position[current]
+            if p >= 0:
+                end = _cut_off_ring(trail, p, length, current, nodes, cursor)
+                if end > cursor:
+                    cursor = end
+                    no_rings += 1
+                    offsets[no_rings] = cursor
+                position[trail[p + 1 : length]] = -1
+                length = p + 1
+            else:
+                position[current] = length
+                trail[length] = current
+                length += 1
+            following = _pop_unused_edge(current, node_offsets, node_edges, used)
+            current = -1 if following < 0 else edges[following, 0] + edges[following, 1] - current
+        # Whatever is left is either empty (i.e. just the start node) or an open chain
+        position[trail[:length]] = -1
+    return offsets[: no_rings + 1].copy(), nodes[:cursor].copy()
+
+
+@numba.njit(cache=True)
+def group_by(keys: Array, no_keys: int) -> tuple[Array, Array]:
+    """
+    Group the positions of ``keys`` by key, using a (stable) counting sort.
+
+    Return a CSR structure, i.e. ``offsets`` and ``positions``: the positions of key ``k`` are
+    ``positions[offsets[k]:offsets[k + 1]]``, in ascending order.
+    """
+    counts = np.zeros(no_keys + 1, dtype=np.int32)
+    for i in range(keys.shape[0]):
+        counts[keys[i] + 1] += 1
+    offsets = np.cumsum(counts).astype(np.int32)
+    positions = np.empty(keys.shape[0], dtype=np.int32)
+    cursors = offsets[:-1].copy()
+    for i in range(keys.shape[0]):
+        positions[cursors[keys[i]]] = i
+        cursors[keys[i]] += 1
+    return offsets, positions
+
+
+@numba.njit(cache=True)
+def mesh_edges(triangles: Array, no_nodes: int) -> tuple[Array, Array, Array]:
+    """
+    Return the unique (undirected) edges of the mesh and the faces of each edge.
+
+    The edges are sorted, i.e. ``edges[:, 0] < edges[:, 1]`` and the rows are in lexicographic order.
+    The faces of edge ``e`` are ``faces[offsets[e]:offsets[e + 1]]``, in ascending order.
+    """
+    ntri = triangles.shape[0]
+    # Group the half-edges by their first (i.e. smallest) node
+    counts = np.zeros(no_nodes + 1, dtype=np.int32)
+    for f in range(ntri):
+        for k in range(3):
+            counts[min(triangles[f, k], triangles[f, (k + 1) % 3]) + 1] += 1
+    node_offsets = np.cumsum(counts).astype(np.int32)
+    seconds = np.empty(3 * ntri, dtype=np.int32)
+    faces = np.empty(3 * ntri, dtype=np.int32)
+    cursors = node_offsets[:-1].copy()
+    for f in range(ntri):
+        for k in range(3):
+            a, b = triangles[f, k], triangles[f, (k + 1) % 3]
+            first = min(a, b)
+            seconds[cursors[first]] = max(a, b)
+            faces[cursors[first]] = f
+            cursors[first] += 1
+    edges = np.empty((3 * ntri, 2), dtype=np.int32)
+    offsets = np.empty(3 * ntri + 1, dtype=np.int32)
+    no_edges = 0
+    for node in range(no_nodes):
+        start, stop = node_offsets[node], node_offsets[node + 1]
+        # The groups are tiny, so a (stable) insertion sort by the second node is the fastest option
+        for i in range(start + 1, stop):
+            second, face = seconds[i], faces[i]
+            j = i - 1
+            while j >= start and seconds[j] > second:
+                seconds[j + 1] = seconds[j]
+                faces[j + 1] = faces[j]
+                j -= 1
+            seconds[j + 1] = second
+            faces[j + 1] = face
+        for i in range(start, stop):
+            if i == start or seconds[i] != seconds[i - 1]:
+                edges[no_edges, 0] = node
+                edges[no_edges, 1] = seconds[i]
+                offsets[no_edges] = i
+                no_edges += 1
+    offsets[no_edges] = 3 * ntri
+    return edges[:no_edges].copy(), offsets[: no_edges + 1].copy(), faces
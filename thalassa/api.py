@@ -1,13 +1,19 @@
 from __future__ import annotations
 
+import concurrent.futures
 import functools
+import itertools
 import logging
 import operator
 import os
+import threading
 import typing as T
 import warnings
+import weakref
 
+from . import cache
 from . import normalization
+from . import spatial
 from . import utils
 
 # from holoviews import opts as hvopts
@@ -16,6 +22,9 @@ if T.TYPE_CHECKING:  # pragma: no cover
     import bokeh.models
     import geoviews
     import holoviews
+    import numpy.typing as npt
+    import numpy
+    import pandas
     import pyproj
     import xarray
     from holoviews.streams import Stream
@@ -23,6 +32,14 @@ if T.TYPE_CHECKING:  # pragma: no cover
 
 logger = logging.getLogger(__name__)
 
+# At most one frame is being loaded in the background at any time. Since not all the backends are
+# thread-safe (e.g. Selafin), the frames are loaded while holding the read lock of the dataset,
+# which is shared with the callers (see `utils.get_read_lock()`).
+_PREFETCH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix="thalassa-prefetch",
+)
+
 
 @functools.cache
 def _get_transformer(from_crs: str = "EPSG:4326", to_crs: str = "EPSG:3857") -> pyproj.Transformer:
@@ -32,7 +49,11 @@ def _get_transformer(from_crs: str = "EPSG:4326", to_crs: str = "EPSG:3857") ->
     return transformer
 
 
-def _resolve_ranges(x_range: tuple[float, float] | None, y_range: tuple[float, float] | None, kwargs: T.Any) -> None:
+def _resolve_ranges(
+    x_range: tuple[float, float] | None,
+    y_range: tuple[float, float] | None,
+    kwargs: T.Any,
+) -> None:
     if x_range or y_range:
         transformer = _get_transformer(from_crs="EPSG:4326", to_crs="EPSG:3857")
         if x_range:
@@ -59,12 +80,17 @@ ADCIRC_VARIABLES_TO_BE_DROPPED = ["neta", "nvel", "max_nvdll", "max_nvell"]
 def open_dataset(
     path: str | os.PathLike[str],
     normalize: bool = True,
+    mesh_cache: bool = False,
+    *,
+    fill_value: int | None = None,
     **kwargs: dict[str, T.Any],
 ) -> xarray.Dataset:
     """
     Open the file specified at ``path`` using ``xarray`` and return an ``xarray.Dataset``.
 
     If `normalize` is `True` then convert the dataset to the "Thalassa schema", too.
+    If `mesh_cache` is `True`, the normalized mesh is cached on disk, so that reopening the file or opening
+    another file on the same mesh skips the processing of the connectivity (see `thalassa.meshcache`).
     Additional `kwargs` are passed on to `xarray.open_dataset()`.
 
     !!! note
@@ -86,6 +112,10 @@ def open_dataset(
         path: The path to the dataset file (netCDF, zarr, grib)
         normalize: Boolean flag indicating whether the dataset should be converted/normalized to the "Thalassa schema".
             Normalization is currently only supported for ``SCHISM``, ``TELEMAC``,  and ``ADCIRC`` netcdf files.
+        mesh_cache: Boolean flag indicating whether the normalized mesh should be read from/written to
+            the mesh cache. Only used if `normalize` is `True`.
+        fill_value: The value which marks the missing vertices of quads/polygons in the connectivity
+            of the file (e.g. `999999`), besides `nan` and negative values (see `thalassa.normalize()`).
         kwargs: The ``kwargs`` are being passed through to ``xarray.open_dataset``.
 
     """
@@ -98,8 +128,118 @@ def open_dataset(
     )
     with warnings.catch_warnings(record=True):
         ds = xr.open_dataset(path, **(default_kwargs | kwargs))
-    if normalize:
-        ds = normalization.normalize(ds)
+    if normalize and mesh_cache:
+        from . import meshcache
+
+        ds = meshcache.normalize(ds, source=path, fill_value=fill_value)
+    elif normalize:
+        ds = normalization.normalize(ds, fill_value=fill_value)
+    return ds
+
+
+def _open_part(
+    path: str | os.PathLike[str],
+    kwargs: dict[str, T.Any],
+) -> tuple[xarray.Dataset, normalization.THALASSA_FORMATS, str]:
+    """Open one of the files of a multi-file dataset and return it with its format and mesh fingerprint."""
+    import xarray as xr
+
+    from . import meshcache
+
+    with warnings.catch_warnings(record=True):
+        ds = xr.open_dataset(path, **kwargs)
+    fmt = normalization.infer_format(ds)
+    if fmt == normalization.THALASSA_FORMATS.UNKNOWN:
+        raise ValueError(f"Can't infer the format of: {path}")
+    renamed = normalization.NORMALIZE_DISPATCHER[fmt](ds, fix_connectivity=False)
+    return ds, fmt, meshcache._get_fingerprint(renamed, fmt)
+
+
+def open_mfdataset(
+    paths: str | os.PathLike[str] | T.Sequence[str | os.PathLike[str]],
+    normalize: bool = True,
+    *,
+    parallel: bool = True,
+    mesh_cache: bool = False,
+    fill_value: int | None = None,
+    **kwargs: dict[str, T.Any],
+) -> xarray.Dataset:
+    """
+    Open multiple files which share the same mesh (e.g. the daily `out2d_*.nc` files of SCHISM
+    or the cycles of an ADCIRC run) as a single dataset, concatenated along `time`.
+
+    The files are opened concurrently. The mesh is only read and normalized once, from the first file;
+    the meshes of the other files are checked against it, by comparing the hashes of their coordinates
+    and of their full connectivity. The concatenation is lazy, i.e. the data are backed by `dask`
+    and they are only loaded when they are needed.
+
+    Examples:
+        ``` python
+        import thalassa
+
+        ds = thalassa.open_mfdataset("outputs/out2d_*.nc")
+        print(ds)
+        ```
+
+    Parameters:
+        paths: A glob pattern (e.g. `"outputs/out2d_*.nc"`) or a sequence of paths. The files are
+            concatenated in the order of the sequence; glob matches are sorted.
+        normalize: Boolean flag indicating whether the dataset should be converted/normalized to the
+            "Thalassa schema".
+        parallel: Boolean flag indicating whether the files should be opened concurrently.
+        mesh_cache: Boolean flag indicating whether the normalized mesh should be read from/written to
+            the mesh cache (see `thalassa.meshcache`).
+        fill_value: The value which marks the missing vertices of quads/polygons in the connectivity
+            of the file (e.g. `999999`), besides `nan` and negative values (see `thalassa.normalize()`).
+        kwargs: The ``kwargs`` are being passed through to ``xarray.open_dataset``.
+
+    """
+    import glob
+
+    import xarray as xr
+
+    if isinstance(paths, (str, os.PathLike)):
+        pattern = os.fspath(paths)
+        paths = sorted(glob.glob(pattern)) or [pattern]
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No files to open")
+    default_kwargs: dict[str, T.Any] = dict(
+        cache=False,
+        chunks={},
+        drop_variables=ADCIRC_VARIABLES_TO_BE_DROPPED,
+    )
+    open_kwargs = default_kwargs | kwargs
+    with utils.timer(f"Opened {len(paths)} files in"):
+        if parallel and len(paths) > 1:
+            max_workers = min(len(paths), os.cpu_count() or 1, 16)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                parts = list(executor.map(functools.partial(_open_part, kwargs=open_kwargs), paths))
+        else:
+            parts = [_open_part(path, open_kwargs) for path in paths]
+    first, fmt, fingerprint = parts[0]
+    for path, (_, other_fmt, other_fingerprint) in zip(paths[1:], parts[1:]):
+        if (other_fmt, other_fingerprint) != (fmt, fingerprint):
+            raise ValueError(f"The mesh of {path} does not match the mesh of {paths[0]}")
+    # Only the variables which depend on time are concatenated; the mesh is taken from the first file
+    static = [name for name in first.variables if "time" not in first[name].dims]
+    timeseries = [ds.drop_vars([name for name in static if name in ds.variables]) for ds, _, _ in parts]
+    with utils.timer(f"Concatenated {len(paths)} files in"):
+        concatenated = xr.concat(
+            timeseries,
+            dim="time",
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+            combine_attrs="override",
+        )
+    ds = xr.merge([first[static], concatenated], combine_attrs="override")
+    if normalize and mesh_cache:
+        from . import meshcache
+
+        ds = meshcache.normalize(ds, source=paths[0], fill_value=fill_value)
+    elif normalize:
+        ds = normalization.normalize(ds, fill_value=fill_value)
     return ds
 
 
@@ -115,6 +255,51 @@ def get_dtf() -> DatetimeTickFormatter:
     return dtf
 
 
+# The projected coordinates of the nodes, keyed by mesh hash.
+# Plotting another variable or another timestep of the same mesh, reuses the coordinates
+# and only attaches the new values.
+_MESH_GEOMETRY_CACHE: cache.LRUCache[str, dict[str, numpy.ndarray[T.Any, T.Any]]] = cache.LRUCache(
+    maxsize=4,
+)
+
+
+def _get_mesh_nodes(
+    ds: xarray.Dataset,
+    variable: str = "",
+    values: numpy.ndarray[T.Any, T.Any] | None = None,
+) -> pandas.DataFrame:
+    """
+    Return a dataframe with the coordinates of the nodes of ``ds`` in Google Mercator and,
+    optionally, the values of `variable`.
+
+    The dataframe has the layout of the nodes of a ``TriMesh``, i.e. ``lon``, ``lat`` and ``index``
+    columns. The columns are (read-only) views of cached arrays; no data are being copied.
+    If `values` is `None`, the values of `variable` are retrieved from ``ds``.
+    """
+    import numpy as np
+    import pandas as pd
+
+    def project() -> dict[str, numpy.ndarray[T.Any, T.Any]]:
+        # Convert the data to Google Mercator. This makes interactive usage faster
+        transformer = _get_transformer(from_crs="EPSG:4326", to_crs="EPSG:3857")
+        with utils.timer("Projected mesh nodes in"):
+            tlon, tlat = transformer.transform(ds.lon.values, ds.lat.values)
+        geometry = dict(lon=np.asarray(tlon), lat=np.asarray(tlat), index=np.arange(len(tlon)))
+        for array in geometry.values():
+            array.flags.writeable = False
+        return geometry
+
+    geometry = _MESH_GEOMETRY_CACHE.get_or_create(utils.get_mesh_hash(ds), project)
+    columns = dict(geometry)
+    if variable:
+        if values is None:
+            with utils.get_read_lock(ds):
+                values = ds[variable].values
+        columns[variable] = values
+    index = pd.RangeIndex(len(geometry["index"]), name="node")
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
 def create_trimesh(
     ds_or_trimesh: geoviews.TriMesh | xarray.Dataset,
     variable: str = "",
@@ -122,6 +307,11 @@ def create_trimesh(
     """
     Create a ``geoviews.TriMesh`` object from the provided dataset.
 
+    The projected coordinates of the mesh are cached, therefore creating a trimesh for
+    another variable or timestep of the same mesh only needs to attach the new values.
+    The nodes of the trimesh are views of the cached coordinates and of the values of `variable`,
+    i.e. no intermediate copies are being made.
+
     Parameters:
         ds_or_trimesh: The dataset containing the variable we want to visualize.
             If a trimesh object is passed, then return it immediately.
@@ -136,28 +326,225 @@ def create_trimesh(
     else:
         ds = ds_or_trimesh
     # create the trimesh object
-    # Start by getting a "tabular" dataset (i.e. a pandas dataframe).
-    columns = ["lon", "lat"]
-    if variable:
-        columns.append(variable)
-    points_df = ds[columns].to_dataframe()
-    # Convert the data to Google Mercator. This makes interactive usage faster
-    transformer = _get_transformer(from_crs="EPSG:4326", to_crs="EPSG:3857")
-    tlon, tlat = transformer.transform(points_df.lon, points_df.lat)
-    points_df = points_df.assign(lon=tlon, lat=tlat)
-    # Create the geoviews object
-    kwargs = dict(data=points_df, kdims=["lon", "lat"], crs=crs.GOOGLE_MERCATOR)
-    if variable:
-        kwargs["vdims"] = [variable]
-    points_gv = gv.Points(**kwargs)
-    # Create the trimesh
+    if variable and ds[variable].dims != ("node",):
+        # The variable has more dimensions than `node` (e.g. `time`), so we need a "long" dataframe.
+        points_df = ds[["lon", "lat", variable]].to_dataframe()
+        transformer = _get_transformer(from_crs="EPSG:4326", to_crs="EPSG:3857")
+        tlon, tlat = transformer.transform(points_df.lon, points_df.lat)
+        points_df = points_df.assign(lon=tlon, lat=tlat)
+        points_gv = gv.Points(points_df, kdims=["lon", "lat"], vdims=[variable], crs=crs.GOOGLE_MERCATOR)
+        return gv.TriMesh((utils.get_triangles(ds), points_gv), name=variable)
+    # Passing `Nodes` (instead of `Points`) to `TriMesh` avoids a copy of the data,
+    # since `TriMesh` doesn't need to add the `index` column.
+    nodes_df = _get_mesh_nodes(ds, variable=variable)
+    vdims = [variable] if variable else []
+    nodes = gv.Nodes(nodes_df, kdims=["lon", "lat", "index"], vdims=vdims, crs=crs.GOOGLE_MERCATOR)
     if variable:
-        trimesh = gv.TriMesh((ds.triface_nodes.data, points_gv), name=variable)
+        trimesh = gv.TriMesh((utils.get_triangles(ds), nodes), name=variable)
     else:
-        trimesh = gv.TriMesh((ds.triface_nodes.data, points_gv))
+        trimesh = gv.TriMesh((utils.get_triangles(ds), nodes))
     return trimesh
 
 
+def create_time_trimesh(
+    ds: xarray.Dataset,
+    variable: str,
+    *,
+    prefetch: int = 2,
+) -> holoviews.DynamicMap:
+    """
+    Create a ``DynamicMap`` of ``geoviews.TriMesh`` objects, one per timestamp of `variable`.
+
+    The geometry of the mesh is only processed once; each frame only loads the `(node,)` slice
+    of the selected timestamp. While a frame is being displayed, the next `prefetch` frames
+    are being loaded in a background thread, so that scrubbing through time stays interactive.
+    If you load data from ``ds`` while frames are being prefetched, hold `utils.get_read_lock()`.
+
+    Parameters:
+        ds: The dataset containing the variable we want to visualize.
+        variable: The data variable we want to visualize. Its dimensions must be `(time, node)`.
+        prefetch: The number of frames to load in advance.
+    """
+    import geoviews as gv
+    import holoviews as hv
+    from cartopy import crs
+
+    if ds[variable].dims != ("time", "node"):
+        msg = f"In order to animate '{variable}', its dimensions must be `(time, node)`, not: {ds[variable].dims}"
+        raise ValueError(msg)
+    ds = ds[["lon", "lat", "triface_nodes", variable]]
+    times = ds.time.values
+    time_indices = {time: index for index, time in enumerate(times)}
+    triface_nodes = utils.get_triangles(ds)
+    frames: dict[int, concurrent.futures.Future[numpy.ndarray[T.Any, T.Any]]] = {}
+    lock = threading.Lock()
+
+    def load_frame(index: int) -> numpy.ndarray[T.Any, T.Any]:
+        with utils.get_read_lock(ds), utils.timer(f"Loaded frame {index} of {variable} in"):
+            return ds[variable].isel(time=index).values
+
+    def get_frame(index: int) -> numpy.ndarray[T.Any, T.Any]:
+        with lock:
+            # Schedule the requested frame and the next ones. Keep the previous frame, too,
+            # since stepping back and forth is a common pattern.
+            window = range(max(index - 1, 0), min(index + prefetch + 1, len(times)))
+            for i in window:
+                if i not in frames:
+                    frames[i] = _PREFETCH_EXECUTOR.submit(load_frame, i)
+            for i in list(frames):
+                if i not in window:
+                    frames.pop(i).cancel()
+            future = frames[index]
+        return future.result()
+
+    def callback(time: T.Any) -> geoviews.TriMesh:
+        index = time_indices[time]
+        values = get_frame(index)
+        nodes_df = _get_mesh_nodes(ds, variable=variable, values=values)
+        nodes = gv.Nodes(nodes_df, kdims=["lon", "lat", "index"], vdims=[variable], crs=crs.GOOGLE_MERCATOR)
+        return gv.TriMesh((triface_nodes, nodes), name=variable)
+
+    dmap = hv.DynamicMap(callback, kdims=[hv.Dimension("time", values=list(times))])
+    return dmap
+
+
+def _create_lod_dmap(
+    ds: xarray.Dataset,
+    variable: str = "",
+    how: T.Literal["mean", "max"] = "mean",
+    transform: T.Callable[[geoviews.TriMesh], T.Any] | None = None,
+) -> holoviews.DynamicMap:
+    """
+    Return a ``DynamicMap`` which displays the coarsest level of the mesh pyramid of ``ds``
+    that fits the current ranges and size of the plot.
+
+    The elements of each level are only created once. If `transform` is specified,
+    it is applied to the trimesh of each level (e.g. in order to get its edges).
+    """
+    import holoviews as hv
+    import holoviews.streams as hv_streams
+
+    from . import lod
+
+    pyramid = lod.get_mesh_pyramid(ds)
+    elements: dict[int, T.Any] = {}
+
+    def callback(
+        x_range: tuple[float, float] | None,
+        y_range: tuple[float, float] | None,
+        width: int | None,
+        height: int | None,
+        **kwargs: T.Any,
+    ) -> T.Any:
+        level = pyramid.select_level(x_range=x_range, y_range=y_range, width=width, height=height)
+        if level not in elements:
+            logger.debug("Displaying level %d of the mesh pyramid", level)
+            trimesh = lod.create_level_trimesh(ds, variable=variable, level=level, how=how)
+            elements[level] = transform(trimesh) if transform is not None else trimesh
+        return elements[level]
+
+    dmap = hv.DynamicMap(callback, streams=[hv_streams.RangeXY(), hv_streams.PlotSize()])
+    return dmap
+
+
+def _create_viewport_dmap(
+    ds: xarray.Dataset,
+    variable: str,
+    margin: float = 0.25,
+) -> holoviews.DynamicMap:
+    """
+    Return a ``DynamicMap`` which only loads the triangles that intersect the current view.
+
+    The loaded extent is the view plus a `margin` (as a fraction of the view's size) on each side,
+    so small pans can reuse the already loaded data. Zooming in reloads a narrower extent, so that
+    the number of rendered nodes follows the view. For dask-backed datasets only the chunks
+    that contain the selected nodes are read.
+
+    Before the plot reports its ranges, nothing is loaded: an empty trimesh which spans the extent
+    of the mesh is returned instead.
+    """
+    import geoviews as gv
+    import holoviews as hv
+    import holoviews.streams as hv_streams
+    import numpy as np
+    import pandas as pd
+    from cartopy import crs
+
+    if ds[variable].dims != ("node",):
+        msg = f"Only variables whose only dimension is `node` can be loaded lazily: {ds[variable].dims}"
+        raise ValueError(msg)
+    to_wgs84 = _get_transformer(from_crs="EPSG:3857", to_crs="EPSG:4326")
+    locator = spatial.get_triangle_locator(ds)
+    # The extent which has been loaded (in Web Mercator) and the corresponding trimesh
+    loaded: dict[str, T.Any] = {}
+    # The loaded extent is reused as long as the view isn't (much) smaller than the view it was loaded for
+    max_area_ratio = (1 + 2 * margin) ** 2 * (1 + 1e-6)
+
+    def build_trimesh(
+        nodes: npt.NDArray[numpy.int_],
+        triangles: npt.NDArray[numpy.int_],
+        values: npt.NDArray[T.Any],
+    ) -> geoviews.TriMesh:
+        geometry = _get_mesh_nodes(ds)
+        nodes_df = pd.DataFrame(
+            {
+                "lon": geometry.lon.to_numpy()[nodes],
+                "lat": geometry.lat.to_numpy()[nodes],
+                "index": np.arange(len(nodes)),
+                variable: values,
+            },
+        )
+        points = gv.Nodes(
+            nodes_df,
+            kdims=["lon", "lat", "index"],
+            vdims=[variable],
+            crs=crs.GOOGLE_MERCATOR,
+        )
+        return gv.TriMesh((triangles, points), name=variable)
+
+    def callback(
+        x_range: tuple[float, float] | None,
+        y_range: tuple[float, float] | None,
+        **kwargs: T.Any,
+    ) -> geoviews.TriMesh:
+        if x_range is None or y_range is None:
+            # The plot has not been displayed yet; only the extent of the mesh is needed.
+            # holoviews can't render a trimesh without triangles, so add a degenerate one
+            lon, lat = _get_mesh_nodes(ds)[["lon", "lat"]].to_numpy().T
+            corners = np.unique([lon.argmin(), lon.argmax(), lat.argmin(), lat.argmax()])
+            return build_trimesh(corners, np.zeros((1, 3), dtype=int), np.full(len(corners), np.nan))
+        extent = loaded.get("extent")
+        view_area = (x_range[1] - x_range[0]) * (y_range[1] - y_range[0])
+        if (
+            extent is not None
+            and extent[0] <= x_range[0]
+            and x_range[1] <= extent[2]
+            and extent[1] <= y_range[0]
+            and y_range[1] <= extent[3]
+            and (extent[2] - extent[0]) * (extent[3] - extent[1]) <= max_area_ratio * view_area
+        ):
+            return loaded["trimesh"]
+        dx = (x_range[1] - x_range[0]) * margin
+        dy = (y_range[1] - y_range[0]) * margin
+        extent = (x_range[0] - dx, y_range[0] - dy, x_range[1] + dx, y_range[1] + dy)
+        (lon_min, lon_max), (lat_min, lat_max) = to_wgs84.transform(
+            [extent[0], extent[2]],
+            [max(extent[1], -20037508.34), min(extent[3], 20037508.34)],
+        )
+        with utils.timer(f"Loaded viewport of {variable} in"):
+            triangles = locator.triangles[locator.query_bbox(lon_min, lat_min, lon_max, lat_max)]
+            nodes, local_triangles = np.unique(triangles, return_inverse=True)
+            with utils.get_read_lock(ds):
+                values = ds[variable].isel(node=nodes).values
+        trimesh = build_trimesh(nodes, local_triangles.reshape(triangles.shape), values)
+        logger.debug("Viewport: loaded %d of %d nodes", len(nodes), ds.sizes["node"])
+        loaded.update(extent=extent, trimesh=trimesh)
+        return trimesh
+
+    dmap = hv.DynamicMap(callback, streams=[hv_streams.RangeXY()])
+    return dmap
+
+
 def get_tiles(url: str = "http://c.tile.openstreetmap.org/{Z}/{X}/{Y}.png") -> geoviews.Tiles:
     """
     Return a WMTS using the provided `url`.
@@ -180,24 +567,63 @@ def get_nodes(
     size: float = 4,
     title: str = "Nodes",
     hover: bool = True,
+    lod: bool = False,
 ) -> geoviews.Points:
-    """Return a ``DynamicMap`` with the nodes of the mesh."""
+    """
+    Return a ``DynamicMap`` with the nodes of the mesh.
+
+    If `lod` is `True`, then only the nodes of the level of the mesh pyramid
+    that fits the current view are displayed. This requires a dataset.
+    """
     from cartopy import crs
     import geoviews as gv
 
-    trimesh = create_trimesh(ds_or_trimesh)
+    def to_points(trimesh: geoviews.TriMesh) -> geoviews.Points:
+        points = gv.Points(
+            trimesh.nodes.data.rename(columns={"index": "node"}),
+            kdims=["lon", "lat"],
+            vdims=["node"],
+            crs=crs.GOOGLE_MERCATOR,
+        )
+        return points
+
     kwargs: dict[str, T.Any] = {}
     _resolve_ranges(x_range=x_range, y_range=y_range, kwargs=kwargs)
     tools = ["crosshair"]
     if hover:
         tools.append("hover")
-    points = gv.Points(
-        trimesh.nodes.data.rename(columns={"index": "node"}),
+    if lod:
+        points = _create_lod_dmap(_ensure_dataset(ds_or_trimesh), transform=to_points)
+    else:
+        points = to_points(create_trimesh(ds_or_trimesh))
+    return points.opts(tools=tools, size=size, title=title, color="green")
+
+
+def _get_edgepaths(ds: xarray.Dataset) -> geoviews.EdgePaths:
+    """
+    Return the unique edges of the mesh as ``nan`` separated segments.
+
+    Contrary to `TriMesh.edgepaths`, which draws the three edges of every triangle,
+    the edges which are shared by two triangles are only drawn once.
+    """
+    import geoviews as gv
+    import numpy as np
+    from cartopy import crs
+
+    from . import topology
+
+    edges = topology.get_mesh_topology(ds).edges
+    nodes = _get_mesh_nodes(ds)
+    segments = np.full((len(edges), 3, 2), np.nan)
+    segments[:, :2, 0] = nodes.lon.to_numpy()[edges]
+    segments[:, :2, 1] = nodes.lat.to_numpy()[edges]
+    edgepaths = gv.EdgePaths(
+        [segments.reshape(-1, 2)[:-1]],
         kdims=["lon", "lat"],
-        vdims=["node"],
+        datatype=["multitabular"],
         crs=crs.GOOGLE_MERCATOR,
     )
-    return points.opts(tools=tools, size=size, title=title, color="green")
+    return edgepaths
 
 
 def get_wireframe(
@@ -207,12 +633,27 @@ def get_wireframe(
     y_range: tuple[float, float] | None = None,
     title: str = "Mesh",
     hover: bool = False,
+    lod: bool = False,
 ) -> geoviews.DynamicMap:
-    """Return a ``DynamicMap`` with a wireframe of the mesh."""
+    """
+    Return a ``DynamicMap`` with a wireframe of the mesh.
+
+    If `lod` is `True`, then only the edges of the level of the mesh pyramid
+    that fits the current view are rasterized. This requires a dataset.
+    """
     import holoviews.operation.datashader as hv_operation_datashader
+    import xarray as xr
 
-    trimesh = create_trimesh(ds_or_trimesh)
-    kwargs = dict(element=trimesh.edgepaths, precompute=True)
+    if lod:
+        edgepaths = _create_lod_dmap(
+            _ensure_dataset(ds_or_trimesh),
+            transform=lambda trimesh: trimesh.edgepaths,
+        )
+    elif isinstance(ds_or_trimesh, xr.Dataset):
+        edgepaths = _get_edgepaths(ds_or_trimesh)
+    else:
+        edgepaths = ds_or_trimesh.edgepaths
+    kwargs = dict(element=edgepaths, precompute=True)
     _resolve_ranges(x_range=x_range, y_range=y_range, kwargs=kwargs)
     tools = ["crosshair"]
     if hover:
@@ -225,8 +666,11 @@ def get_wireframe(
     return wireframe
 
 
+_RASTER_BACKENDS = ("datashader", "weights")
+
+
 def get_raster(
-    ds_or_trimesh: geoviews.TriMesh | xarray.Dataset,
+    ds_or_trimesh: geoviews.TriMesh | holoviews.DynamicMap | xarray.Dataset,
     variable: str = "",
     *,
     title: str = "",
@@ -237,15 +681,67 @@ def get_raster(
     clim_max: float | None = None,
     x_range: tuple[float, float] | None = None,
     y_range: tuple[float, float] | None = None,
+    backend: T.Literal["datashader", "weights"] = "datashader",
+    width: int = 800,
+    height: int = 600,
+    lod: bool = False,
+    lod_restriction: T.Literal["mean", "max"] = "mean",
+    viewport: bool = False,
 ) -> geoviews.DynamicMap:
     """
     Return a ``DynamicMap`` with a rasterized image of the variable.
 
-    Uses ``datashader`` behind the scenes.
+    Uses ``datashader`` behind the scenes. If a ``DynamicMap`` of trimeshes is passed
+    (e.g. the output of `create_time_trimesh()`), then each of its frames gets rasterized.
+
+    With `backend="weights"`, the image is rendered on a fixed `width` x `height` canvas
+    using precomputed interpolation weights (see `thalassa.raster.render()`). The canvas does
+    not get re-rendered when zooming, but rendering another timestep of the same mesh is much cheaper.
+    This backend requires a dataset.
+
+    With `lod=True`, the coarsest level of the mesh pyramid that fits the current view gets rasterized
+    (see `thalassa.lod.MeshPyramid`). The values of the merged nodes are combined according
+    to `lod_restriction`, i.e. `mean` or `max`. This requires a dataset.
+
+    With `viewport=True`, only the triangles which intersect the current view (plus a margin)
+    are loaded and rasterized. Useful when zooming into a small part of a large mesh,
+    especially if the dataset is backed by dask. This requires a dataset and can't be combined with `lod`.
     """
+    import holoviews as hv
     import holoviews.operation.datashader as hv_operation_datashader
 
-    trimesh = create_trimesh(ds_or_trimesh=ds_or_trimesh, variable=variable)
+    if backend not in _RASTER_BACKENDS:
+        msg = f"Unknown backend: {backend!r}. Please choose one of: {', '.join(_RASTER_BACKENDS)}"
+        raise ValueError(msg)
+    if backend == "weights":
+        return _get_weights_raster(
+            ds=ds_or_trimesh,
+            variable=variable,
+            title=title,
+            cmap=cmap,
+            colorbar=colorbar,
+            clabel=clabel,
+            clim_min=clim_min,
+            clim_max=clim_max,
+            x_range=x_range,
+            y_range=y_range,
+            width=width,
+            height=height,
+        )
+    if lod and viewport:
+        raise ValueError("`lod` can't be combined with `viewport`")
+    if viewport:
+        trimesh = _create_viewport_dmap(_ensure_dataset(ds_or_trimesh), variable=variable)
+        name = variable
+    elif lod:
+        trimesh = _create_lod_dmap(_ensure_dataset(ds_or_trimesh), variable=variable, how=lod_restriction)
+        name = variable
+    elif isinstance(ds_or_trimesh, hv.DynamicMap):
+        trimesh = ds_or_trimesh
+        name = variable
+    else:
+        trimesh = create_trimesh(ds_or_trimesh=ds_or_trimesh, variable=variable)
+        name = trimesh.name
     kwargs = dict(element=trimesh, precompute=True)
     _resolve_ranges(x_range=x_range, y_range=y_range, kwargs=kwargs)
     raster = hv_operation_datashader.rasterize(**kwargs).opts(
@@ -253,12 +749,60 @@ def get_raster(
         clabel=clabel,
         colorbar=colorbar,
         clim=(clim_min, clim_max),
-        title=title or trimesh.name,
+        title=title or name,
         tools=["crosshair", "hover"],
     )
     return raster
 
 
+def _ensure_dataset(ds: T.Any) -> xarray.Dataset:
+    import xarray as xr
+
+    if not isinstance(ds, xr.Dataset):
+        raise ValueError(f"A dataset is required, not: {type(ds).__name__}")
+    return ds
+
+
+def _get_weights_raster(
+    ds: T.Any,
+    variable: str,
+    *,
+    title: str,
+    cmap: str,
+    colorbar: bool,
+    clabel: str,
+    clim_min: float | None,
+    clim_max: float | None,
+    x_range: tuple[float, float] | None,
+    y_range: tuple[float, float] | None,
+    width: int,
+    height: int,
+) -> geoviews.DynamicMap:
+    import geoviews as gv
+    import holoviews as hv
+    from cartopy import crs
+
+    from . import raster
+
+    ds = _ensure_dataset(ds)
+    xmin, ymin, xmax, ymax = raster.get_mesh_extent(ds)
+    ranges: dict[str, tuple[float, float]] = {}
+    _resolve_ranges(x_range=x_range, y_range=y_range, kwargs=ranges)
+    xmin, xmax = ranges.get("x_range", (xmin, xmax))
+    ymin, ymax = ranges.get("y_range", (ymin, ymax))
+    image = raster.render(ds, variable, width=width, height=height, extent=(xmin, ymin, xmax, ymax))
+    element = gv.Image(image, kdims=["x", "y"], vdims=[variable], crs=crs.GOOGLE_MERCATOR)
+    dmap = hv.DynamicMap(lambda: element).opts(
+        cmap=cmap,
+        clabel=clabel,
+        colorbar=colorbar,
+        clim=(clim_min, clim_max),
+        title=title or variable,
+        tools=["crosshair", "hover"],
+    )
+    return dmap
+
+
 def get_hover(variable: str) -> bokeh.models.HoverTool:
     import bokeh.models
 
@@ -274,6 +818,97 @@ def get_hover(variable: str) -> bokeh.models.HoverTool:
     return hover
 
 
+# Unique tokens of the in-memory arrays of the data variables. Unlike `id()`, tokens are never reused,
+# so the timeseries cache can't return the values of an array which has been garbage collected.
+_ARRAY_TOKENS: dict[int, int] = {}
+_ARRAY_TOKEN_COUNTER = itertools.count()
+
+# The datasets of the timeseries DynamicMaps. The `id()` of a dataset might be part of its dataset key;
+# by keeping a reference, the `id()` can't be reused for as long as the DynamicMap exists.
+_DMAP_DATASETS: weakref.WeakKeyDictionary[holoviews.DynamicMap, xarray.Dataset] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_array_token(array: T.Any) -> int | None:
+    key = id(array)
+    if key not in _ARRAY_TOKENS:
+        try:
+            weakref.finalize(array, _ARRAY_TOKENS.pop, key, None)
+        except TypeError:
+            return None
+        _ARRAY_TOKENS[key] = next(_ARRAY_TOKEN_COUNTER)
+    return _ARRAY_TOKENS[key]
+
+
+def _get_dataset_key(ds: xarray.Dataset, variable: str) -> T.Hashable:
+    """
+    Return a key which identifies the data of ``variable``. Used by the timeseries cache.
+
+    Datasets opened from the same file (and with the same nodes and timestamps) share the same key,
+    as long as ``variable`` is read from the file. Variables which have been modified in memory
+    are identified by their array instead.
+    """
+    import numpy as np
+
+    # `Variable._data` is the (possibly lazy) array of the variable; `.data` would load it
+    data: T.Any = ds.variables[variable]._data
+    source = ds.encoding.get("source")
+    identity: T.Hashable
+    if hasattr(data, "map_blocks"):
+        # The names of dask arrays are deterministic tokens of their graphs
+        identity = data.name
+    elif source is not None and not isinstance(data, np.ndarray):
+        # A lazily indexed array, i.e. the data are read from the source file
+        identity = source
+    else:
+        token = _get_array_token(data)
+        identity = ("array", token) if token is not None else id(ds)
+    return (identity, utils.get_mesh_hash(ds, variables=("lon", "lat", "time")))
+
+
+def _load_timeseries(
+    ds: xarray.Dataset,
+    variable: str,
+    dataset_key: T.Hashable,
+    node_indices: list[int],
+    weights: list[float],
+) -> xarray.DataArray:
+    """
+    Return the timeseries of `variable`, interpolated between the nodes with the specified `weights`.
+
+    The timeseries of each node are cached. This way, toggling between the same few nodes,
+    or moving the pointer over the same node, does not trigger any I/O.
+    """
+    import numpy as np
+    import xarray as xr
+
+    rows = {}
+    for node_index in set(node_indices):
+        row = cache.TIMESERIES_CACHE.get((dataset_key, variable, node_index))
+        if row is not None:
+            rows[node_index] = row
+    missing = sorted(set(node_indices) - rows.keys())
+    if missing:
+        # `load_nodes()` transparently reads from the timeseries store, if there is one
+        subset, _ = spatial.load_nodes(ds=ds, variables=[variable], indices=np.array(missing))
+        for i, node_index in enumerate(missing):
+            row = subset[variable].isel(node=i).values
+            cache.TIMESERIES_CACHE.put((dataset_key, variable, node_index), row)
+            rows[node_index] = row
+    if len(node_indices) == 1:
+        values = rows[node_indices[0]]
+    else:
+        values = sum(weight * rows[node_index] for node_index, weight in zip(node_indices, weights))
+    ts = xr.DataArray(
+        values,
+        dims=("time",),
+        coords={"time": ds.time},
+        name=variable,
+        attrs=ds[variable].attrs,
+    )
+    return ts
+
 
 def _get_stream_timeseries(
     ds: xarray.Dataset,
@@ -282,10 +917,12 @@ def _get_stream_timeseries(
     stream_class: Stream,
     title_template: str,
     fontscale: float = 1,
+    interpolation: T.Literal["nearest", "barycentric"] = "nearest",
 ) -> geoviews.DynamicMap:
     import geoviews as gv
     import holoviews as hv
     import holoviews.streams as hv_streams
+    import numpy as np
     import pyproj
 
     to_wgs84 = pyproj.Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True).transform
@@ -293,33 +930,46 @@ def _get_stream_timeseries(
     if stream_class not in {hv_streams.Tap, hv_streams.PointerXY}:
         raise ValueError("Unsupported Stream class. Please choose either Tap or PointerXY")
 
-    ds = ds[["lon", "lat", variable]]
+    original_ds = ds
+    dataset_key = _get_dataset_key(original_ds, variable)
+    # `triface_nodes` is needed in order to check whether the selected point is inside the mesh
+    ds = ds[["lon", "lat", "triface_nodes", variable]]
     hover = get_hover(variable)
     initial_render = True
 
     def callback(x: float, y: float) -> holoviews.Curve:
         logger.debug("tsplot: start - %s, %s", x, y)
         nonlocal initial_render
-        if initial_render or (not utils.is_point_in_the_raster(raster=source_raster, lon=x, lat=y)):
+        lon, lat = to_wgs84(x, y)
+        if initial_render or (not utils.is_point_in_the_mesh(ds=ds, lon=lon, lat=lat)):
             # if the point is not inside the mesh, then display an empty graph
             # Using slice(0, 0) ensures that there are no data to display but we keep the correct
             # variable names to display as labels in the X and Y axis.
-            ts = ds.isel(node=0, time=slice(0, 0))
+            ts = ds[variable].isel(node=0, time=slice(0, 0))
             title = "Please click on the map!"
         else:
-            x, y = to_wgs84(x, y)
-            node_index = utils.get_index_of_nearest_node(ds=ds, lon=x, lat=y)
-            ts = ds.isel(node=node_index)
+            if interpolation == "barycentric":
+                locator = spatial.get_triangle_locator(ds)
+                triangles, weights = locator.locate(lon, lat)
+                node_indices = [int(node) for node in locator.triangles[triangles[0]]]
+                node_weights = [float(weight) for weight in weights[0]]
+                # For the title, use the node with the largest weight
+                node_index = node_indices[int(np.argmax(node_weights))]
+                node_lon, node_lat = lon, lat
+            else:
+                node_index = utils.get_index_of_nearest_node(ds=ds, lon=lon, lat=lat)
+                node_indices, node_weights = [node_index], [1.0]
+                node_lon, node_lat = float(ds.lon[node_index]), float(ds.lat[node_index])
+            with utils.timer("tsplot: data loaded ts in"):
+                ts = _load_timeseries(ds, variable, dataset_key, node_indices, node_weights)
             title = title_template.format(
-                lon=float(ts.lon.data),
-                lat=float(ts.lat.data),
+                lon=node_lon,
+                lat=node_lat,
                 variable=variable,
                 node_index=node_index,
             )
         logger.debug("tsplot: title: %s", title)
-        with utils.timer("tsplot: data loaded ts in"):
-            ts[variable].load()
-        plot = hv.Curve(ts[variable])
+        plot = hv.Curve(ts)
         initial_render = False
         plot = plot.opts(
             title=title,
@@ -335,17 +985,64 @@ def _get_stream_timeseries(
 
     stream = stream_class(x=0, y=0, source=source_raster)
     dmap = gv.DynamicMap(callback, streams=[stream])
+    _DMAP_DATASETS[dmap] = original_ds
     return dmap
 
 
+def _get_station_dim(stations: xarray.Dataset) -> str:
+    # `spatial.extract_points()` returns a `station` dimension; the validation datasets use `node`
+    return "station" if "station" in stations.dims else "node"
+
+
 def get_station_timeseries(
     stations: xarray.Dataset,
     pins: geoviews.DynamicMap,
-) -> holoviews.DynamicMap:   # pragma: no cover
+) -> holoviews.DynamicMap:
+    """
+    Return a ``DynamicMap`` with the timeseries of the station which is selected on the `pins`.
+
+    The `stations` are either the output of `thalassa.extract_points()`, in which case all the variables
+    with `(time, station)` dimensions are plotted, or a validation dataset with simulated (`stime`,
+    `elev_sim`) and observed (`time`, `elev_obs`) elevations per `node`.
+
+    Parameters:
+        stations: The dataset with the stations.
+        pins: The pins of the stations, see `get_station_pins()`.
+
+    """
     import holoviews as hv
     import pandas as pd
 
-    def callback(index: list[int]) -> holoviews.Curve:
+    dim = _get_station_dim(stations)
+    if "elev_sim" not in stations.variables:
+        variables = [name for name, var in stations.data_vars.items() if var.dims == ("time", dim)]
+
+        def extracted_callback(index: list[int]) -> holoviews.Overlay:
+            if not index:
+                title = "No stations selected"
+                data: dict[str, T.Any] = {name: ([], []) for name in variables}
+            else:
+                # As below, pick the first one of multiple pins with the same lon/lat
+                position = pins.data.index[index[0]]
+                title = str(stations.location.values[position])
+                selected = stations.isel({dim: position})
+                data = {name: (selected.time.values, selected[name].values) for name in variables}
+            curves = [hv.Curve(data[name], "time", name, label=name) for name in variables]
+            return hv.Overlay(curves).opts(
+                hv.opts.Curve(
+                    padding=0.05,
+                    title=title,
+                    framewise=True,
+                    xlabel="Time",
+                    tools=["hover"],
+                    xformatter=get_dtf(),
+                ),
+            )
+
+        stream = hv.streams.Selection1D(source=pins, index=[])
+        return hv.DynamicMap(extracted_callback, streams=[stream])
+
+    def callback(index: list[int]) -> holoviews.Curve:  # pragma: no cover
         # sometimes there are multiple pins with the same lon/lat
         # When one of these pins gets selected index contains the indices of both pins
         # This causes an exception to be raised.
@@ -361,7 +1058,7 @@ def get_station_timeseries(
         else:
             df = pins.data
             title = df.iloc[index[0]].location
-            ds = stations.isel(node=df.index[index])[columns]  # type: ignore[assignment]
+            ds = stations.isel({dim: df.index[index]})[columns]  # type: ignore[assignment]
         dataset = hv.Dataset(ds)
         curve1 = hv.Curve(dataset, kdims=["stime"], vdims=["elev_sim"], label="Simulation")
         curve2 = hv.Curve(dataset, kdims=["time"], vdims=["elev_obs"], label="Observation")
@@ -399,16 +1096,36 @@ _STATION_VARIABLES = [
     "R^2",
     "Nash-Sutcliffe Coefficient",
     "lambda index",
+    # `spatial.extract_points()`
+    "node",
+    "node_lon",
+    "node_lat",
+    "distance",
+    "triface",
 ]
 
 
 def get_station_table(
     stations: xarray.Dataset,
     pins: geoviews.DynamicMap,
-) -> holoviews.DynamicMap:  # pragma: no cover
+) -> holoviews.DynamicMap:
+    """
+    Return a ``DynamicMap`` with the attributes (e.g. the statistics) of the station which is selected
+    on the `pins`.
+
+    Parameters:
+        stations: The dataset with the stations; e.g. the output of `thalassa.extract_points()`.
+        pins: The pins of the stations, see `get_station_pins()`.
+
+    """
     import holoviews as hv
     import pandas as pd
 
+    dim = _get_station_dim(stations)
+    names = [
+        name for name in _STATION_VARIABLES if name in stations.variables and stations[name].dims == (dim,)
+    ]
+
     def callback(index: list[int]) -> holoviews.Table:
         # sometimes there are multiple pins with the same lon/lat
         # When one of these pins gets selected index contains the indices of both pins
@@ -421,8 +1138,8 @@ def get_station_table(
         if not index:
             df = pd.DataFrame(columns=["attribute", "value"]).set_index("attribute")
         else:
-            ds = stations.isel(node=pins.data.index[index])
-            df = ds[_STATION_VARIABLES].to_dataframe().T
+            ds = stations.isel({dim: pins.data.index[index]})
+            df = ds[names].to_dataframe().T
             df.index.name = "attribute"
             df.columns = pd.Index(["value"])
         table = hv.Table(df, kdims=["attribute"])
@@ -448,6 +1165,7 @@ def get_tap_timeseries(
     source_raster: geoviews.DynamicMap,
     title_template: str = "{variable} - Node={node_index} Lon={lon:.6f} Lat={lat:.6f}",
     fontscale: float = 1,
+    interpolation: T.Literal["nearest", "barycentric"] = "nearest",
 ) -> geoviews.DynamicMap:
     import holoviews.streams as hv_streams
 
@@ -458,6 +1176,7 @@ def get_tap_timeseries(
         stream_class=hv_streams.Tap,
         title_template=title_template,
         fontscale=fontscale,
+        interpolation=interpolation,
     )
     return dmap
 
@@ -468,6 +1187,7 @@ def get_pointer_timeseries(
     source_raster: geoviews.DynamicMap,
     title_template: str = "",
     fontscale: float = 1,
+    interpolation: T.Literal["nearest", "barycentric"] = "nearest",
 ) -> geoviews.DynamicMap:
     import holoviews.streams as hv_streams
 
@@ -478,6 +1198,7 @@ def get_pointer_timeseries(
         stream_class=hv_streams.PointerXY,
         title_template=title_template,
         fontscale=fontscale,
+        interpolation=interpolation,
     )
     return dmap
 
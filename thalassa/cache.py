@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import collections
+import logging
+import os
+import pathlib
+import threading
+import typing as T
+
+
+logger = logging.getLogger(__name__)
+
+K = T.TypeVar("K", bound=T.Hashable)
+V = T.TypeVar("V")
+
+
+class LRUCache(T.Generic[K, V]):
+    """
+    A thread-safe, bounded, Least-Recently-Used cache.
+
+    Once more than `maxsize` items or more than `max_bytes` bytes have been stored,
+    the least recently used items get evicted. Items larger than `max_bytes` are not cached at all.
+
+    Parameters:
+        maxsize: The maximum number of items that will be kept in the cache.
+        max_bytes: The memory budget of the cache. If `None`, only `maxsize` is taken into account.
+        sizeof: A function returning the size of an item in bytes. Required when `max_bytes` is used.
+
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 8,
+        max_bytes: int | None = None,
+        sizeof: T.Callable[[V], int] | None = None,
+    ) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be positive: {maxsize}")
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("When `max_bytes` is specified, `sizeof` must be specified, too")
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._sizeof = sizeof
+        self._data: collections.OrderedDict[K, V] = collections.OrderedDict()
+        self._sizes: dict[K, int] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def info(self) -> dict[str, int | None]:
+        """Return the statistics of the cache."""
+        with self._lock:
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                size=len(self._data),
+                maxsize=self.maxsize,
+                nbytes=self.nbytes,
+                max_bytes=self.max_bytes,
+            )
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            size = self._sizeof(value) if self._sizeof is not None else 0
+            if self.max_bytes is not None and size > self.max_bytes:
+                logger.debug("Item is larger than the cache's memory budget, not caching: %r", key)
+                return
+            self._remove(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            self.nbytes += size
+            self._evict()
+
+    def get_or_create(self, key: K, factory: T.Callable[[], V]) -> V:
+        """
+        Return the value of `key`. If `key` is missing, create the value by calling `factory()`.
+        """
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+        # Don't hold the lock while creating the value; creation might take a while
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def _remove(self, key: K) -> None:
+        if key in self._data:
+            del self._data[key]
+            self.nbytes -= self._sizes.pop(key)
+
+    def _evict(self) -> None:
+        while len(self._data) > self.maxsize or (
+            self.max_bytes is not None and self.nbytes > self.max_bytes
+        ):
+            evicted, _ = self._data.popitem(last=False)
+            self.nbytes -= self._sizes.pop(evicted)
+            logger.debug("Evicted from cache: %r", evicted)
+
+
+def get_cache_dir(*parts: str) -> pathlib.Path:
+    """
+    Return the directory where thalassa stores its on-disk caches. The directory is created if necessary.
+
+    The directory can be overridden with the ``THALASSA_CACHE_DIR`` environment variable.
+    Otherwise, it defaults to ``$XDG_CACHE_HOME/thalassa`` (i.e. ``~/.cache/thalassa``).
+
+    Parameters:
+        parts: Optional subdirectories, e.g. ``get_cache_dir("raster")``.
+
+    """
+    if "THALASSA_CACHE_DIR" in os.environ:
+        root = pathlib.Path(os.environ["THALASSA_CACHE_DIR"])
+    else:
+        root = pathlib.Path(os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache") / "thalassa"
+    path = root.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _nbytes(value: T.Any) -> int:
+    return int(value.nbytes)
+
+
+# The timeseries which have been loaded by the tap/pointer callbacks.
+# The keys are `(dataset key, variable, node index)` and the values are numpy arrays.
+# The memory budget can be adjusted by setting `TIMESERIES_CACHE.max_bytes`.
+TIMESERIES_CACHE: LRUCache[tuple[T.Hashable, str, int], T.Any] = LRUCache(
+    maxsize=10_000,
+    max_bytes=128 * 1024**2,
+    sizeof=_nbytes,
+)
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import logging
+import typing as T
+
+from . import api
+from . import cache
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import geoviews
+    import numpy
+    import numpy.typing as npt
+    import xarray
+
+
+logger = logging.getLogger(__name__)
+
+Restriction = T.Literal["mean", "max"]
+
+
+class MeshLevel:
+    """
+    A simplified version of a mesh.
+
+    Parameters:
+        x: The x coordinates of the nodes of the level, in Web Mercator.
+        y: The y coordinates of the nodes of the level, in Web Mercator.
+        triangles: An `(n, 3)` array with the node indices of each triangle of the level.
+        node_map: The index of the node of the level that each node of the original mesh got merged into.
+        cell_size: The size of the clustering cells, in meters. Nodes closer than that may have been merged.
+
+    """
+
+    def __init__(
+        self,
+        x: npt.NDArray[numpy.float64],
+        y: npt.NDArray[numpy.float64],
+        triangles: npt.NDArray[numpy.int_],
+        node_map: npt.NDArray[numpy.int_],
+        cell_size: float,
+    ) -> None:
+        self.x = x
+        self.y = y
+        self.triangles = triangles
+        self.node_map = node_map
+        self.cell_size = cell_size
+
+    def restrict(self, values: npt.ArrayLike, how: Restriction = "mean") -> npt.NDArray[numpy.float64]:
+        """
+        Return the values of the nodes of the level, given the `values` of the nodes of the original mesh.
+
+        Parameters:
+            values: The values of the nodes of the original mesh.
+            how: How the values of the merged nodes are combined. `mean` or `max`. `nan` values are ignored.
+
+        """
+        import numpy as np
+
+        values = np.asarray(values, dtype=np.float64)
+        size = len(self.x)
+        finite = np.isfinite(values)
+        if how == "mean":
+            sums = np.bincount(self.node_map[finite], weights=values[finite], minlength=size)
+            counts = np.bincount(self.node_map[finite], minlength=size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                restricted = sums / counts
+        elif how == "max":
+            restricted = np.full(size, -np.inf)
+            np.maximum.at(restricted, self.node_map[finite], values[finite])
+            restricted[np.isneginf(restricted)] = np.nan
+        else:
+            raise ValueError(f"Unknown restriction: {how}. Please choose one of: mean, max")
+        return restricted
+
+
+def _cluster(
+    x: npt.NDArray[numpy.float64],
+    y: npt.NDArray[numpy.float64],
+    triangles: npt.NDArray[numpy.int_],
+    weights: npt.NDArray[numpy.float64],
+    cell_size: float,
+) -> tuple[
+    npt.NDArray[numpy.float64],
+    npt.NDArray[numpy.float64],
+    npt.NDArray[numpy.int_],
+    npt.NDArray[numpy.int_],
+    npt.NDArray[numpy.float64],
+]:
+    """
+    Merge the nodes which fall into the same cell of a uniform grid (i.e. vertex clustering).
+
+    The new nodes are placed on the (weighted) centroid of the merged nodes. Triangles whose nodes
+    got merged collapse and are dropped.
+    """
+    import numpy as np
+
+    ix = np.floor((x - x.min()) / cell_size).astype(np.int64)
+    iy = np.floor((y - y.min()) / cell_size).astype(np.int64)
+    _, cluster = np.unique(iy * (int(ix.max()) + 1) + ix, return_inverse=True)
+    cluster = cluster.ravel()
+    size = int(cluster.max()) + 1
+    new_weights = T.cast(
+        "npt.NDArray[numpy.float64]",
+        np.bincount(cluster, weights=weights, minlength=size),
+    )
+    new_x = np.bincount(cluster, weights=x * weights, minlength=size) / new_weights
+    new_y = np.bincount(cluster, weights=y * weights, minlength=size) / new_weights
+    new_triangles: npt.NDArray[numpy.int_] = cluster[triangles]
+    a, b, c = new_triangles.T
+    new_triangles = new_triangles[(a != b) & (b != c) & (a != c)]
+    # Different triangles may collapse to the same coarse triangle; keep only one of them.
+    # Sorting the (sorted) nodes with lexsort is much faster than `np.unique(axis=0)`
+    keys = np.sort(new_triangles, axis=1)
+    order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+    keys = keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]).any(axis=1)
+    new_triangles = new_triangles[np.sort(order[first])]
+    return new_x, new_y, new_triangles, cluster, new_weights
+
+
+class MeshPyramid:
+    """
+    A level-of-detail pyramid of a mesh, built with vertex clustering.
+
+    Each level merges the nodes of the previous level on a grid whose cells are twice as large.
+    Level 0 is the original mesh; the higher the level, the coarser the mesh. Levels that
+    would not reduce the number of nodes significantly are skipped.
+
+    Parameters:
+        x: The x coordinates of the nodes, in Web Mercator.
+        y: The y coordinates of the nodes, in Web Mercator.
+        triangles: An `(n, 3)` array with the (zero-based) node indices of each triangle.
+        min_resolution: The number of cells across the mesh's largest side on the coarsest level.
+        max_resolution: The number of cells across the mesh's largest side on the finest simplified level.
+
+    """
+
+    def __init__(
+        self,
+        x: npt.ArrayLike,
+        y: npt.ArrayLike,
+        triangles: npt.ArrayLike,
+        min_resolution: int = 256,
+        max_resolution: int = 4096,
+    ) -> None:
+        import numpy as np
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        triangles = np.asarray(triangles)
+        span = max(float(x.max() - x.min()), float(y.max() - y.min())) or 1.0
+        # Level 0 is the original mesh, i.e. nothing is merged
+        self.levels = [MeshLevel(x=x, y=y, triangles=triangles, node_map=np.arange(len(x)), cell_size=0.0)]
+        weights = np.ones(len(x))
+        node_map = self.levels[0].node_map
+        resolution = max_resolution
+        with utils.timer(f"Built mesh pyramid of {len(x)} nodes in"):
+            while resolution >= min_resolution:
+                cell_size = span / resolution
+                resolution //= 2
+                new_x, new_y, new_triangles, cluster, new_weights = _cluster(
+                    x,
+                    y,
+                    triangles,
+                    weights,
+                    cell_size,
+                )
+                if len(new_x) > len(x) / 2:
+                    # Not worth it; try a coarser grid
+                    continue
+                x, y, triangles, weights = new_x, new_y, new_triangles, new_weights
+                node_map = cluster[node_map]
+                level = MeshLevel(x=x, y=y, triangles=triangles, node_map=node_map, cell_size=cell_size)
+                logger.debug(
+                    "Mesh pyramid: level %d: %d nodes, %d triangles",
+                    len(self.levels),
+                    len(x),
+                    len(triangles),
+                )
+                self.levels.append(level)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def select_level(
+        self,
+        x_range: tuple[float, float] | None,
+        y_range: tuple[float, float] | None,
+        width: int | None = None,
+        height: int | None = None,
+    ) -> int:
+        """
+        Return the coarsest level whose nodes are not further apart than the pixels of the canvas.
+
+        Parameters:
+            x_range: The visible range of x, in Web Mercator. Defaults to the extent of the mesh.
+            y_range: The visible range of y, in Web Mercator. Defaults to the extent of the mesh.
+            width: The width of the canvas in pixels. Defaults to 800.
+            height: The height of the canvas in pixels. Defaults to 600.
+
+        """
+        original = self.levels[0]
+        if x_range is None:
+            x_range = (float(original.x.min()), float(original.x.max()))
+        if y_range is None:
+            y_range = (float(original.y.min()), float(original.y.max()))
+        pixel_size = max(
+            (x_range[1] - x_range[0]) / (width or 800),
+            (y_range[1] - y_range[0]) / (height or 600),
+        )
+        for index in range(len(self.levels) - 1, 0, -1):
+            if self.levels[index].cell_size <= pixel_size:
+                return index
+        return 0
+
+
+# The pyramids are expensive to build, so keep only a couple of them around
+_PYRAMID_CACHE: cache.LRUCache[str, MeshPyramid] = cache.LRUCache(maxsize=2)
+
+
+def get_mesh_pyramid(ds: xarray.Dataset) -> MeshPyramid:
+    """
+    Return the `MeshPyramid` of the mesh of ``ds``.
+
+    The pyramid is only built once per mesh; subsequent calls return the cached instance.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+
+    """
+
+    def create() -> MeshPyramid:
+        nodes = api._get_mesh_nodes(ds)
+        return MeshPyramid(
+            x=nodes.lon.to_numpy(),
+            y=nodes.lat.to_numpy(),
+            triangles=utils.get_triangles(ds),
+        )
+
+    return _PYRAMID_CACHE.get_or_create(utils.get_mesh_hash(ds), create)
+
+
+def create_level_trimesh(
+    ds: xarray.Dataset,
+    variable: str,
+    level: int,
+    how: Restriction = "mean",
+) -> geoviews.TriMesh:
+    """
+    Create a ``geoviews.TriMesh`` of the specified `level` of the pyramid of ``ds``.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        variable: The data variable we want to visualize. Its only dimension must be `node`.
+            If empty, the trimesh only contains the geometry.
+        level: The level of the pyramid; 0 is the original mesh.
+        how: How the values of the merged nodes are combined. `mean` or `max`.
+
+    """
+    import geoviews as gv
+    import numpy as np
+    import pandas as pd
+    from cartopy import crs
+
+    if level == 0:
+        return api.create_trimesh(ds, variable=variable)
+    mesh_level = get_mesh_pyramid(ds).levels[level]
+    columns: dict[str, T.Any] = dict(lon=mesh_level.x, lat=mesh_level.y, index=np.arange(len(mesh_level.x)))
+    if variable:
+        with utils.get_read_lock(ds):
+            values = ds[variable].values
+        columns[variable] = mesh_level.restrict(values, how=how)
+    nodes = gv.Nodes(
+        pd.DataFrame(columns, copy=False),
+        kdims=["lon", "lat", "index"],
+        vdims=[variable] if variable else [],
+        crs=crs.GOOGLE_MERCATOR,
+    )
+    if variable:
+        trimesh = gv.TriMesh((mesh_level.triangles, nodes), name=variable)
+    else:
+        trimesh = gv.TriMesh((mesh_level.triangles, nodes))
+    return trimesh
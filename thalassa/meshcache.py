@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import typing as T
+
+from . import api
+from . import cache
+from . import normalization
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import xarray
+
+
+logger = logging.getLogger(__name__)
+
+# The mesh cache lives in `cache.get_cache_dir("mesh")` and contains:
+# - `sources/<key>.json`: Maps the identity of a source file (path, size, mtime) to a mesh entry
+# - `<fingerprint>/`: One directory per mesh, containing:
+#   - `meta.json`: The mesh hash and the dimensions of the connectivity
+#   - `face_nodes.npy`, `triface_nodes.npy`: The normalized (i.e. zero-based) connectivity
+#   - `x.npy`, `y.npy`: The coordinates of the nodes in Web Mercator
+# The arrays are memory-mapped when they are loaded, so reopening a mesh costs (almost) nothing.
+_META_FILE = "meta.json"
+_ARRAYS = ("face_nodes", "triface_nodes", "x", "y")
+
+
+def get_mesh_cache_dir() -> pathlib.Path:
+    """Return the directory of the mesh cache."""
+    return cache.get_cache_dir("mesh")
+
+
+def _get_source_key(source: pathlib.Path, fill_value: int | None) -> str:
+    stat = source.stat()
+    identity = f"{source.resolve()}:{stat.st_size}:{stat.st_mtime_ns}:{fill_value}"
+    return hashlib.sha1(identity.encode(), usedforsecurity=False).hexdigest()
+
+
+def _get_fingerprint(
+    ds: xarray.Dataset,
+    fmt: normalization.THALASSA_FORMATS,
+    fill_value: int | None = None,
+) -> str:
+    """
+    Return a digest which identifies the raw mesh of ``ds``.
+
+    The digest covers the coordinates of the nodes and the raw (i.e. not normalized) connectivity,
+    but not the data variables, so different output files (e.g. forecast cycles) of the same mesh
+    share a cache entry. Hashing the raw connectivity is much cheaper than normalizing it.
+    The `fill_value` changes the triangles, therefore it is part of the digest, too.
+    """
+    import numpy as np
+
+    hasher = hashlib.sha1(usedforsecurity=False)
+    # Only the mesh matters; e.g. the number of timestamps may vary between forecast cycles
+    hasher.update(f"{fmt.value}:{ds.sizes[normalization.NODE_DIM]}:{fill_value}".encode())
+    for name in (normalization.X_DIM, normalization.Y_DIM):
+        hasher.update(np.ascontiguousarray(ds[name].values).data)
+    names = [name for name in (normalization.CONNECTIVITY, "triface_nodes") if name in ds.variables]
+    if names:
+        connectivity = ds[names[0]].values
+    else:
+        # TELEMAC; the connectivity is an attribute and it has already been loaded
+        connectivity = np.asarray(ds.attrs.get("ikle2", []))
+    hasher.update(f"{connectivity.dtype}:{connectivity.shape}".encode())
+    hasher.update(np.ascontiguousarray(connectivity).data)
+    return hasher.hexdigest()
+
+
+def _save(path: pathlib.Path, normalized: xarray.Dataset) -> None:
+    import numpy as np
+
+    nodes = api._get_mesh_nodes(normalized)
+    meta: dict[str, T.Any] = dict(mesh_hash=utils.get_mesh_hash(normalized), face_nodes_dims=None)
+    arrays = dict(
+        triface_nodes=utils.get_triangles(normalized),
+        x=nodes.lon.to_numpy(),
+        y=nodes.lat.to_numpy(),
+    )
+    # Generic datasets don't need to have `face_nodes`
+    if normalization.CONNECTIVITY in normalized.variables:
+        meta["face_nodes_dims"] = list(normalized[normalization.CONNECTIVITY].dims)
+        arrays["face_nodes"] = normalized[normalization.CONNECTIVITY].values
+    # Write to a temporary directory and rename it when done; this way readers never see a partial entry
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    try:
+        for name, array in arrays.items():
+            np.save(tmp_path / f"{name}.npy", array)
+        (tmp_path / _META_FILE).write_text(json.dumps(meta))
+        os.replace(tmp_path, path)
+    except OSError:
+        # Most likely another process has created the entry in the meantime
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not path.exists():
+            raise
+
+
+def _load(path: pathlib.Path, ds: xarray.Dataset, fmt: normalization.THALASSA_FORMATS) -> xarray.Dataset:
+    import numpy as np
+
+    meta = json.loads((path / _META_FILE).read_text())
+    names = _ARRAYS if meta["face_nodes_dims"] else _ARRAYS[1:]
+    arrays = {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in names}
+    normalized = normalization.NORMALIZE_DISPATCHER[fmt](ds, fix_connectivity=False)
+    if len(arrays["x"]) != normalized.sizes[normalization.NODE_DIM]:
+        msg = f"The cached mesh has {len(arrays['x'])} nodes instead of {normalized.sizes['node']}"
+        raise ValueError(msg)
+    if meta["face_nodes_dims"]:
+        normalized[normalization.CONNECTIVITY] = (tuple(meta["face_nodes_dims"]), arrays["face_nodes"])
+    normalized["triface_nodes"] = (("triface", "three"), arrays["triface_nodes"])
+    normalized = normalization._mark_normalized(normalized)
+    # Seed the in-memory caches, so that the mesh is neither hashed nor projected again
+    mesh_hash = meta["mesh_hash"]
+    utils.set_mesh_hash(normalized, mesh_hash)
+    geometry = dict(lon=arrays["x"], lat=arrays["y"], index=np.arange(len(arrays["x"])))
+    geometry["index"].flags.writeable = False
+    api._MESH_GEOMETRY_CACHE.put(mesh_hash, geometry)
+    return normalized
+
+
+def normalize(
+    ds: xarray.Dataset,
+    source: str | os.PathLike[str] | None = None,
+    *,
+    fill_value: int | None = None,
+) -> xarray.Dataset:
+    """
+    Same as `thalassa.normalize()`, but the normalized mesh is cached on disk.
+
+    The first time a mesh is normalized, the zero-based connectivity, the triangles and the
+    projected coordinates of the nodes are written to the mesh cache (see `get_mesh_cache_dir()`).
+    Afterwards, reopening the same file or any other file on the same mesh (e.g. another forecast cycle),
+    memory-maps the cached arrays instead of reading and processing the connectivity of the file.
+
+    Parameters:
+        ds: The dataset we want to convert. It must not have been normalized already.
+        source: The path of the file ``ds`` has been opened from. Defaults to ``ds.encoding["source"]``.
+        fill_value: An additional value which marks missing vertices (see `thalassa.normalize()`).
+
+    """
+    fmt = normalization.infer_format(ds)
+    if fmt == normalization.THALASSA_FORMATS.UNKNOWN:
+        raise ValueError("Can't normalize a dataset of unknown format")
+    source = source or ds.encoding.get("source")
+    root = get_mesh_cache_dir()
+    source_file = (
+        root / "sources" / f"{_get_source_key(pathlib.Path(source), fill_value)}.json" if source else None
+    )
+    fingerprint = cached_fingerprint = None
+    if source_file is not None and source_file.exists():
+        fingerprint = cached_fingerprint = json.loads(source_file.read_text())["mesh"]
+    if fingerprint is None or not (root / fingerprint).exists():
+        renamed = normalization.NORMALIZE_DISPATCHER[fmt](ds, fix_connectivity=False)
+        fingerprint = _get_fingerprint(renamed, fmt, fill_value)
+    path = root / fingerprint
+    normalized = None
+    if path.exists():
+        try:
+            with utils.timer(f"Loaded cached mesh {fingerprint} in"):
+                normalized = _load(path, ds, fmt)
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("Ignoring invalid mesh cache entry: %s: %s", path, exc)
+            shutil.rmtree(path, ignore_errors=True)
+    if normalized is None:
+        normalized = normalization.normalize(ds, fill_value=fill_value)
+        with utils.timer(f"Cached mesh {fingerprint} in"):
+            _save(path, normalized)
+    if source_file is not None and fingerprint != cached_fingerprint:
+        source_file.parent.mkdir(exist_ok=True)
+        source_file.write_text(json.dumps(dict(mesh=fingerprint)))
+    return normalized
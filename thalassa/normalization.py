@@ -1,14 +1,19 @@
 from __future__ import annotations
 
 import enum
+import json
 import logging
+import os
 import pathlib
+import struct
+import threading
 import typing
 
 if typing.TYPE_CHECKING:  # pragma: no cover
     import xarray
 
 from . import api
+from . import cache
 from . import utils
 
 
@@ -83,31 +88,59 @@ _ADCIRC_VARS = {
 }
 # fmt: on
 
+# Normalized datasets are marked with this attribute, so that normalizing them again is free
+SCHEMA_ATTR = "thalassa_schema"
+SCHEMA_VERSION = "1"
 
-def is_generic(ds: xarray.Dataset) -> bool:
+
+class _Header:
+    """
+    The names of the dimensions, variables and attributes of a file, as `xarray` would report them.
+
+    It quacks like an `xarray.Dataset` as far as the `is_*()` functions are concerned, but it is
+    populated by reading the header of the file only.
+    """
+
+    def __init__(
+        self,
+        dims: typing.Iterable[str],
+        data_vars: typing.Iterable[str],
+        coords: typing.Iterable[str] = (),
+        attrs: typing.Iterable[str] = (),
+    ) -> None:
+        self.dims = dict.fromkeys(dims)
+        self.data_vars = dict.fromkeys(data_vars)
+        self.coords = dict.fromkeys(coords)
+        self.attrs = dict.fromkeys(attrs)
+
+
+DatasetLike = typing.Union["xarray.Dataset", _Header]
+
+
+def is_generic(ds: DatasetLike) -> bool:
     total_vars = list(ds.data_vars.keys()) + list(ds.coords.keys())
     return _GENERIC_DIMS.issubset(ds.dims) and _GENERIC_VARS.issubset(total_vars)
 
 
-def is_schism(ds: xarray.Dataset) -> bool:
+def is_schism(ds: DatasetLike) -> bool:
     total_vars = list(ds.data_vars.keys()) + list(ds.coords.keys())
     return _SCHISM_DIMS.issubset(ds.dims) and _SCHISM_VARS.issubset(total_vars)
 
 
-def is_telemac(ds: xarray.Dataset) -> bool:
+def is_telemac(ds: DatasetLike) -> bool:
     total_vars = list(ds.data_vars.keys()) + list(ds.coords.keys()) + list(ds.attrs.keys())
     return _TELEMAC_DIMS.issubset(ds.dims) and _TELEMAC_VARS.issubset(total_vars)
 
 
-def is_pyposeidon(ds: xarray.Dataset) -> bool:
+def is_pyposeidon(ds: DatasetLike) -> bool:
     return _PYPOSEIDON_DIMS.issubset(ds.dims) and _PYPOSEIDON_VARS.issubset(ds.data_vars)
 
 
-def is_adcirc(ds: xarray.Dataset) -> bool:
+def is_adcirc(ds: DatasetLike) -> bool:
     return _ADCIRC_DIMS.issubset(ds.dims) and _ADCIRC_VARS.issubset(ds.data_vars)
 
 
-def infer_format(ds: xarray.Dataset) -> THALASSA_FORMATS:
+def infer_format(ds: DatasetLike) -> THALASSA_FORMATS:
     if is_schism(ds):
         fmt = THALASSA_FORMATS.SCHISM
     elif is_telemac(ds):
@@ -124,25 +157,209 @@ def infer_format(ds: xarray.Dataset) -> THALASSA_FORMATS:
     return fmt
 
 
-def can_be_inferred(path: str | pathlib.Path) -> bool:
-    logger.debug("Trying to open: %s", path)
+_NETCDF_MAGIC = (b"CDF\x01", b"CDF\x02", b"CDF\x05", b"\x89HDF\r\n\x1a\n")
+# The title of a Selafin file is an 80 characters long Fortran record; the record
+# starts with its length as a 4-byte integer, either big or little endian.
+_SELAFIN_MAGIC = (struct.pack(">i", 80), struct.pack("<i", 80))
+
+
+def _read_netcdf_header(path: str | os.PathLike[str]) -> _Header:
+    import netCDF4
+
+    with netCDF4.Dataset(path) as nc:
+        variables = set(nc.variables) - set(api.ADCIRC_VARIABLES_TO_BE_DROPPED)
+        # Mimic xarray: dimension variables and the variables listed in a `coordinates`
+        # attribute become coordinates.
+        coords = {name for name in variables if name in nc.dimensions}
+        for name in variables:
+            coords.update(getattr(nc.variables[name], "coordinates", "").split())
+        coords &= variables
+        return _Header(
+            dims=nc.dimensions,
+            data_vars=variables - coords,
+            coords=coords,
+            attrs=nc.ncattrs(),
+        )
+
+
+def _read_fortran_record(stream: typing.BinaryIO, endian: str) -> bytes:
+    (size,) = struct.unpack(f"{endian}i", stream.read(4))
+    if size < 0 or size > 1024:
+        raise ValueError(f"Invalid record size: {size}")
+    record = stream.read(size)
+    if len(record) != size or stream.read(4) != struct.pack(f"{endian}i", size):
+        raise ValueError("Truncated record")
+    return record
+
+
+def _read_selafin_header(path: str | os.PathLike[str]) -> _Header:
+    """Parse the Selafin header up to the number of nodes, i.e. skip the connectivity and the data."""
+    with open(path, "rb") as stream:
+        endian = ">" if stream.read(4) == _SELAFIN_MAGIC[0] else "<"
+        stream.seek(0)
+        _read_fortran_record(stream, endian)  # title
+        no_vars_1, no_vars_2 = struct.unpack(f"{endian}2i", _read_fortran_record(stream, endian))
+        for _ in range(no_vars_1 + no_vars_2):
+            _read_fortran_record(stream, endian)  # the names and the units of the variables
+        params = struct.unpack(f"{endian}10i", _read_fortran_record(stream, endian))
+        if params[9] == 1:
+            _read_fortran_record(stream, endian)  # the start date
+        _, no_nodes, no_vertices, _ = struct.unpack(f"{endian}4i", _read_fortran_record(stream, endian))
+    if no_nodes <= 0 or no_vertices not in (3, 4, 6):
+        raise ValueError(f"Invalid Selafin header: {no_nodes} nodes, {no_vertices} vertices per element")
+    # `xarray-selafin` exposes the nodes as `x`/`y` and the connectivity as the `ikle2` attribute
+    return _Header(dims=["node"], data_vars=[], coords=["x", "y"], attrs=["ikle2"])
+
+
+def _read_header(path: str | os.PathLike[str]) -> _Header | None:
+    """Return the header of `path` or `None` if the file is not a netCDF/HDF5/Selafin file."""
+    with open(path, "rb") as stream:
+        magic = stream.read(8)
     try:
-        ds = api.open_dataset(path, normalize=False)
-    except ValueError:
-        return False
-    fmt = infer_format(ds)
-    if fmt == THALASSA_FORMATS.UNKNOWN:
-        result = False
+        if magic.startswith(_NETCDF_MAGIC):
+            return _read_netcdf_header(path)
+        if magic[:4] in _SELAFIN_MAGIC:
+            return _read_selafin_header(path)
+    except ImportError:
+        logger.debug("Can't read the header without netCDF4, falling back to xarray: %s", path)
+    except (OSError, ValueError, struct.error) as exc:
+        logger.debug("Failed to read the header of %s: %s", path, exc)
+    return None
+
+
+class _FormatCache:
+    """
+    An on-disk cache of the formats of the files, keyed by path, size and modification time.
+
+    The cache is a small JSON file in `thalassa.cache.get_cache_dir()`, so scanning the same
+    directory again (even from a different process) doesn't need to read the files at all.
+    """
+
+    # Bump this if the detection logic changes in a way that invalidates the cached formats
+    version = 1
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._path: pathlib.Path | None = None
+        self._entries: dict[str, list[typing.Any]] = {}
+
+    @property
+    def path(self) -> pathlib.Path:
+        return cache.get_cache_dir() / "formats.json"
+
+    def _load(self) -> dict[str, list[typing.Any]]:
+        # The cache directory might have changed, e.g. via `THALASSA_CACHE_DIR`
+        if self._path != (path := self.path):
+            try:
+                contents = json.loads(path.read_text())
+                entries = contents["entries"] if contents.get("version") == self.version else {}
+            except (OSError, ValueError, KeyError, AttributeError):
+                entries = {}
+            self._path, self._entries = path, entries
+        return self._entries
+
+    def get(self, key: str, stat: os.stat_result) -> THALASSA_FORMATS | None:
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return THALASSA_FORMATS(entry[2])
+        return None
+
+    def put(self, key: str, stat: os.stat_result, fmt: THALASSA_FORMATS) -> None:
+        with self._lock:
+            entries = self._load()
+            entries[key] = [stat.st_size, stat.st_mtime_ns, fmt.value]
+            # Write atomically, so that concurrent readers never see a partial file
+            tmp = self.path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            try:
+                tmp.write_text(json.dumps(dict(version=self.version, entries=entries)))
+                os.replace(tmp, self.path)
+            except OSError as exc:
+                logger.warning("Failed to update the format cache: %s: %s", self.path, exc)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._path, self._entries = None, {}
+            self.path.unlink(missing_ok=True)
+
+
+_FORMAT_CACHE = _FormatCache()
+
+
+def sniff_format(path: str | os.PathLike[str], use_cache: bool = True) -> THALASSA_FORMATS:
+    """
+    Return the format of the file at `path` without loading the file.
+
+    Only the header of netCDF/HDF5 and Selafin files is read; other files (e.g. zarr or grib)
+    are opened with `xarray`. The result is cached on disk, keyed by the path, the size and the
+    modification time of the file (see `thalassa.cache.get_cache_dir()`).
+
+    Parameters:
+        path: The path to the file.
+        use_cache: Whether the result should be read from/written to the disk cache.
+
+    """
+    path = pathlib.Path(path)
+    stat = path.stat()
+    key = str(path.resolve())
+    if use_cache and (fmt := _FORMAT_CACHE.get(key, stat)) is not None:
+        logger.debug("Format of %s (cached): %s", path, fmt)
+        return fmt
+    header = _read_header(path) if path.is_file() else None
+    if header is not None:
+        fmt = infer_format(header)
     else:
-        result = True
-    return result
+        logger.debug("Trying to open: %s", path)
+        try:
+            fmt = infer_format(api.open_dataset(path, normalize=False))
+        except (OSError, ValueError):
+            # no suitable engine or a corrupted file
+            fmt = THALASSA_FORMATS.UNKNOWN
+    if use_cache:
+        _FORMAT_CACHE.put(key, stat, fmt)
+    return fmt
+
+
+def can_be_inferred(path: str | pathlib.Path, use_cache: bool = True) -> bool:
+    """
+    Return `True` if `path` can be opened and normalized by thalassa.
+
+    Only the header of the file is read and the result is cached; see `sniff_format()`.
 
+    Parameters:
+        path: The path to the file.
+        use_cache: Whether the result should be read from/written to the disk cache.
+
+    """
+    return sniff_format(path, use_cache=use_cache) != THALASSA_FORMATS.UNKNOWN
+
+
+# The formats whose connectivity is converted to zero-based indices by their normalizer
+_ONE_BASED_FORMATS = (THALASSA_FORMATS.ADCIRC, THALASSA_FORMATS.SCHISM, THALASSA_FORMATS.TELEMAC)
+
+
+# The `fix_connectivity` argument of the normalizers controls whether the connectivity gets converted
+# to zero-based indices. It is `False` when the normalized connectivity is loaded from the mesh cache.
+def _to_zero_based(connectivity: xarray.DataArray) -> xarray.DataArray:
+    """
+    Convert one-based indices to zero-based ones.
+
+    Unless the connectivity is already in memory (e.g. TELEMAC), the conversion is deferred until
+    the data are needed (see `utils.get_triangles()`).
+    """
+    import numpy as np
+
+    # `Variable._data` is the (possibly lazy) array of the variable; `.data` would load it
+    if connectivity.chunks is None and not isinstance(connectivity.variable._data, np.ndarray):
+        connectivity = connectivity.chunk("auto")
+    return connectivity.copy(data=connectivity.data - 1)
 
-def normalize_generic(ds: xarray.Dataset) -> xarray.Dataset:
+
+def normalize_generic(ds: xarray.Dataset, fix_connectivity: bool = True) -> xarray.Dataset:
     return ds
 
 
-def normalize_schism(ds: xarray.Dataset) -> xarray.Dataset:
+def normalize_schism(ds: xarray.Dataset, fix_connectivity: bool = True) -> xarray.Dataset:
     ds = ds.rename(
         {
             "nSCHISM_hgrid_edge": EDGE_DIM,
@@ -163,11 +380,12 @@ def normalize_schism(ds: xarray.Dataset) -> xarray.Dataset:
         )
     # SCHISM output uses one-based indices for `face_nodes`
     # Let's ensure that we use zero-based indices everywhere.
-    ds[CONNECTIVITY] -= 1
+    if fix_connectivity:
+        ds[CONNECTIVITY] = _to_zero_based(ds[CONNECTIVITY])
     return ds
 
 
-def normalize_telemac(ds: xarray.Dataset) -> xarray.Dataset:
+def normalize_telemac(ds: xarray.Dataset, fix_connectivity: bool = True) -> xarray.Dataset:
     ds = ds.rename(
         {
             "node": NODE_DIM,
@@ -184,11 +402,14 @@ def normalize_telemac(ds: xarray.Dataset) -> xarray.Dataset:
 
     # TELEMAC output uses one-based indices for `face_nodes`
     # Let's ensure that we use zero-based indices everywhere.
-    ds[CONNECTIVITY] = ((FACE_DIM, VERTICE_DIM), ds.attrs['ikle2'] - 1)
+    if fix_connectivity:
+        import xarray as xr
+
+        ds[CONNECTIVITY] = _to_zero_based(xr.DataArray(ds.attrs["ikle2"], dims=(FACE_DIM, VERTICE_DIM)))
     return ds
 
 
-def normalize_pyposeidon(ds: xarray.Dataset) -> xarray.Dataset:
+def normalize_pyposeidon(ds: xarray.Dataset, fix_connectivity: bool = True) -> xarray.Dataset:
     ds = ds.rename(
         {
             "nSCHISM_hgrid_face": FACE_DIM,
@@ -202,7 +423,7 @@ def normalize_pyposeidon(ds: xarray.Dataset) -> xarray.Dataset:
     return ds
 
 
-def normalize_adcirc(ds: xarray.Dataset) -> xarray.Dataset:
+def normalize_adcirc(ds: xarray.Dataset, fix_connectivity: bool = True) -> xarray.Dataset:
     ds = ds.rename(
         {
             "x": X_DIM,
@@ -214,7 +435,8 @@ def normalize_adcirc(ds: xarray.Dataset) -> xarray.Dataset:
     )
     # ADCIRC output uses one-based indices for `face_nodes`
     # Let's ensure that we use zero-based indices everywhere.
-    ds[CONNECTIVITY] -= 1
+    if fix_connectivity:
+        ds[CONNECTIVITY] = _to_zero_based(ds[CONNECTIVITY])
     return ds
 
 
@@ -227,10 +449,25 @@ NORMALIZE_DISPATCHER = {
 }
 
 
-def normalize(ds: xarray.Dataset) -> xarray.Dataset:
+def is_normalized(ds: xarray.Dataset) -> bool:
+    """Return `True` if ``ds`` has been normalized by `normalize()`."""
+    return ds.attrs.get(SCHEMA_ATTR) == SCHEMA_VERSION and is_generic(ds)
+
+
+def _mark_normalized(ds: xarray.Dataset) -> xarray.Dataset:
+    # `assign_attrs()` returns a copy; the attributes of the source dataset are left alone
+    return ds.assign_attrs({SCHEMA_ATTR: SCHEMA_VERSION})
+
+
+def normalize(ds: xarray.Dataset, *, fill_value: int | None = None) -> xarray.Dataset:
     """
     Normalize the `dataset` i.e. convert it to the "Thalassa Schema".
 
+    Normalization is lazy: Nothing is loaded, except for the connectivity of meshes with quads/polygons,
+    which is read once in order to count their triangles (the count determines the length of `triface_nodes`).
+    The splitting of the quads is a `dask` operation which is only evaluated when `triface_nodes`
+    is needed (see `load_mesh()`). Normalizing an already normalized dataset returns it as is.
+
     Examples:
         ``` python
         import thalassa
@@ -243,8 +480,14 @@ def normalize(ds: xarray.Dataset) -> xarray.Dataset:
 
     Parameters:
         ds: The dataset we want to convert.
+        fill_value: An additional value which marks the missing vertices of quads/polygons, besides
+            `nan` and negative values. It is the value which is stored in the file (e.g. `999999`),
+            i.e. it is compared to the connectivity before the conversion to zero-based indices.
 
     """
+    if is_normalized(ds):
+        logger.debug("Dataset normalization: Already normalized")
+        return ds
     logger.debug("Dataset normalization: Started")
     fmt = infer_format(ds)
     normalizer_func = NORMALIZE_DISPATCHER[fmt]
@@ -257,10 +500,35 @@ def normalize(ds: xarray.Dataset) -> xarray.Dataset:
     # I'd rather avoid altering the values of the provided netcdf file therefore we go for option #2,
     # i.e. we create the `triface_nodes` variable.
     if "triface_nodes" not in ds.data_vars:
-        if "max_no_vertices" in normalized_ds.dims and len(normalized_ds.max_no_vertices) == 4:
-            triface_nodes = utils.split_quads(normalized_ds.face_nodes.values)
+        face_nodes = normalized_ds.face_nodes.data
+        if normalized_ds.sizes.get("max_no_vertices", 3) > 3:
+            if fill_value is not None and fmt in _ONE_BASED_FORMATS:
+                # The fill value of the file has been shifted, too
+                fill_value -= 1
+            triface_nodes = utils.triangulate(
+                face_nodes,
+                fill_value=fill_value,
+                no_nodes=normalized_ds.sizes[NODE_DIM],
+            )
         else:
-            triface_nodes = normalized_ds.face_nodes.values
-        normalized_ds["triface_nodes"] = (("triface", "three"), triface_nodes)
+            triface_nodes = face_nodes
+        normalized_ds = normalized_ds.assign(triface_nodes=(("triface", "three"), triface_nodes))
+    if normalized_ds is not ds:
+        normalized_ds = _mark_normalized(normalized_ds)
     logger.debug("Dataset normalization: Finished")
     return normalized_ds
+
+
+def load_mesh(ds: xarray.Dataset) -> xarray.Dataset:
+    """
+    Load the (deferred) `triface_nodes` of a normalized dataset in memory and return the dataset.
+
+    Just like `xarray.Dataset.load()`, the dataset is modified in place, so the connectivity is only
+    computed once.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+
+    """
+    utils.get_triangles(ds)
+    return ds
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from typing import Literal
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:  # pragma: no cover
@@ -14,7 +15,7 @@ from . import normalization
 logger = logging.getLogger(__name__)
 
 
-def _sanity_check(ds: xarray.Dataset, variable: str) -> None:
+def _sanity_check(ds: xarray.Dataset, variable: str, animate: Literal["time"] | None = None) -> None:
     dims = ds[variable].dims
     if "node" not in dims:
         msg = (
@@ -22,7 +23,14 @@ def _sanity_check(ds: xarray.Dataset, variable: str) -> None:
             f"The dimensions of variable '{variable}' are: {ds[variable].dims}"
         )
         raise ValueError(msg)
-    if dims != ("node",):
+    if animate == "time":
+        if dims != ("time", "node"):
+            msg = (
+                f"In order to animate variable '{variable}', its dimensions must be `(time, node)`. "
+                f"Current dimensions are: {ds[variable].dims}"
+            )
+            raise ValueError(msg)
+    elif dims != ("node",):
         msg = (
             f"In order to plot variable '{variable}', the dataset must be filtered in such a way "
             f"that the only dimension of '{variable}' is `node`. Please use `.sel()` or `.isel()` "
@@ -94,7 +102,7 @@ def plot_mesh(
     """
     import holoviews as hv
 
-    ds = normalization.normalize(ds)
+    ds = normalization.load_mesh(normalization.normalize(ds))
     tiles = api.get_tiles()
     mesh = api.get_wireframe(ds, x_range=x_range, y_range=y_range, hover=True)
     overlay = hv.Overlay((tiles, mesh)).opts(title=title).collate()
@@ -116,6 +124,10 @@ def plot(
     show_mesh: bool = False,
     show_nodes: bool = False,
     node_size: float = 3,
+    animate: Literal["time"] | None = None,
+    prefetch: int = 2,
+    lod: bool = False,
+    viewport: bool = False,
 ) -> geoviews.DynamicMap:
     """
     Return the plot of the specified `variable`.
@@ -148,6 +160,16 @@ def plot(
         thalassa.plot(ds, variable="zeta", clim_min=1, clim_max=3, clabel="meter")
         ```
 
+        Alternatively, we can animate a time dependent variable. The mesh is only processed once
+        and a slider allows to select the timestamp:
+
+        ``` python
+        import thalassa
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        thalassa.plot(ds, variable="zeta", animate="time")
+        ```
+
     Parameters:
         ds: The dataset which will get visualized. It must adhere to the "thalassa schema".
         variable: The dataset's variable which we want to visualize.
@@ -164,15 +186,34 @@ def plot(
         show_nodes: A boolean flag indicating whether the nodes should be overlaid on top of the data.
             Enabling this makes rendering slower.
         node_size: A float value indicating the size of the nodes. Only used if `show_nodes=True`.
+        animate: If `"time"`, then `variable` must have `(time, node)` dimensions and the plot
+            gets a slider for selecting the timestamp. Only the values of the selected timestamp are loaded.
+        prefetch: The number of timestamps that are loaded in advance. Only used if `animate="time"`.
+        lod: A boolean flag indicating whether a simplified version of the mesh should be displayed
+            when zoomed out. Useful for large meshes. Can't be combined with `animate`.
+        viewport: A boolean flag indicating whether only the part of the mesh which is visible should be
+            loaded and rasterized. Useful when zooming into large meshes. Can't be combined with `animate` or `lod`.
 
     """
     import holoviews as hv
 
-    ds = normalization.normalize(ds)
-    _sanity_check(ds=ds, variable=variable)
-    trimesh = api.create_trimesh(ds_or_trimesh=ds, variable=variable)
+    ds = normalization.load_mesh(normalization.normalize(ds))
+    _sanity_check(ds=ds, variable=variable, animate=animate)
+    if lod and animate:
+        raise ValueError("`lod` can't be combined with `animate`")
+    if viewport and animate:
+        raise ValueError("`viewport` can't be combined with `animate`")
+    if lod or viewport:
+        # The level of detail is chosen according to the current view, so pass the dataset around
+        source = trimesh = ds
+    elif animate == "time":
+        source = api.create_time_trimesh(ds, variable=variable, prefetch=prefetch)
+        # The overlays only need the geometry of the mesh
+        trimesh = api.create_trimesh(ds_or_trimesh=ds)
+    else:
+        source = trimesh = api.create_trimesh(ds_or_trimesh=ds, variable=variable)
     raster = api.get_raster(
-        ds_or_trimesh=trimesh,
+        ds_or_trimesh=source,
         variable=variable,
         x_range=x_range,
         y_range=y_range,
@@ -182,14 +223,23 @@ def plot(
         clim_max=clim_max,
         title=title,
         clabel=clabel,
+        lod=lod,
+        viewport=viewport,
     )
     tiles = api.get_tiles()
     components = [tiles, raster]
     if show_mesh:
-        mesh = api.get_wireframe(trimesh, x_range=x_range, y_range=y_range, hover=False)
+        mesh = api.get_wireframe(trimesh, x_range=x_range, y_range=y_range, hover=False, lod=lod)
         components.append(mesh)
     if show_nodes:
-        nodes = api.get_nodes(trimesh, x_range=x_range, y_range=y_range, hover=True, size=node_size)
+        nodes = api.get_nodes(
+            trimesh,
+            x_range=x_range,
+            y_range=y_range,
+            hover=True,
+            size=node_size,
+            lod=lod,
+        )
         components.append(nodes)
     overlay = hv.Overlay(components)
     dmap = overlay.collate()
@@ -202,6 +252,7 @@ def plot_ts(
     ds: xarray.Dataset,
     variable: str,
     source_plot: geoviews.DynamicMap,
+    interpolation: Literal["nearest", "barycentric"] = "nearest",
 ) -> geoviews.DynamicMap:
     """
     Return a plot with the full timeseries of a specific node.
@@ -224,7 +275,10 @@ def plot_ts(
         variable: The dataset's variable which we want to visualize.
         source_plot: The plot instance which be used to select the coordinates of the node.
             Normally, you get this instance by calling `plot()`.
+        interpolation: Either `nearest`, which displays the timeseries of the node which is the closest
+            to the selected point, or `barycentric`, which interpolates the timeseries from the three
+            nodes of the triangle that contains the selected point.
     """
     ds = normalization.normalize(ds)
-    ts = api.get_tap_timeseries(ds, variable, source_plot._raster)
+    ts = api.get_tap_timeseries(ds, variable, source_plot._raster, interpolation=interpolation)
     return ts
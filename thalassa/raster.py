@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import typing as T
+
+from . import api
+from . import cache
+from . import spatial
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import numpy.typing as npt
+    import scipy.sparse
+    import xarray
+
+
+logger = logging.getLogger(__name__)
+
+# `(xmin, ymin, xmax, ymax)` in Web Mercator, i.e. the CRS of the plots
+Extent = tuple[float, float, float, float]
+
+
+class RasterWeights:
+    """
+    The barycentric interpolation weights of every pixel of a fixed canvas.
+
+    The weights are stored as a sparse `(height * width, node)` matrix. Each pixel whose center
+    is contained in a triangle of the mesh has three entries, i.e. the barycentric weights of
+    the triangle's nodes. Therefore, rasterizing the values of the nodes is a single sparse
+    matrix-vector product, which is much cheaper than scan-converting the triangles anew.
+
+    The rows of the image are ordered from south to north, i.e. the same way as ``datashader``.
+
+    Parameters:
+        matrix: The sparse `(height * width, node)` weight matrix.
+        extent: The extent of the canvas, `(xmin, ymin, xmax, ymax)` in Web Mercator.
+        width: The number of pixels in the x direction.
+        height: The number of pixels in the y direction.
+
+    """
+
+    def __init__(
+        self,
+        matrix: scipy.sparse.csr_matrix,
+        extent: Extent,
+        width: int,
+        height: int,
+    ) -> None:
+        import numpy as np
+
+        if matrix.shape[0] != width * height:
+            msg = f"The matrix has {matrix.shape[0]} rows, but the canvas has {width * height} pixels"
+            raise ValueError(msg)
+        self.matrix = matrix
+        self.extent = extent
+        self.width = width
+        self.height = height
+        self.covered = np.diff(matrix.indptr) > 0
+
+    @property
+    def x(self) -> npt.NDArray[numpy.float64]:
+        """The x coordinates of the centers of the pixels."""
+        return _pixel_centers(self.extent[0], self.extent[2], self.width)
+
+    @property
+    def y(self) -> npt.NDArray[numpy.float64]:
+        """The y coordinates of the centers of the pixels."""
+        return _pixel_centers(self.extent[1], self.extent[3], self.height)
+
+    def render(self, values: npt.ArrayLike, name: str | None = None) -> xarray.DataArray:
+        """
+        Return a `(y, x)` ``DataArray`` with the rasterized `values` of the nodes.
+
+        Pixels outside of the mesh are `nan`.
+        """
+        import numpy as np
+        import xarray as xr
+
+        values = np.asarray(values)
+        if values.shape != (self.matrix.shape[1],):
+            raise ValueError(f"Expected {self.matrix.shape[1]} node values, not: {values.shape}")
+        with utils.timer(f"Rendered {self.width}x{self.height} raster in"):
+            pixels = self.matrix @ values
+        pixels[~self.covered] = np.nan
+        image = xr.DataArray(
+            pixels.reshape(self.height, self.width),
+            dims=("y", "x"),
+            coords=dict(x=self.x, y=self.y),
+            name=name,
+        )
+        return image
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Save the weights to `path` (an ``.npz`` file)."""
+        import numpy as np
+
+        np.savez(
+            path,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            shape=np.array(self.matrix.shape),
+            extent=np.array(self.extent),
+            size=np.array([self.width, self.height]),
+        )
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> RasterWeights:
+        """Load weights which have been saved with `save()`."""
+        import numpy as np
+        import scipy.sparse
+
+        with np.load(path) as npz:
+            matrix = scipy.sparse.csr_matrix(
+                (npz["data"], npz["indices"], npz["indptr"]),
+                shape=tuple(npz["shape"]),
+            )
+            xmin, ymin, xmax, ymax = (float(value) for value in npz["extent"])
+            width, height = (int(value) for value in npz["size"])
+        return cls(matrix=matrix, extent=(xmin, ymin, xmax, ymax), width=width, height=height)
+
+
+def _pixel_centers(start: float, stop: float, size: int) -> npt.NDArray[numpy.float64]:
+    import numpy as np
+
+    step = (stop - start) / size
+    return T.cast("npt.NDArray[numpy.float64]", start + (np.arange(size) + 0.5) * step)
+
+
+def compute_raster_weights(
+    x: npt.ArrayLike,
+    y: npt.ArrayLike,
+    triangles: npt.ArrayLike,
+    extent: Extent,
+    width: int,
+    height: int,
+) -> RasterWeights:
+    """
+    Compute the barycentric weights of the centers of the pixels of a `width` x `height` canvas.
+
+    Parameters:
+        x: The x coordinates of the nodes, in the CRS of `extent`.
+        y: The y coordinates of the nodes, in the CRS of `extent`.
+        triangles: An `(n, 3)` array with the (zero-based) node indices of each triangle.
+        extent: The extent of the canvas: `(xmin, ymin, xmax, ymax)`.
+        width: The number of pixels in the x direction.
+        height: The number of pixels in the y direction.
+
+    """
+    import numpy as np
+    import scipy.sparse
+
+    if width <= 0 or height <= 0:
+        raise ValueError(f"The size of the canvas must be positive: {width}x{height}")
+    locator = spatial.TriangleLocator(x, y, triangles)
+    xmin, ymin, xmax, ymax = extent
+    px, py = np.meshgrid(_pixel_centers(xmin, xmax, width), _pixel_centers(ymin, ymax, height))
+    with utils.timer(f"Computed the weights of {width}x{height} pixels in"):
+        found, weights = locator.locate(px.ravel(), py.ravel())
+        covered = found >= 0
+        indptr = np.zeros(width * height + 1, dtype=np.int64)
+        np.cumsum(covered * 3, out=indptr[1:])
+        matrix = scipy.sparse.csr_matrix(
+            (weights[covered].ravel(), locator.triangles[found[covered]].ravel(), indptr),
+            shape=(width * height, len(locator.x)),
+        )
+    return RasterWeights(matrix=matrix, extent=extent, width=width, height=height)
+
+
+# Weights which have been computed or loaded from the disk cache.
+_RASTER_WEIGHTS_CACHE: cache.LRUCache[str, RasterWeights] = cache.LRUCache(maxsize=8)
+
+
+def get_mesh_extent(ds: xarray.Dataset) -> Extent:
+    """Return the extent of the mesh of ``ds`` in Web Mercator."""
+    nodes = api._get_mesh_nodes(ds)
+    return (float(nodes.lon.min()), float(nodes.lat.min()), float(nodes.lon.max()), float(nodes.lat.max()))
+
+
+def get_raster_weights(
+    ds: xarray.Dataset,
+    width: int,
+    height: int,
+    extent: Extent | None = None,
+    *,
+    use_disk_cache: bool = True,
+) -> RasterWeights:
+    """
+    Return the `RasterWeights` of the mesh of ``ds`` for a `width` x `height` canvas.
+
+    The weights only depend on the mesh, the `extent` and the size of the canvas. They are cached
+    in memory and, optionally, on disk (see `thalassa.cache.get_cache_dir()`), so rendering the same
+    product for another timestep or another run on the same mesh skips the computation altogether.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        width: The number of pixels in the x direction.
+        height: The number of pixels in the y direction.
+        extent: The extent of the canvas, `(xmin, ymin, xmax, ymax)` in Web Mercator.
+            Defaults to the extent of the mesh.
+        use_disk_cache: Whether the weights should be read from/written to the disk cache.
+
+    """
+    if extent is None:
+        extent = get_mesh_extent(ds)
+    extent = T.cast(Extent, tuple(float(value) for value in extent))
+    identity = repr((utils.get_mesh_hash(ds), extent, width, height))
+    key = hashlib.sha1(identity.encode(), usedforsecurity=False).hexdigest()
+
+    def create() -> RasterWeights:
+        path = cache.get_cache_dir("raster") / f"{key}.npz" if use_disk_cache else None
+        if path is not None and path.exists():
+            try:
+                with utils.timer(f"Loaded raster weights from {path} in"):
+                    return RasterWeights.load(path)
+            except (OSError, ValueError, KeyError) as exc:
+                logger.warning("Ignoring invalid raster weights: %s: %s", path, exc)
+        nodes = api._get_mesh_nodes(ds)
+        weights = compute_raster_weights(
+            x=nodes.lon.to_numpy(),
+            y=nodes.lat.to_numpy(),
+            triangles=utils.get_triangles(ds),
+            extent=extent,
+            width=width,
+            height=height,
+        )
+        if path is not None:
+            # Write to a temporary file and rename it when done; this way readers never see a partial file
+            tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+            weights.save(tmp_path)
+            os.replace(tmp_path, path)
+        return weights
+
+    return _RASTER_WEIGHTS_CACHE.get_or_create(key, create)
+
+
+def render(
+    ds: xarray.Dataset,
+    variable: str,
+    width: int,
+    height: int,
+    extent: Extent | None = None,
+    *,
+    use_disk_cache: bool = True,
+) -> xarray.DataArray:
+    """
+    Rasterize `variable` on a `width` x `height` canvas using precomputed weights.
+
+    This is an alternative to ``datashader`` for rendering the same mesh with the same
+    extent and resolution many times, e.g. for every timestep of an operational product.
+
+    Examples:
+        ``` python
+        import thalassa
+        from thalassa import raster
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        image = raster.render(ds.isel(time=0), "zeta", width=1000, height=800)
+        # When rendering many timesteps, get the weights once and only pass the values
+        weights = raster.get_raster_weights(ds, width=1000, height=800)
+        for i in range(len(ds.time)):
+            image = weights.render(ds.zeta.isel(time=i).values, name="zeta")
+        ```
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        variable: The variable to render. Its only dimension must be `node`.
+        width: The number of pixels in the x direction.
+        height: The number of pixels in the y direction.
+        extent: The extent of the canvas, `(xmin, ymin, xmax, ymax)` in Web Mercator.
+            Defaults to the extent of the mesh.
+        use_disk_cache: Whether the weights should be read from/written to the disk cache.
+
+    """
+    if ds[variable].dims != ("node",):
+        msg = f"Only variables whose only dimension is `node` can be rendered: {variable}: {ds[variable].dims}"
+        raise ValueError(msg)
+    weights = get_raster_weights(
+        ds,
+        width=width,
+        height=height,
+        extent=extent,
+        use_disk_cache=use_disk_cache,
+    )
+    return weights.render(ds[variable].values, name=variable)
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import logging
+import os
+import pathlib
+import re
+import tempfile
+import typing as T
+import warnings
+
+from . import store
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import numpy.typing as npt
+    import xarray
+
+    Array = npt.NDArray[numpy.float64]
+
+
+logger = logging.getLogger(__name__)
+
+# Reductions which can be computed in a single streaming pass over the timestamps
+_MOMENT_OPS = {"max", "min", "sum", "mean", "std", "count"}
+# e.g. `p99`, `p99.9`
+_PERCENTILE_RE = re.compile(r"^p(\d+(?:\.\d+)?)$")
+# The bytes per value which each worker needs on top of the loaded chunk: The float64 copy
+# of `_Moments.update()` plus its two boolean masks, and the float64 copy which `nanpercentile()` sorts
+_MOMENTS_OVERHEAD = 8 + 2
+_PERCENTILES_OVERHEAD = 8 + 8
+
+
+class _Moments:
+    """
+    Accumulate the running max/min/count/mean/M2 of the nodes, ignoring `nan` values.
+
+    Partial results of different time blocks are combined with `merge()`, using the parallel
+    algorithm of Chan et al. for the mean and the variance.
+    """
+
+    def __init__(self, size: int) -> None:
+        import numpy as np
+
+        self.max = np.full(size, np.nan)
+        self.min = np.full(size, np.nan)
+        self.count = np.zeros(size)
+        self.mean = np.zeros(size)
+        self.m2 = np.zeros(size)
+
+    def _combine(self, count: Array, mean: Array, m2: Array) -> None:
+        import numpy as np
+
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean
+            ratio = np.where(total > 0, count / total, 0)
+            self.mean = self.mean + delta * ratio
+            self.m2 = self.m2 + m2 + delta**2 * self.count * ratio
+        self.count = total
+
+    def update(self, chunk: Array) -> None:
+        """Add a `(time, node)` chunk."""
+        import numpy as np
+
+        # A single float64 copy; everything else is done in place, in order to keep the memory
+        # usage within `_MOMENTS_OVERHEAD`
+        chunk = np.array(chunk, dtype=np.float64)
+        self.max = np.fmax(self.max, np.fmax.reduce(chunk, axis=0))
+        self.min = np.fmin(self.min, np.fmin.reduce(chunk, axis=0))
+        missing = np.isnan(chunk, out=np.empty(chunk.shape, dtype=bool))
+        np.logical_or(missing, np.isinf(chunk), out=missing)
+        count = chunk.shape[0] - missing.sum(axis=0, dtype=np.float64)
+        chunk[missing] = 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, chunk.sum(axis=0) / count, 0)
+        np.subtract(chunk, mean, out=chunk)
+        np.square(chunk, out=chunk)
+        chunk[missing] = 0
+        m2 = chunk.sum(axis=0)
+        self._combine(count, mean, m2)
+
+    def merge(self, other: _Moments) -> None:
+        import numpy as np
+
+        self.max = np.fmax(self.max, other.max)
+        self.min = np.fmin(self.min, other.min)
+        self._combine(other.count, other.mean, other.m2)
+
+    def result(self, op: str) -> Array:
+        import numpy as np
+
+        empty = self.count == 0
+        if op == "max":
+            return self.max
+        if op == "min":
+            return self.min
+        if op == "count":
+            return self.count
+        if op == "sum":
+            return self.mean * self.count
+        if op == "mean":
+            return np.where(empty, np.nan, self.mean)
+        # std; the population standard deviation (`ddof=0`), i.e. the same as `numpy.nanstd()`
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(empty, np.nan, np.sqrt(self.m2 / self.count))
+
+
+def _parse_ops(ops: T.Iterable[str]) -> tuple[list[str], dict[str, float]]:
+    moments: list[str] = []
+    percentiles: dict[str, float] = {}
+    for op in ops:
+        if op in _MOMENT_OPS:
+            moments.append(op)
+        elif op == "median":
+            percentiles[op] = 50.0
+        elif match := _PERCENTILE_RE.match(op):
+            percentiles[op] = float(match.group(1))
+            if not 0 <= percentiles[op] <= 100:
+                raise ValueError(f"Percentiles must be between 0 and 100: {op}")
+        else:
+            msg = (
+                f"Unknown reduction: {op}. Please choose one of: {sorted(_MOMENT_OPS)}, median or e.g. p99"
+            )
+            raise ValueError(msg)
+    return moments, percentiles
+
+
+def _is_lazy(data: xarray.DataArray) -> bool:
+    """Return `True` if `data` is being read lazily from a file (i.e. it is neither a numpy nor a dask array)."""
+    import numpy as np
+
+    # `Variable._data` is the (possibly lazy) array of the variable; `.data` would load it
+    array = data.variable._data
+    return not isinstance(array, np.ndarray) and not hasattr(array, "map_blocks")
+
+
+@contextlib.contextmanager
+def _open_handle(
+    ds: xarray.Dataset,
+    data: xarray.DataArray,
+    time_slice: slice | None,
+) -> T.Iterator[tuple[xarray.DataArray, T.ContextManager[T.Any]]]:
+    """
+    Yield `data` read through a file handle of its own, plus the lock that must be held while reading it.
+
+    Not all the backends are thread-safe (e.g. Selafin reads through a single file handle), therefore
+    each worker reopens the source file, so that the workers can read concurrently. If that is not
+    possible (e.g. the dataset has been cropped), the reads are serialized with `utils.get_read_lock()`.
+    numpy and dask arrays can be read concurrently, so they are used as they are.
+    """
+    from . import api
+
+    source = ds.encoding.get("source")
+    if not _is_lazy(data) or source is None:
+        yield data, contextlib.nullcontext()
+        return
+    try:
+        reopened = api.open_dataset(source)
+    except (OSError, ValueError) as exc:
+        logger.debug("Can't reopen %s, serializing the reads: %s", source, exc)
+        yield data, utils.get_read_lock(ds)
+        return
+    with reopened:
+        name = str(data.name)
+        if (
+            name in reopened
+            and reopened[name].dims == data.dims
+            and reopened.sizes["node"] == ds.sizes["node"]
+            and utils.get_mesh_hash(reopened, variables=("lon", "lat"))
+            == utils.get_mesh_hash(ds, ("lon", "lat"))
+        ):
+            own = reopened[name] if time_slice is None else reopened[name].sel(time=time_slice)
+            if own.shape == data.shape and (own.time.values == data.time.values).all():
+                yield own, contextlib.nullcontext()
+                return
+        logger.debug("%s does not match the dataset, serializing the reads", source)
+        yield data, utils.get_read_lock(ds)
+
+
+def _reduce_moments(
+    ds: xarray.Dataset,
+    data: xarray.DataArray,
+    time_slice: slice | None,
+    block_size: int,
+    workers: int,
+) -> _Moments:
+    """Stream over the timestamps; the time blocks are distributed round-robin to the workers."""
+    no_times = data.sizes["time"]
+    starts = list(range(0, no_times, block_size))
+    no_workers = max(1, min(workers, len(starts)))
+
+    def accumulate(worker: int) -> _Moments:
+        moments = _Moments(data.sizes["node"])
+        with _open_handle(ds, data, time_slice) as (own, lock):
+            for start in starts[worker::no_workers]:
+                stop = min(start + block_size, no_times)
+                with lock:
+                    block = own.isel(time=slice(start, stop)).values
+                moments.update(block)
+        return moments
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=no_workers) as executor:
+        partials = list(executor.map(accumulate, range(no_workers)))
+    result = partials[0]
+    for partial in partials[1:]:
+        result.merge(partial)
+    return result
+
+
+def _reduce_percentiles(
+    ds: xarray.Dataset,
+    data: xarray.DataArray,
+    time_slice: slice | None,
+    percentiles: dict[str, float],
+    block_size: int,
+    workers: int,
+    max_memory: int,
+) -> dict[str, Array]:
+    """
+    Percentiles need the full timeseries of each node, so iterate over blocks of nodes.
+
+    Reading a block of nodes from a "time-major" file touches the whole file. Therefore, the blocks
+    are read from the node-major timeseries store of ``ds`` (see `thalassa.store`), and if there is
+    no valid store and the data don't fit in a single block, from a temporary one, which is built
+    by reading the file once.
+    """
+    import numpy as np
+
+    name = str(data.name)
+    no_nodes = data.sizes["node"]
+    results = {op: np.full(no_nodes, np.nan) for op in percentiles}
+    starts = range(0, no_nodes, block_size)
+
+    def compute(start: int, values: npt.NDArray[T.Any]) -> None:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-nan nodes
+            computed = np.nanpercentile(values, list(percentiles.values()), axis=0)
+        for op, row in zip(percentiles, computed):
+            results[op][start : start + values.shape[1]] = row
+
+    with contextlib.ExitStack() as stack:
+        if time_slice is None and store.read_nodes(ds, name, np.arange(1)) is not None:
+
+            def read_block(start: int) -> npt.NDArray[T.Any]:
+                stored = store.read_nodes(ds, name, np.arange(start, min(start + block_size, no_nodes)))
+                return T.cast("npt.NDArray[T.Any]", stored).T
+
+        elif len(starts) == 1 or isinstance(data.variable._data, np.ndarray):
+            # Everything fits in a single block, or the data are in memory anyway
+            with utils.get_read_lock(ds):
+                values = data.values
+
+            def read_block(start: int) -> npt.NDArray[T.Any]:
+                return values[:, start : start + block_size]
+
+        else:
+            path = stack.enter_context(tempfile.TemporaryDirectory(prefix="thalassa-"))
+            subset = ds if time_slice is None else ds.sel(time=time_slice)
+            with utils.timer(f"Built a temporary timeseries store of {name} in"):
+                store.build_timeseries_store(subset, [name], path=path, max_memory=max_memory)
+            array_path = pathlib.Path(path) / f"{name}.npy"
+
+            def read_block(start: int) -> npt.NDArray[T.Any]:
+                # The memory map is released on return, i.e. before the temporary directory gets removed
+                array = np.load(array_path, mmap_mode="r")
+                return np.array(array[start : start + block_size]).T
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(lambda start: compute(start, read_block(start)), starts))
+    return results
+
+
+def reduce(
+    ds: xarray.Dataset,
+    variable: str,
+    ops: T.Iterable[str] = ("max",),
+    *,
+    time_slice: slice | None = None,
+    workers: int | None = None,
+    max_memory: int = 1024**3,
+) -> xarray.Dataset:
+    """
+    Reduce the `time` dimension of `variable`, streaming the data in chunks, so that the
+    full `(time, node)` array never needs to fit in memory.
+
+    All the `max`, `min`, `sum`, `mean`, `std` and `count` reductions are computed in a single pass
+    over the timestamps. Percentiles need the full timeseries of each node, therefore they
+    are computed in a second pass over blocks of nodes. Unless the data fit in `max_memory`, the blocks
+    are read from the timeseries store (see `thalassa.store`), or, if there is no store, from a temporary
+    one which is written next to the other temporary files. `nan` values are ignored.
+
+    The result adheres to the "thalassa schema" and contains one `(node,)` variable per reduction,
+    named `<variable>_<op>`, e.g. `zeta_max` or `zeta_p99`. Therefore, it can be passed directly to `plot()`.
+
+    Examples:
+        ``` python
+        import thalassa
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        stats = thalassa.reduce(ds, "zeta", ops=["max", "mean", "p99"], time_slice=slice("2024-01-01", None))
+        thalassa.plot(stats, "zeta_p99")
+        ```
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        variable: The variable to reduce. Its dimensions must be `(time, node)`.
+        ops: The reductions to compute. `max`, `min`, `sum`, `mean`, `std`, `count`, `median`,
+            or percentiles like `p99` or `p99.9`.
+        time_slice: Reduce only the timestamps of this (label based) slice, e.g. `slice("2024-01-01", None)`.
+        workers: The number of threads that load and reduce chunks concurrently. Defaults to the number of CPUs.
+            Not all the backends are thread-safe (e.g. Selafin), so each worker reads the source file
+            through a file handle of its own.
+        max_memory: The (approximate) maximum number of bytes that will be used at once,
+            including the temporary arrays of the reductions.
+
+    """
+    import numpy as np
+    import xarray as xr
+
+    if ds[variable].dims != ("time", "node"):
+        msg = f"Only variables with `(time, node)` dimensions can be reduced: {ds[variable].dims}"
+        raise ValueError(msg)
+    moments, percentiles = _parse_ops(ops)
+    if not moments and not percentiles:
+        raise ValueError("At least one reduction must be specified")
+    workers = workers or os.cpu_count() or 1
+    data = ds[variable]
+    if time_slice is not None:
+        data = data.sel(time=time_slice)
+    # Every worker holds the block it is reducing, plus the temporaries of the reduction
+    itemsize = data.dtype.itemsize
+    outputs: dict[str, Array] = {}
+    with utils.timer(f"Reduced {variable} in"):
+        if moments:
+            bytes_per_time = (itemsize + _MOMENTS_OVERHEAD) * workers * data.sizes["node"]
+            block_size = max(1, max_memory // bytes_per_time)
+            result = _reduce_moments(ds, data, time_slice, block_size=block_size, workers=workers)
+            for op in moments:
+                outputs[op] = result.result(op)
+        if percentiles:
+            bytes_per_node = (itemsize + _PERCENTILES_OVERHEAD) * workers * max(data.sizes["time"], 1)
+            block_size = max(1, max_memory // bytes_per_node)
+            outputs.update(
+                _reduce_percentiles(
+                    ds,
+                    data,
+                    time_slice,
+                    percentiles,
+                    block_size=block_size,
+                    workers=workers,
+                    max_memory=max_memory,
+                ),
+            )
+    # Keep the mesh and the other `(node,)` variables which don't depend on time
+    reduced = ds.drop_vars([name for name in ds.variables if "time" in ds[name].dims])
+    for op, values in outputs.items():
+        reduced[f"{variable}_{op}"] = xr.DataArray(
+            np.asarray(values, dtype=np.float64),
+            dims=("node",),
+            attrs=dict(ds[variable].attrs, thalassa_reduction=op),
+        )
+    return reduced
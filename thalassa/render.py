@@ -0,0 +1,521 @@
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import logging
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import time
+import typing as T
+
+from . import api
+from . import raster
+from . import spatial
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import numpy.typing as npt
+    import pandas
+    import xarray
+
+
+logger = logging.getLogger(__name__)
+
+Engine = T.Literal["datashader", "weights"]
+
+# The state of each worker process; populated by `_init_worker()`
+_WORKER: dict[str, T.Any] = {}
+
+# The size of the tiles in pixels and the bounds of Web Mercator
+TILE_SIZE = 256
+_MERCATOR_BOUND = 20037508.342789244
+
+
+def _init_worker(
+    geometry_dir: str,
+    cmap: str,
+    clim: tuple[float, float],
+    engine: Engine,
+    extent: raster.Extent | None = None,
+    width: int = 0,
+    height: int = 0,
+) -> None:
+    import datashader
+    import holoviews.plotting.util
+    import numpy as np
+    import pandas as pd
+
+    # The geometry is memory-mapped, i.e. all the workers share the same pages of the OS cache
+    geometry = pathlib.Path(geometry_dir)
+    _WORKER.clear()
+    _WORKER.update(
+        clim=clim,
+        engine=engine,
+        palette=holoviews.plotting.util.process_cmap(cmap, ncolors=256),
+    )
+    if engine == "weights":
+        _WORKER["weights"] = raster.RasterWeights.load(geometry / "weights.npz")
+        return
+    if (geometry / "locator").exists():
+        # The locator contains the geometry, too
+        _WORKER["locator"] = locator = spatial.TriangleLocator.load(geometry / "locator")
+        _WORKER.update(x=locator.x, y=locator.y, triangles=locator.triangles)
+    else:
+        _WORKER["x"] = np.load(geometry / "x.npy", mmap_mode="r")
+        _WORKER["y"] = np.load(geometry / "y.npy", mmap_mode="r")
+        _WORKER["triangles"] = np.load(geometry / "triangles.npy", mmap_mode="r")
+    _WORKER["simplices"] = pd.DataFrame(_WORKER["triangles"], columns=["v0", "v1", "v2"], copy=False)
+    if extent is not None:
+        _WORKER["canvas"] = datashader.Canvas(
+            plot_width=width,
+            plot_height=height,
+            x_range=(extent[0], extent[2]),
+            y_range=(extent[1], extent[3]),
+        )
+
+
+def _write_geometry(
+    ds: xarray.Dataset,
+    geometry_dir: str,
+    engine: Engine,
+    extent: raster.Extent | None = None,
+    width: int = 0,
+    height: int = 0,
+    locator: spatial.TriangleLocator | None = None,
+) -> None:
+    """
+    Write the data that the workers need to `geometry_dir`.
+
+    If a `locator` (of the nodes in Web Mercator) is specified, it is written instead of the geometry,
+    so that the workers don't need to build it again.
+    """
+    import numpy as np
+
+    geometry = pathlib.Path(geometry_dir)
+    if engine == "weights":
+        weights = raster.get_raster_weights(ds, width=width, height=height, extent=extent)
+        weights.save(geometry / "weights.npz")
+    elif locator is not None:
+        locator.save(geometry / "locator")
+    else:
+        nodes = api._get_mesh_nodes(ds)
+        np.save(geometry / "x.npy", nodes.lon.to_numpy())
+        np.save(geometry / "y.npy", nodes.lat.to_numpy())
+        np.save(geometry / "triangles.npy", utils.get_triangles(ds))
+
+
+@contextlib.contextmanager
+def _create_executor(
+    processes: int | None,
+    initargs: tuple[T.Any, ...],
+) -> T.Iterator[concurrent.futures.Executor]:
+    if processes == 0:
+        # The worker state of the current process is restored when done, which also releases
+        # the memory-mapped files before the temporary directory of the geometry gets removed
+        previous = dict(_WORKER)
+        try:
+            _init_worker(*initargs)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                yield executor
+        finally:
+            _WORKER.clear()
+            _WORKER.update(previous)
+        return
+    # Forking a process which uses threads (e.g. dask, numba) is not safe
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=functools.partial(_init_worker, *initargs),
+    ) as executor:
+        yield executor
+
+
+def _get_no_workers(processes: int | None) -> int:
+    if processes == 0:
+        return 1
+    return processes or os.cpu_count() or 1
+
+
+def _get_frames(
+    ds: xarray.Dataset,
+    variable: str,
+    times: T.Sequence[T.Any] | None,
+) -> tuple[xarray.DataArray, list[T.Any]]:
+    """Return the data of `variable` and the timestamps of the frames (`[None]` if there is no time)."""
+    dims = ds[variable].dims
+    if dims not in {("node",), ("time", "node")}:
+        msg = f"Only variables with `(node,)` or `(time, node)` dimensions can be rendered: {dims}"
+        raise ValueError(msg)
+    data = ds[variable]
+    if "time" in dims and times is not None:
+        data = data.sel(time=times)
+    timestamps: list[T.Any] = list(data.time.values) if "time" in dims else [None]
+    return data, timestamps
+
+
+def _get_clim(data: xarray.DataArray, clim: tuple[float, float] | None) -> tuple[float, float]:
+    if clim is None:
+        with utils.timer(f"Computed the limits of {data.name} in"):
+            clim = (float(data.min()), float(data.max()))
+    return clim
+
+
+def _shade(agg: xarray.DataArray, path: str | os.PathLike[str]) -> None:
+    import datashader.transfer_functions as tf
+
+    image = tf.shade(agg, cmap=_WORKER["palette"], span=_WORKER["clim"], how="linear")
+    # Write to a temporary file and rename it when done; this way an interrupted run never
+    # leaves a truncated image behind (which e.g. `export_tiles()` would then reuse)
+    path = pathlib.Path(path)
+    tmp_path = path.with_name(f".{path.stem}.{os.getpid()}.tmp.png")
+    try:
+        image.to_pil().save(tmp_path, format="PNG")
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _aggregate(values: npt.NDArray[T.Any]) -> xarray.DataArray:
+    import datashader
+    import pandas as pd
+
+    if _WORKER["engine"] == "weights":
+        return T.cast("xarray.DataArray", _WORKER["weights"].render(values))
+    vertices = pd.DataFrame(dict(x=_WORKER["x"], y=_WORKER["y"], z=values), copy=False)
+    agg = _WORKER["canvas"].trimesh(vertices, _WORKER["simplices"], agg=datashader.mean("z"))
+    return T.cast("xarray.DataArray", agg)
+
+
+def _render_frame(values: npt.NDArray[T.Any], path: str) -> float:
+    started = time.perf_counter()
+    _shade(_aggregate(values), path)
+    return time.perf_counter() - started
+
+
+def _get_frame_name(variable: str, timestamp: T.Any) -> str:
+    import pandas as pd
+
+    if timestamp is None:
+        return f"{variable}.png"
+    return f"{variable}_{pd.Timestamp(timestamp):%Y%m%dT%H%M%S}.png"
+
+
+def render_frames(
+    ds: xarray.Dataset,
+    variable: str,
+    out_dir: str | os.PathLike[str],
+    *,
+    times: T.Sequence[T.Any] | None = None,
+    extent: raster.Extent | None = None,
+    width: int = 800,
+    height: int = 600,
+    cmap: str = "plasma",
+    clim: tuple[float, float] | None = None,
+    engine: Engine = "datashader",
+    processes: int | None = None,
+) -> pandas.DataFrame:
+    """
+    Render one PNG image per timestamp of `variable` without going through bokeh.
+
+    The frames are aggregated and shaded with ``datashader`` and they are spread over a pool of
+    processes. The geometry of the mesh is written once to memory-mapped files, which are shared
+    by all the workers, so only the values of each frame are being sent to the workers.
+
+    The images are named after the variable and the timestamp, e.g. `zeta_20240101T000000.png`.
+
+    Examples:
+        ``` python
+        import thalassa
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        timings = thalassa.render_frames(ds, "zeta", "/tmp/frames", times=ds.time[:24], clim=(-1, 1))
+        print(timings.render.describe())
+        ```
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        variable: The variable to render. Its dimensions must be either `(node,)` or `(time, node)`.
+        out_dir: The directory where the images will be written. It is created if it doesn't exist.
+        times: The timestamps to render. Defaults to all of them.
+        extent: The extent of the images, `(xmin, ymin, xmax, ymax)` in Web Mercator.
+            Defaults to the extent of the mesh.
+        width: The width of the images in pixels.
+        height: The height of the images in pixels.
+        cmap: The colormap to use. Any colormap supported by ``holoviews`` can be used.
+        clim: The limits of the colormap. Defaults to the minimum and maximum of all the frames.
+        engine: Either `datashader`, which scan-converts the triangles of each frame,
+            or `weights`, which uses precomputed interpolation weights (see `thalassa.raster`).
+        processes: The number of worker processes. Defaults to the number of CPUs.
+            If `0`, the frames are rendered in the current process.
+
+    Returns:
+        A dataframe with the path of each frame and the time it took to load and to render it, in seconds.
+
+    """
+    import pandas as pd
+
+    data, timestamps = _get_frames(ds, variable, times)
+    if extent is None:
+        extent = raster.get_mesh_extent(ds)
+    clim = _get_clim(data, clim)
+    out_dir = pathlib.Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rows: list[dict[str, T.Any]] = []
+    with tempfile.TemporaryDirectory(prefix="thalassa-") as geometry_dir:
+        _write_geometry(ds, geometry_dir, engine=engine, extent=extent, width=width, height=height)
+        initargs = (geometry_dir, cmap, clim, engine, extent, width, height)
+        # The values of the pending frames are kept alive by the executor, so only a few frames
+        # per worker are being submitted at any time; this bounds the memory usage.
+        max_pending = 2 * _get_no_workers(processes)
+        pending: dict[concurrent.futures.Future[float], dict[str, T.Any]] = {}
+
+        def collect(return_when: str) -> None:
+            done, _ = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                row = pending.pop(future)
+                row["render"] = future.result()
+                logger.info("Rendered %s in %.3fs", row["path"], row["render"])
+
+        with _create_executor(processes, initargs) as executor:
+            for timestamp in timestamps:
+                if len(pending) >= max_pending:
+                    collect(concurrent.futures.FIRST_COMPLETED)
+                # Loading the next frame overlaps with the rendering of the previous ones
+                started = time.perf_counter()
+                values = data.sel(time=timestamp).values if timestamp is not None else data.values
+                path = out_dir / _get_frame_name(variable, timestamp)
+                rows.append(dict(time=timestamp, path=path, load=time.perf_counter() - started))
+                pending[executor.submit(_render_frame, values, str(path))] = rows[-1]
+            collect(concurrent.futures.ALL_COMPLETED)
+    timings = pd.DataFrame(rows, columns=["time", "path", "load", "render"])
+    return timings
+
+
+def get_tile_extent(z: int, x: int, y: int) -> raster.Extent:
+    """Return the extent of the XYZ tile `(z, x, y)` in Web Mercator. Tile `(0, 0)` is the north-west one."""
+    size = 2 * _MERCATOR_BOUND / 2**z
+    return (
+        -_MERCATOR_BOUND + x * size,
+        _MERCATOR_BOUND - (y + 1) * size,
+        -_MERCATOR_BOUND + (x + 1) * size,
+        _MERCATOR_BOUND - y * size,
+    )
+
+
+def _get_mesh_tiles(
+    x: npt.NDArray[numpy.float64],
+    y: npt.NDArray[numpy.float64],
+    triangles: npt.NDArray[numpy.int_],
+    zoom: int,
+) -> npt.NDArray[numpy.int64]:
+    """
+    Return an `(n, 2)` array with the `(x, y)` indices of the tiles which overlap
+    the bounding box of at least one triangle, i.e. the tiles outside of the mesh are excluded.
+    """
+    import numpy as np
+
+    ntiles = 2**zoom
+    size = 2 * _MERCATOR_BOUND / ntiles
+    xs = np.clip(x[triangles], -_MERCATOR_BOUND, _MERCATOR_BOUND)
+    ys = np.clip(y[triangles], -_MERCATOR_BOUND, _MERCATOR_BOUND)
+    tx0 = np.clip(np.floor((xs.min(axis=1) + _MERCATOR_BOUND) / size), 0, ntiles - 1).astype(np.int64)
+    tx1 = np.clip(np.floor((xs.max(axis=1) + _MERCATOR_BOUND) / size), 0, ntiles - 1).astype(np.int64)
+    ty0 = np.clip(np.floor((_MERCATOR_BOUND - ys.max(axis=1)) / size), 0, ntiles - 1).astype(np.int64)
+    ty1 = np.clip(np.floor((_MERCATOR_BOUND - ys.min(axis=1)) / size), 0, ntiles - 1).astype(np.int64)
+    # Most triangles overlap a single tile. Expand the ones that overlap more.
+    widths = tx1 - tx0 + 1
+    counts = widths * (ty1 - ty0 + 1)
+    owner = np.repeat(np.arange(len(triangles)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    tile_x = tx0[owner] + local % widths[owner]
+    tile_y = ty0[owner] + local // widths[owner]
+    keys = np.unique(tile_y * ntiles + tile_x)
+    return np.column_stack((keys % ntiles, keys // ntiles))
+
+
+def _render_tiles(values_path: str, zoom: int, tiles: list[tuple[int, int]], out_dir: str) -> int:
+    """Render the `tiles` of `zoom`. Return the number of tiles which have been written."""
+    import datashader
+    import numpy as np
+    import pandas as pd
+
+    locator = _WORKER["locator"]
+    values = np.load(values_path, mmap_mode="r")
+    vertices = pd.DataFrame(dict(x=_WORKER["x"], y=_WORKER["y"], z=values), copy=False)
+    written = 0
+    for x, y in tiles:
+        extent = get_tile_extent(zoom, x, y)
+        # Only the triangles of the tile are rasterized
+        triangles = locator.query_bbox(*extent)
+        if not len(triangles):
+            continue
+        canvas = datashader.Canvas(
+            plot_width=TILE_SIZE,
+            plot_height=TILE_SIZE,
+            x_range=(extent[0], extent[2]),
+            y_range=(extent[1], extent[3]),
+        )
+        simplices = pd.DataFrame(locator.triangles[triangles], columns=["v0", "v1", "v2"])
+        agg = canvas.trimesh(vertices, simplices, agg=datashader.mean("z"))
+        if agg.isnull().all():
+            continue
+        path = pathlib.Path(out_dir) / str(zoom) / str(x) / f"{y}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _shade(agg, path)
+        written += 1
+    return written
+
+
+def export_tiles(
+    ds: xarray.Dataset,
+    variable: str,
+    out_dir: str | os.PathLike[str],
+    *,
+    min_zoom: int = 0,
+    max_zoom: int = 8,
+    times: T.Sequence[T.Any] | None = None,
+    cmap: str = "plasma",
+    clim: tuple[float, float] | None = None,
+    overwrite: bool = False,
+    processes: int | None = None,
+    tiles_per_task: int = 64,
+) -> pandas.DataFrame:
+    """
+    Render `variable` to a `{z}/{x}/{y}.png` Web Mercator tile pyramid, which can be served by any static server.
+
+    Tiles that are outside of the mesh are skipped, and so are tiles that already exist (unless `overwrite`
+    is `True`), so re-running an export only renders what is missing. The tiles are spread over a pool
+    of processes which share the geometry of the mesh (see `render_frames()`).
+
+    If `variable` has a `time` dimension, a separate pyramid is written for each timestamp,
+    e.g. `out_dir/20240101T000000/{z}/{x}/{y}.png`.
+
+    Examples:
+        ``` python
+        import thalassa
+        from thalassa import api
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        thalassa.render.export_tiles(ds, "zeta_max", "/srv/tiles/zeta_max", max_zoom=10)
+        # After serving `/srv/tiles` over HTTP:
+        tiles = api.get_tiles(url="http://localhost:8000/zeta_max/{Z}/{X}/{Y}.png")
+        ```
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        variable: The variable to render. Its dimensions must be either `(node,)` or `(time, node)`.
+        out_dir: The root directory of the pyramid(s).
+        min_zoom: The lowest zoom level to render.
+        max_zoom: The highest zoom level to render.
+        times: The timestamps to render. Defaults to all of them.
+        cmap: The colormap to use. Any colormap supported by ``holoviews`` can be used.
+        clim: The limits of the colormap. Defaults to the minimum and maximum of all the timestamps.
+        overwrite: Whether existing tiles should be rendered again.
+        processes: The number of worker processes. Defaults to the number of CPUs.
+            If `0`, the tiles are rendered in the current process.
+        tiles_per_task: The number of tiles that are sent to a worker at once.
+
+    Returns:
+        A dataframe with the number of tiles that overlap the mesh, that already existed and that
+        have been written, and the time it took, per timestamp and zoom level.
+
+    """
+    import numpy as np
+    import pandas as pd
+
+    data, timestamps = _get_frames(ds, variable, times)
+    clim = _get_clim(data, clim)
+    nodes = api._get_mesh_nodes(ds)
+    # Build the locator once; the workers memory-map it
+    locator = spatial.TriangleLocator(nodes.lon.to_numpy(), nodes.lat.to_numpy(), utils.get_triangles(ds))
+    x, y, triangles = locator.x, locator.y, locator.triangles
+    mesh_tiles = {zoom: _get_mesh_tiles(x, y, triangles, zoom) for zoom in range(min_zoom, max_zoom + 1)}
+    rows: list[dict[str, T.Any]] = []
+    with tempfile.TemporaryDirectory(prefix="thalassa-") as geometry_dir:
+        _write_geometry(ds, geometry_dir, engine="datashader", locator=locator)
+        with _create_executor(processes, (geometry_dir, cmap, clim, "datashader")) as executor:
+            for i, timestamp in enumerate(timestamps):
+                root = pathlib.Path(out_dir)
+                if timestamp is not None:
+                    root = root / f"{pd.Timestamp(timestamp):%Y%m%dT%H%M%S}"
+                values = data.sel(time=timestamp).values if timestamp is not None else data.values
+                values_path = str(pathlib.Path(geometry_dir) / f"values_{i}.npy")
+                np.save(values_path, values)
+                for zoom, candidates in mesh_tiles.items():
+                    started = time.perf_counter()
+                    pending = [
+                        (int(tx), int(ty))
+                        for tx, ty in candidates
+                        if overwrite or not (root / str(zoom) / str(tx) / f"{ty}.png").exists()
+                    ]
+                    futures = [
+                        executor.submit(
+                            _render_tiles,
+                            values_path,
+                            zoom,
+                            pending[j : j + tiles_per_task],
+                            str(root),
+                        )
+                        for j in range(0, len(pending), tiles_per_task)
+                    ]
+                    written = sum(future.result() for future in futures)
+                    elapsed = time.perf_counter() - started
+                    logger.info("Zoom %d: wrote %d tiles of %s in %.3fs", zoom, written, root, elapsed)
+                    rows.append(
+                        dict(
+                            time=timestamp,
+                            zoom=zoom,
+                            tiles=len(candidates),
+                            existing=len(candidates) - len(pending),
+                            written=written,
+                            seconds=elapsed,
+                        ),
+                    )
+                os.remove(values_path)
+    return pd.DataFrame(rows, columns=["time", "zoom", "tiles", "existing", "written", "seconds"])
+
+
+def main(argv: T.Sequence[str] | None = None) -> None:
+    """
+    Render the frames of a variable from the command line.
+
+    Examples:
+        ``` sh
+        python -m thalassa.render some_netcdf.nc zeta /tmp/frames --width 1200 --height 900 --clim -1 1
+        ```
+    """
+    parser = argparse.ArgumentParser(prog="python -m thalassa.render", description="Render PNG frames")
+    parser.add_argument("path", help="The path of the dataset")
+    parser.add_argument("variable", help="The variable to render")
+    parser.add_argument("out_dir", help="The directory where the images will be written")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--cmap", default="plasma")
+    parser.add_argument("--clim", type=float, nargs=2, default=None)
+    parser.add_argument("--engine", choices=["datashader", "weights"], default="datashader")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ds = api.open_dataset(args.path)
+    timings = render_frames(
+        ds,
+        args.variable,
+        args.out_dir,
+        width=args.width,
+        height=args.height,
+        cmap=args.cmap,
+        clim=tuple(args.clim) if args.clim else None,
+        engine=args.engine,
+        processes=args.processes,
+    )
+    print(timings[["load", "render"]].describe())
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
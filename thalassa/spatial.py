@@ -0,0 +1,481 @@
+from __future__ import annotations
+
+import logging
+import os
+import pathlib
+import typing as T
+
+from . import cache
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import numpy.typing as npt
+    import scipy.spatial
+    import xarray
+
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6_371_008.8  # meters, mean Earth radius
+
+Metric = T.Literal["euclidean", "haversine"]
+_METRICS = {"euclidean", "haversine"}
+
+
+def _lonlat_to_xyz(
+    lons: npt.ArrayLike,
+    lats: npt.ArrayLike,
+) -> npt.NDArray[numpy.float64]:
+    """Convert geographic coordinates to cartesian coordinates on the unit sphere."""
+    import numpy as np
+
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    cos_lats = np.cos(lats)
+    xyz = np.stack((cos_lats * np.cos(lons), cos_lats * np.sin(lons), np.sin(lats)), axis=-1)
+    return T.cast("npt.NDArray[numpy.float64]", xyz)
+
+
+class NodeIndex:
+    """
+    A KD-tree based spatial index over the nodes of a mesh.
+
+    Supports two metrics:
+
+    - `euclidean`: The distance is computed on the `(lon, lat)` plane, i.e. in degrees.
+      This matches the behavior of the original brute force search.
+    - `haversine`: The distance is the great-circle distance in meters. The nodes are
+      mapped on the unit sphere, therefore the results are correct near the poles and
+      across the International Date Line.
+
+    Parameters:
+        lons: The longitudes of the nodes.
+        lats: The latitudes of the nodes.
+        metric: The metric that will be used for the distance calculations.
+
+    """
+
+    def __init__(
+        self,
+        lons: npt.ArrayLike,
+        lats: npt.ArrayLike,
+        metric: Metric = "euclidean",
+    ) -> None:
+        import numpy as np
+        import scipy.spatial
+
+        if metric not in _METRICS:
+            raise ValueError(f"Unknown metric: {metric}. Please choose one of: {sorted(_METRICS)}")
+        self.metric = metric
+        if metric == "haversine":
+            points = _lonlat_to_xyz(lons, lats)
+        else:
+            points = np.column_stack(
+                (np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64)),
+            )
+        with utils.timer(f"Built {metric} node index of {len(points)} nodes in"):
+            self._tree: scipy.spatial.cKDTree = scipy.spatial.cKDTree(points)
+
+    def __len__(self) -> int:
+        return int(self._tree.n)
+
+    def query(
+        self,
+        lons: npt.ArrayLike,
+        lats: npt.ArrayLike,
+    ) -> tuple[npt.NDArray[numpy.float64], npt.NDArray[numpy.int_]]:
+        """
+        Return the distances to the nearest nodes and their indices.
+
+        Both scalars and arrays are supported. The shape of the output matches the shape of the input.
+        """
+        import numpy as np
+
+        if self.metric == "haversine":
+            points = _lonlat_to_xyz(lons, lats)
+        else:
+            points = np.stack(np.broadcast_arrays(np.asarray(lons), np.asarray(lats)), axis=-1)
+        distances, indices = self._tree.query(points)
+        if self.metric == "haversine":
+            # The tree returns chord lengths on the unit sphere. Convert them to great-circle distances
+            distances = 2 * np.arcsin(np.clip(distances / 2, 0, 1)) * EARTH_RADIUS
+        return distances, indices
+
+
+_NODE_INDEX_CACHE: cache.LRUCache[tuple[str, str], NodeIndex] = cache.LRUCache(maxsize=4)
+
+
+def get_node_index(ds: xarray.Dataset, metric: Metric = "euclidean") -> NodeIndex:
+    """
+    Return a `NodeIndex` for the mesh of ``ds``.
+
+    The index is only built once per mesh and `metric`; subsequent calls return the cached instance,
+    even if they are made with a different dataset object (e.g. a different variable subset).
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        metric: Either `euclidean` or `haversine`.
+
+    """
+    key = (utils.get_mesh_hash(ds, variables=("lon", "lat")), metric)
+    node_index = _NODE_INDEX_CACHE.get_or_create(
+        key,
+        lambda: NodeIndex(lons=ds.lon.values, lats=ds.lat.values, metric=metric),
+    )
+    return node_index
+
+
+class TriangleLocator:
+    """
+    A spatial index which locates the triangle containing a point.
+
+    The bounding box of the mesh is divided into a uniform grid of bins and each triangle is
+    assigned to all the bins its bounding box overlaps. Locating a point only requires testing
+    the (few) triangles of a single bin. Both building the index and querying it are compiled
+    with ``numba``, so thousands of points can be located in milliseconds.
+
+    Parameters:
+        x: The x coordinates of the nodes (e.g. longitudes).
+        y: The y coordinates of the nodes (e.g. latitudes).
+        triangles: An `(n, 3)` array with the (zero-based) node indices of each triangle.
+        triangles_per_bin: The average number of triangles per bin. Controls the resolution of the grid.
+
+    """
+
+    def __init__(
+        self,
+        x: npt.ArrayLike,
+        y: npt.ArrayLike,
+        triangles: npt.ArrayLike,
+        triangles_per_bin: float = 2,
+    ) -> None:
+        import numpy as np
+
+        from . import _kernels
+
+        self.x = np.ascontiguousarray(x, dtype=np.float64)
+        self.y = np.ascontiguousarray(y, dtype=np.float64)
+        self.triangles = np.ascontiguousarray(triangles)
+        if self.triangles.ndim != 2 or self.triangles.shape[1] != 3:
+            raise ValueError(f"triangles must be an (n, 3) array, not: {self.triangles.shape}")
+        ntri = len(self.triangles)
+        self.x0 = float(self.x.min()) if len(self.x) else 0.0
+        self.y0 = float(self.y.min()) if len(self.y) else 0.0
+        # Choose the number of bins so that the bins are (roughly) square
+        width = (float(self.x.max()) - self.x0 if len(self.x) else 0.0) or 1.0
+        height = (float(self.y.max()) - self.y0 if len(self.y) else 0.0) or 1.0
+        nbins = max(ntri / triangles_per_bin, 1)
+        self.nx = max(int(np.sqrt(nbins * width / height)), 1)
+        self.ny = max(int(np.ceil(nbins / self.nx)), 1)
+        self.dx = width / self.nx
+        self.dy = height / self.ny
+        with utils.timer(f"Built triangle locator of {ntri} triangles in {self.nx}x{self.ny} bins in"):
+            self.offsets, self.indices = _kernels.bin_triangles(
+                self.x,
+                self.y,
+                self.triangles,
+                self.x0,
+                self.y0,
+                self.dx,
+                self.dy,
+                self.nx,
+                self.ny,
+            )
+
+    def locate(
+        self,
+        xs: npt.ArrayLike,
+        ys: npt.ArrayLike,
+    ) -> tuple[npt.NDArray[numpy.int_], npt.NDArray[numpy.float64]]:
+        """
+        Return the index of the triangle containing each point and the point's barycentric weights.
+
+        The weights have shape `(n, 3)` and correspond to the nodes of the triangle, in the order
+        they appear in ``triangles``. Points outside of the mesh get ``-1`` as index and ``nan`` weights.
+        """
+        import numpy as np
+
+        from . import _kernels
+
+        xs = np.atleast_1d(np.asarray(xs, dtype=np.float64)).ravel()
+        ys = np.atleast_1d(np.asarray(ys, dtype=np.float64)).ravel()
+        # A small tolerance ensures that points on shared edges and nodes are found
+        eps = 1e-10
+        indices, weights = _kernels.locate_points(
+            xs,
+            ys,
+            self.x,
+            self.y,
+            self.triangles,
+            self.offsets,
+            self.indices,
+            self.x0,
+            self.y0,
+            self.dx,
+            self.dy,
+            self.nx,
+            self.ny,
+            eps,
+        )
+        return indices, weights
+
+    def contains(self, xs: npt.ArrayLike, ys: npt.ArrayLike) -> npt.NDArray[numpy.bool_]:
+        """Return a boolean array which is `True` for the points that are inside the mesh."""
+        indices, _ = self.locate(xs, ys)
+        return indices >= 0
+
+    def query_bbox(self, xmin: float, ymin: float, xmax: float, ymax: float) -> npt.NDArray[numpy.int_]:
+        """
+        Return the (sorted) indices of the triangles which intersect the specified bounding box.
+
+        A triangle is selected if its own bounding box intersects the specified one. Only the bins
+        that overlap the bounding box are examined, so the cost is proportional to the visible area.
+        """
+        import numpy as np
+
+        i0 = int(np.clip(np.floor((xmin - self.x0) / self.dx), 0, self.nx - 1))
+        i1 = int(np.clip(np.floor((xmax - self.x0) / self.dx), 0, self.nx - 1))
+        j0 = int(np.clip(np.floor((ymin - self.y0) / self.dy), 0, self.ny - 1))
+        j1 = int(np.clip(np.floor((ymax - self.y0) / self.dy), 0, self.ny - 1))
+        # The bins of each row of the grid are contiguous in the CSR structure
+        rows = [
+            self.indices[self.offsets[j * self.nx + i0] : self.offsets[j * self.nx + i1 + 1]]
+            for j in range(j0, j1 + 1)
+        ]
+        candidates = np.unique(np.concatenate(rows)) if rows else np.empty(0, dtype=np.int64)
+        nodes = self.triangles[candidates]
+        x = self.x[nodes]
+        y = self.y[nodes]
+        intersects = (
+            (x.max(axis=1) >= xmin)
+            & (x.min(axis=1) <= xmax)
+            & (y.max(axis=1) >= ymin)
+            & (y.min(axis=1) <= ymax)
+        )
+        return T.cast("npt.NDArray[numpy.int_]", candidates[intersects])
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Save the locator to the directory `path`, as one ``.npy`` file per array."""
+        import numpy as np
+
+        path = pathlib.Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for name in _LOCATOR_ARRAYS:
+            np.save(path / f"{name}.npy", getattr(self, name))
+        grid = np.array([self.x0, self.y0, self.dx, self.dy, self.nx, self.ny], dtype=np.float64)
+        np.save(path / "grid.npy", grid)
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str], mmap_mode: T.Literal["r"] | None = "r") -> TriangleLocator:
+        """
+        Load a locator which has been saved with `save()`. By default, the arrays are memory-mapped,
+        so e.g. the processes which load the same locator share the same pages of the OS cache.
+        """
+        import numpy as np
+
+        path = pathlib.Path(path)
+        # Don't rebuild the bins, i.e. bypass `__init__()`
+        locator = cls.__new__(cls)
+        for name in _LOCATOR_ARRAYS:
+            setattr(locator, name, np.load(path / f"{name}.npy", mmap_mode=mmap_mode))
+        x0, y0, dx, dy, nx, ny = np.load(path / "grid.npy").tolist()
+        locator.x0, locator.y0, locator.dx, locator.dy = x0, y0, dx, dy
+        locator.nx, locator.ny = int(nx), int(ny)
+        return locator
+
+
+# The arrays of `TriangleLocator` which are stored by `save()`
+_LOCATOR_ARRAYS = ("x", "y", "triangles", "offsets", "indices")
+
+_TRIANGLE_LOCATOR_CACHE: cache.LRUCache[str, TriangleLocator] = cache.LRUCache(maxsize=4)
+
+
+def get_triangle_locator(ds: xarray.Dataset, wrap_idl: bool = False) -> TriangleLocator:
+    """
+    Return a `TriangleLocator` for the mesh of ``ds`` (in lon/lat coordinates).
+
+    The locator is only built once per mesh; subsequent calls return the cached instance.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        wrap_idl: If `True`, the triangles that cross the International Date Line are wrapped
+            (see `utils.drop_elements_crossing_idl()`) instead of spanning the whole globe.
+
+    """
+
+    def create_locator() -> TriangleLocator:
+        mesh = ds
+        if wrap_idl:
+            # Only triangles spanning at least half the globe are treated as crossing the IDL,
+            # so that the coarse elements of regional meshes are never wrapped by mistake
+            mesh = utils.drop_elements_crossing_idl(ds, max_lon=180, wrap=True)
+        return TriangleLocator(x=mesh.lon.values, y=mesh.lat.values, triangles=utils.get_triangles(mesh))
+
+    key = utils.get_mesh_hash(ds)
+    if wrap_idl:
+        key = f"{key}:idl"
+    locator = _TRIANGLE_LOCATOR_CACHE.get_or_create(key, create_locator)
+    return locator
+
+
+def extract_points(
+    ds: xarray.Dataset,
+    lons: npt.ArrayLike,
+    lats: npt.ArrayLike,
+    variables: T.Iterable[str] | None = None,
+    *,
+    names: T.Sequence[str] | None = None,
+    metric: Metric = "euclidean",
+    method: T.Literal["nearest", "barycentric"] = "nearest",
+) -> xarray.Dataset:
+    """
+    Extract the data of the provided points.
+
+    All the points are resolved with a single (cached) spatial index query and the data are
+    retrieved with a single (sorted, de-duplicated) read per variable, which is efficient both for
+    netCDF files and for dask arrays. The returned dataset has a ``station`` dimension instead of
+    ``node``.
+
+    With ``method="nearest"`` the data of the nearest node are returned, and the dataset
+    contains the following variables:
+
+    - `lon`, `lat`: The coordinates of the requested points.
+    - `location`: The name of each point. Compatible with `api.get_station_pins()`.
+    - `node`: The index of the nearest node.
+    - `node_lon`, `node_lat`: The coordinates of the nearest node.
+    - `distance`: The distance between the point and the nearest node (in the units of `metric`).
+
+    With ``method="barycentric"`` the data are linearly interpolated from the three nodes of the
+    triangle that contains each point. Points outside of the mesh get `nan` values.
+    Instead of `node_lon`, `node_lat` and `distance`, the dataset contains:
+
+    - `triface`: The index of the triangle containing the point (`-1` if outside of the mesh).
+    - `node`: The indices of the nodes of the triangle, with dimensions `(station, three)`.
+    - `weight`: The barycentric weights of the nodes, with dimensions `(station, three)`.
+
+    Examples:
+        ``` python
+        import thalassa
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        stations = thalassa.extract_points(ds, lons=[0.5, 1.2], lats=[40.1, 41.3], variables=["zeta"])
+        ```
+
+    Parameters:
+        ds: The dataset from which we want to extract data. It must adhere to the "thalassa schema".
+        lons: The longitudes of the points.
+        lats: The latitudes of the points.
+        variables: The variables to extract. Defaults to all the variables with a `node` dimension.
+        names: The names of the points. Defaults to `"Station <N>"`.
+        metric: The metric used to find the nearest node. Either `euclidean` or `haversine`.
+            Only used when `method="nearest"`.
+        method: Either `nearest` or `barycentric`.
+
+    """
+    import numpy as np
+
+    lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+    if lons.shape != lats.shape or lons.ndim != 1:
+        raise ValueError(f"lons and lats must be 1D arrays of the same size: {lons.shape} != {lats.shape}")
+    if names is None:
+        names = [f"Station {i}" for i in range(len(lons))]
+    elif len(names) != len(lons):
+        msg = f"The number of names must match the number of points: {len(names)} != {len(lons)}"
+        raise ValueError(msg)
+    if method not in {"nearest", "barycentric"}:
+        raise ValueError(f"Unknown method: {method}. Please choose either 'nearest' or 'barycentric'")
+    if variables is None:
+        variables = [
+            name for name, var in ds.data_vars.items() if "node" in var.dims and name not in {"lon", "lat"}
+        ]
+    variables = list(variables)
+
+    if method == "nearest":
+        stations = _extract_nearest(ds=ds, lons=lons, lats=lats, variables=variables, metric=metric)
+    else:
+        stations = _extract_barycentric(ds=ds, lons=lons, lats=lats, variables=variables)
+    stations["location"] = (("station",), np.asarray(names, dtype=object))
+    return stations
+
+
+def load_nodes(
+    ds: xarray.Dataset,
+    variables: list[str],
+    indices: npt.NDArray[numpy.int_],
+) -> tuple[xarray.Dataset, npt.NDArray[numpy.int_]]:
+    """
+    Load the data of the nodes with the specified `indices` in memory.
+
+    Reading sorted and unique indices is much more efficient for both netcdf and dask.
+    Therefore we return the loaded dataset along with the indices that "expand"
+    the in-memory result back to one entry per item of `indices`.
+
+    If a timeseries store exists for a variable, the data are read from the store instead.
+    """
+    import numpy as np
+
+    from . import store
+
+    unique_indices, inverse = np.unique(indices, return_inverse=True)
+    with utils.get_read_lock(ds), utils.timer(f"extract_points: loaded {len(unique_indices)} nodes in"):
+        subset = ds[variables + ["lon", "lat"]].isel(node=unique_indices)
+        for variable in variables:
+            stored = store.read_nodes(ds=ds, variable=variable, indices=unique_indices)
+            if stored is not None:
+                subset[variable] = subset[variable].copy(data=stored.T)
+        subset = subset.load()
+    return subset, inverse.reshape(indices.shape)
+
+
+def _extract_nearest(
+    ds: xarray.Dataset,
+    lons: npt.NDArray[numpy.float64],
+    lats: npt.NDArray[numpy.float64],
+    variables: list[str],
+    metric: Metric,
+) -> xarray.Dataset:
+    with utils.timer(f"extract_points: resolved {len(lons)} points in"):
+        distances, indices = get_node_index(ds=ds, metric=metric).query(lons, lats)
+    subset, inverse = load_nodes(ds=ds, variables=variables, indices=indices)
+    subset = subset.isel(node=inverse).rename_dims(node="station")
+    stations = subset[variables].drop_vars(["lon", "lat"], errors="ignore")
+    stations = stations.assign(
+        lon=(("station",), lons),
+        lat=(("station",), lats),
+        node=(("station",), indices),
+        node_lon=(("station",), subset.lon.values),
+        node_lat=(("station",), subset.lat.values),
+        distance=(("station",), distances),
+    )
+    return stations
+
+
+def _extract_barycentric(
+    ds: xarray.Dataset,
+    lons: npt.NDArray[numpy.float64],
+    lats: npt.NDArray[numpy.float64],
+    variables: list[str],
+) -> xarray.Dataset:
+    import numpy as np
+    import xarray as xr
+
+    with utils.timer(f"extract_points: resolved {len(lons)} points in"):
+        locator = get_triangle_locator(ds=ds)
+        triangles, weights = locator.locate(lons, lats)
+    # Points outside of the mesh have nan weights, so it doesn't matter which nodes we read for them
+    indices = locator.triangles[np.where(triangles >= 0, triangles, 0)]
+    subset, inverse = load_nodes(ds=ds, variables=variables, indices=indices)
+    subset = subset[variables].drop_vars(["lon", "lat"], errors="ignore")
+    subset = subset.isel(node=xr.DataArray(inverse, dims=("station", "three")))
+    weights_da = xr.DataArray(weights, dims=("station", "three"))
+    stations = (subset * weights_da).sum("three", skipna=False, keep_attrs=True)
+    stations = stations.assign(
+        lon=(("station",), lons),
+        lat=(("station",), lats),
+        triface=(("station",), triangles),
+        node=(("station", "three"), indices),
+        weight=(("station", "three"), weights),
+    )
+    return stations
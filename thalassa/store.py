@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import typing as T
+
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import numpy.typing as npt
+    import xarray
+
+
+logger = logging.getLogger(__name__)
+
+# The timeseries store is a directory next to the source file, containing for each variable:
+# - `<variable>.npy`: The `(node, time)` array of the variable
+# - `<variable>.json`: The identity of the source file, of the nodes and of the timestamps the array was built from
+# Since the arrays are "node-major", the full timeseries of a node is a single contiguous read.
+# Each variable is validated on its own, so rebuilding one variable never "revalidates" the others.
+STORE_SUFFIX = ".tsstore"
+_NODE_VARIABLES = ("lon", "lat")
+_TIME_VARIABLES = ("time",)
+
+_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="thalassa-tsstore")
+
+
+def _get_source(ds: xarray.Dataset) -> pathlib.Path | None:
+    source = ds.encoding.get("source")
+    if source is None:
+        return None
+    return pathlib.Path(source)
+
+
+def get_store_path(source: str | os.PathLike[str]) -> pathlib.Path:
+    """Return the path of the timeseries store of the `source` file."""
+    source = pathlib.Path(source)
+    return source.with_name(source.name + STORE_SUFFIX)
+
+
+def _get_variable_paths(path: pathlib.Path, variable: str) -> tuple[pathlib.Path, pathlib.Path]:
+    return path / f"{variable}.npy", path / f"{variable}.json"
+
+
+def _get_source_identity(source: pathlib.Path) -> dict[str, int]:
+    stat = source.stat()
+    return dict(source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+
+
+def build_timeseries_store(
+    ds: xarray.Dataset,
+    variables: T.Iterable[str],
+    *,
+    path: str | os.PathLike[str] | None = None,
+    max_memory: int = 512 * 1024**2,
+) -> pathlib.Path:
+    """
+    Write a node-major copy of the `variables` of ``ds``, so that the timeseries of a node can be read
+    with a single contiguous read.
+
+    The netcdf files of ADCIRC and SCHISM are chunked in a "time-major" way, which means that
+    retrieving the full timeseries of a single node touches every chunk of the file. Once a store exists,
+    `extract_points()` and the tap/pointer timeseries transparently read from it instead.
+
+    Examples:
+        ``` python
+        import thalassa
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        thalassa.store.build_timeseries_store(ds, ["zeta"])
+        ```
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema" and which has been opened from a file.
+        variables: The names of the variables to store. They must have `(time, node)` dimensions.
+            Unless `path` is specified, they must not have been modified in memory, since the store
+            is going to be used instead of the source file.
+        path: The path of the store. Defaults to the path of the source file plus ``.tsstore``.
+            Only stores with the default path are used transparently.
+        max_memory: The maximum number of bytes that will be loaded in memory at once.
+
+    """
+    import numpy as np
+
+    source = _get_source(ds)
+    variables = list(variables)
+    if path is None:
+        if source is None:
+            raise ValueError("The dataset has not been opened from a file. Please specify `path`")
+        modified = [variable for variable in variables if not utils.is_read_from_source(ds, variable)]
+        if modified:
+            msg = (
+                f"Variables which have been modified in memory can't be stored next to {source}: {modified}"
+            )
+            raise ValueError(msg)
+        path = get_store_path(source)
+    path = pathlib.Path(path)
+    for variable in variables:
+        if ds[variable].dims != ("time", "node"):
+            msg = f"Only variables with dimensions `(time, node)` can be stored: {variable}: {ds[variable].dims}"
+            raise ValueError(msg)
+    path.mkdir(parents=True, exist_ok=True)
+    # Get the identity before reading anything, so that a source that gets modified while the store
+    # is being built makes the store invalid
+    meta: dict[str, T.Any] = dict(
+        nodes_hash=utils.get_mesh_hash(ds, variables=_NODE_VARIABLES),
+        times_hash=utils.get_mesh_hash(ds, variables=_TIME_VARIABLES),
+        **(_get_source_identity(source) if source is not None else {}),
+    )
+    no_nodes = ds.sizes["node"]
+    no_times = ds.sizes["time"]
+    for variable in variables:
+        itemsize = ds[variable].dtype.itemsize
+        time_chunk = max(1, min(no_times, max_memory // max(no_nodes * itemsize, 1)))
+        # Write to temporary files and rename them when done; this way readers never see a partial store
+        array_path, meta_path = _get_variable_paths(path, variable)
+        tmp_array_path = array_path.with_name(array_path.name + ".tmp")
+        tmp_meta_path = meta_path.with_name(meta_path.name + ".tmp")
+        with utils.timer(f"Stored {variable} in"):
+            array = np.lib.format.open_memmap(  # type: ignore[no-untyped-call]
+                tmp_array_path,
+                mode="w+",
+                dtype=ds[variable].dtype,
+                shape=(no_nodes, no_times),
+            )
+            for start in range(0, no_times, time_chunk):
+                stop = min(start + time_chunk, no_times)
+                logger.debug("Storing %s: timesteps %d-%d of %d", variable, start, stop, no_times)
+                with utils.get_read_lock(ds):
+                    values = ds[variable].isel(time=slice(start, stop)).values
+                array[:, start:stop] = values.T
+            array.flush()
+            del array
+        with open(tmp_meta_path, "w") as fd:
+            json.dump(meta, fd)
+        # Invalidate the old array before replacing it; a crash in between leaves the variable without meta
+        meta_path.unlink(missing_ok=True)
+        os.replace(tmp_array_path, array_path)
+        os.replace(tmp_meta_path, meta_path)
+    return path
+
+
+def build_timeseries_store_in_background(
+    ds: xarray.Dataset,
+    variables: T.Iterable[str],
+    *,
+    path: str | os.PathLike[str] | None = None,
+    max_memory: int = 512 * 1024**2,
+) -> concurrent.futures.Future[pathlib.Path]:
+    """
+    Same as `build_timeseries_store()`, but run it in a background thread.
+
+    Until the store is complete, the timeseries are being read from the source file.
+    """
+    variables = list(variables)
+    future = _EXECUTOR.submit(build_timeseries_store, ds, variables, path=path, max_memory=max_memory)
+    return future
+
+
+def read_nodes(
+    ds: xarray.Dataset,
+    variable: str,
+    indices: npt.NDArray[numpy.int_],
+) -> npt.NDArray[T.Any] | None:
+    """
+    Return the `(node, time)` values of `variable` for the nodes with the specified `indices`.
+
+    If there is no valid timeseries store for ``ds`` and `variable`, return `None`. A store is
+    valid if the source file has not been modified since the store was built and if the nodes
+    and the timestamps of ``ds`` match the ones of the store (e.g. the dataset has not been cropped).
+    Besides, `variable` must still be read from the source file, i.e. it must not have been modified
+    in memory (see `utils.is_read_from_source()`).
+    """
+    import numpy as np
+
+    source = _get_source(ds)
+    if source is None or "time" not in ds.dims or ds[variable].dims != ("time", "node"):
+        return None
+    if not utils.is_read_from_source(ds, variable):
+        return None
+    path = get_store_path(source)
+    array_path, meta_path = _get_variable_paths(path, variable)
+    if not meta_path.exists():
+        return None
+    try:
+        with open(meta_path) as fd:
+            meta = json.load(fd)
+        if meta.get("source_size") is not None and _get_source_identity(source) != {
+            "source_size": meta["source_size"],
+            "source_mtime_ns": meta["source_mtime_ns"],
+        }:
+            logger.warning("Ignoring outdated timeseries store: %s: %s", path, variable)
+            return None
+        if meta["nodes_hash"] != utils.get_mesh_hash(ds, variables=_NODE_VARIABLES):
+            return None
+        if meta["times_hash"] != utils.get_mesh_hash(ds, variables=_TIME_VARIABLES):
+            return None
+        array = np.load(array_path, mmap_mode="r")
+    except (OSError, ValueError, KeyError) as exc:
+        logger.warning("Ignoring invalid timeseries store: %s: %s", path, exc)
+        return None
+    with utils.timer(f"Read {len(indices)} nodes from the timeseries store in"):
+        values = np.asarray(array[indices])
+    return values
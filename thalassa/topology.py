@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import logging
+import os
+import typing as T
+
+from . import cache
+from . import utils
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import numpy
+    import numpy.typing as npt
+    import xarray
+
+    Array = npt.NDArray[numpy.int32]
+
+
+logger = logging.getLogger(__name__)
+
+# The structures of `MeshTopology` which are computed lazily, as they are stored by `save()`
+_STRUCTURES = (
+    "edges",
+    "edge_face_offsets",
+    "edge_faces",
+    "node_face_offsets",
+    "node_faces",
+    "node_node_offsets",
+    "node_nodes",
+)
+
+
+class MeshTopology:
+    """
+    The topology of a triangular mesh, i.e. its unique edges and the adjacency of its nodes and faces.
+
+    All the structures are compact ``int32`` arrays and the adjacency lists use the CSR layout, e.g.
+    the faces of node ``n`` are ``node_faces[node_face_offsets[n]:node_face_offsets[n + 1]]``.
+    Each structure is computed the first time it is accessed, so e.g. the wireframe doesn't pay
+    for the node adjacency.
+
+    Use `get_mesh_topology()` to get the (cached) topology of a dataset. Instances can be pickled,
+    or saved to/loaded from ``.npz`` files with `save()`/`load()`.
+
+    Parameters:
+        triangles: The `(face, 3)` connectivity, i.e. ``triface_nodes``.
+        no_nodes: The number of nodes of the mesh. Defaults to the largest node of ``triangles`` plus one.
+
+    """
+
+    __slots__ = (
+        "triangles",
+        "no_nodes",
+        "_edges",
+        "_edge_face_offsets",
+        "_edge_faces",
+        "_node_face_offsets",
+        "_node_faces",
+        "_node_node_offsets",
+        "_node_nodes",
+    )
+
+    def __init__(self, triangles: npt.ArrayLike, no_nodes: int | None = None) -> None:
+        import numpy as np
+
+        triangles = np.asarray(triangles)
+        if triangles.ndim != 2 or triangles.shape[1] != 3:
+            raise ValueError(f"Expected a `(face, 3)` connectivity array, not: {triangles.shape}")
+        if 3 * len(triangles) >= np.iinfo(np.int32).max:
+            raise ValueError(f"The mesh is too large for `int32` adjacency arrays: {len(triangles)} faces")
+        no_used_nodes = int(triangles.max()) + 1 if triangles.size else 0
+        if no_nodes is None:
+            no_nodes = no_used_nodes
+        # The kernels don't check bounds, so invalid node indices must be rejected here
+        if no_used_nodes > no_nodes or (triangles.size and triangles.min() < 0):
+            raise ValueError(f"Invalid node indices in the connectivity of a mesh with {no_nodes} nodes")
+        self.triangles: Array = np.ascontiguousarray(triangles, dtype=np.int32)
+        self.no_nodes = no_nodes
+        self._edges: Array | None = None
+        self._edge_face_offsets: Array | None = None
+        self._edge_faces: Array | None = None
+        self._node_face_offsets: Array | None = None
+        self._node_faces: Array | None = None
+        self._node_node_offsets: Array | None = None
+        self._node_nodes: Array | None = None
+
+    @property
+    def no_faces(self) -> int:
+        return len(self.triangles)
+
+    @property
+    def nbytes(self) -> int:
+        """The memory of the structures which have been computed so far."""
+        arrays = [self.triangles, *(getattr(self, f"_{name}") for name in _STRUCTURES)]
+        return sum(int(array.nbytes) for array in arrays if array is not None)
+
+    def _compute_edges(self) -> None:
+        from . import _kernels
+
+        with utils.timer("Computed mesh edges in"):
+            self._edges, self._edge_face_offsets, self._edge_faces = _kernels.mesh_edges(
+                self.triangles,
+                self.no_nodes,
+            )
+
+    def _compute_node_faces(self) -> None:
+        from . import _kernels
+
+        with utils.timer("Computed node faces in"):
+            self._node_face_offsets, positions = _kernels.group_by(self.triangles.ravel(), self.no_nodes)
+            self._node_faces = positions // 3
+
+    def _compute_node_nodes(self) -> None:
+        import numpy as np
+
+        from . import _kernels
+
+        # Put the smaller neighbours first, so that the neighbours of each node are sorted
+        rows = np.concatenate((self.edges[:, 1], self.edges[:, 0]))
+        columns = np.concatenate((self.edges[:, 0], self.edges[:, 1]))
+        with utils.timer("Computed node neighbours in"):
+            self._node_node_offsets, positions = _kernels.group_by(rows, self.no_nodes)
+            self._node_nodes = columns[positions]
+
+    @property
+    def edges(self) -> Array:
+        """The unique `(edge, 2)` edges; the first node of each edge is the smaller one."""
+        if self._edges is None:
+            self._compute_edges()
+        return T.cast("Array", self._edges)
+
+    @property
+    def edge_face_offsets(self) -> Array:
+        if self._edge_face_offsets is None:
+            self._compute_edges()
+        return T.cast("Array", self._edge_face_offsets)
+
+    @property
+    def edge_faces(self) -> Array:
+        """The faces of each edge; one for the edges on the boundary of the mesh, two for the rest."""
+        if self._edge_faces is None:
+            self._compute_edges()
+        return T.cast("Array", self._edge_faces)
+
+    @property
+    def node_face_offsets(self) -> Array:
+        if self._node_face_offsets is None:
+            self._compute_node_faces()
+        return T.cast("Array", self._node_face_offsets)
+
+    @property
+    def node_faces(self) -> Array:
+        """The faces of each node."""
+        if self._node_faces is None:
+            self._compute_node_faces()
+        return T.cast("Array", self._node_faces)
+
+    @property
+    def node_node_offsets(self) -> Array:
+        if self._node_node_offsets is None:
+            self._compute_node_nodes()
+        return T.cast("Array", self._node_node_offsets)
+
+    @property
+    def node_nodes(self) -> Array:
+        """The neighbours of each node, i.e. the nodes it shares an edge with, in ascending order."""
+        if self._node_nodes is None:
+            self._compute_node_nodes()
+        return T.cast("Array", self._node_nodes)
+
+    @property
+    def boundary_edges(self) -> Array:
+        """The edges which belong to exactly one face."""
+        import numpy as np
+
+        return T.cast("Array", self.edges[np.diff(self.edge_face_offsets) == 1])
+
+    def get_edge_faces(self, edge: int) -> Array:
+        """Return the faces of ``edge``."""
+        return self.edge_faces[self.edge_face_offsets[edge] : self.edge_face_offsets[edge + 1]]
+
+    def get_node_faces(self, node: int) -> Array:
+        """Return the faces of ``node``."""
+        return self.node_faces[self.node_face_offsets[node] : self.node_face_offsets[node + 1]]
+
+    def get_node_neighbours(self, node: int) -> Array:
+        """Return the neighbours of ``node``."""
+        return self.node_nodes[self.node_node_offsets[node] : self.node_node_offsets[node + 1]]
+
+    def save(self, path: str | os.PathLike[str]) -> None:
+        """Save the topology to `path` (an ``.npz`` file). All the structures are computed if necessary."""
+        import numpy as np
+
+        np.savez(
+            path,
+            triangles=self.triangles,
+            no_nodes=np.array(self.no_nodes),
+            **{name: getattr(self, name) for name in _STRUCTURES},
+        )
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> MeshTopology:
+        """Load a topology which has been saved with `save()`."""
+        import numpy as np
+
+        with np.load(path) as npz:
+            topology = cls(npz["triangles"], no_nodes=int(npz["no_nodes"]))
+            for name in _STRUCTURES:
+                setattr(topology, f"_{name}", npz[name])
+        return topology
+
+
+# The topologies of the meshes which have been used recently
+_TOPOLOGY_CACHE: cache.LRUCache[str, MeshTopology] = cache.LRUCache(maxsize=4)
+
+
+def get_mesh_topology(ds: xarray.Dataset) -> MeshTopology:
+    """
+    Return the `MeshTopology` of the mesh of ``ds``.
+
+    The topology is only created once per mesh; subsequent calls return the cached instance,
+    including any structures that have been computed in the meantime.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+
+    """
+    return _TOPOLOGY_CACHE.get_or_create(
+        utils.get_mesh_hash(ds),
+        lambda: MeshTopology(utils.get_triangles(ds), no_nodes=ds.sizes["node"]),
+    )
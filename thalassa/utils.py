@@ -1,12 +1,18 @@
 from __future__ import annotations
 
+import contextlib
+import hashlib
 import logging
 import sys
+import threading
 import time
 import typing as T
+import weakref
 
 import decorator
 
+from . import cache
+
 
 if T.TYPE_CHECKING:  # pragma: no cover
     import geopandas
@@ -36,13 +42,54 @@ def resolve_bbox(
     return bbox
 
 
+def _is_rectangle(geometry: shapely.Geometry) -> bool:
+    import shapely
+
+    return bool(geometry.equals(shapely.box(*geometry.bounds)))
+
+
+def _select_nodes(
+    x: npt.NDArray[numpy.float64],
+    y: npt.NDArray[numpy.float64],
+    candidates: npt.NDArray[numpy.int64],
+    geometry: shapely.Geometry,
+) -> npt.NDArray[numpy.int64]:
+    """Return the ``candidates`` (i.e. the nodes within the bounds of ``geometry``) within ``geometry``."""
+    import shapely
+
+    if _is_rectangle(geometry):
+        return candidates
+    shapely.prepare(geometry)
+    # Unlike `contains_xy()`, `intersects_xy()` keeps the nodes on the boundary, just like the bbox check
+    inside = shapely.intersects_xy(geometry, x[candidates], y[candidates])
+    return T.cast("npt.NDArray[numpy.int64]", candidates[inside])
+
+
+def _subset(
+    ds: xarray.Dataset,
+    node_indices: npt.NDArray[numpy.int64] | None,
+    triface_indices: npt.NDArray[numpy.int64],
+    triface_nodes: npt.NDArray[numpy.int_],
+) -> xarray.Dataset:
+    indexers = dict(triface=triface_indices)
+    if node_indices is not None:
+        indexers["node"] = node_indices
+    # The `triface` dimension may be gone if `triface_nodes` was its only variable
+    ds = ds.drop_vars("triface_nodes").isel(indexers, missing_dims="ignore")
+    ds["triface_nodes"] = (("triface", "three"), triface_nodes)
+    return ds
+
+
 def crop(
     ds: xarray.Dataset,
-    bbox: shapely.Polygon,
+    bbox: shapely.Geometry | tuple[float, float, float, float],
 ) -> xarray.Dataset:
     """
     Crop the dataset using the provided `bbox`.
 
+    The nodes within (or on the boundary of) `bbox` are kept, together with the triangles whose
+    nodes are all kept. `bbox` doesn't need to be a rectangle; e.g. it can be a coastline buffer.
+
     Examples:
         ``` python
         import thalassa
@@ -55,31 +102,85 @@ def crop(
 
     Parameters:
         ds: The dataset we want to crop.
-        bbox: A Shapely polygon whose boundary will be used to crop `ds`.
+        bbox: A Shapely (multi)polygon or a `(xmin, ymin, xmax, ymax)` tuple; it is used to crop `ds`.
     """
     import numpy as np
-    import numpy_indexed as npi
-
-    bbox = resolve_bbox(bbox)
-    indices_of_nodes_in_bbox = np.where(
-        True
-        & (ds.lat >= bbox.bounds[1])
-        & (ds.lat <= bbox.bounds[3])
-        & (ds.lon >= bbox.bounds[0])
-        & (ds.lon <= bbox.bounds[2]),
-    )[0]
-    indices_of_triface_nodes_in_bbox = np.where(
-        ds.triface_nodes.isin(indices_of_nodes_in_bbox).all(axis=1),
-    )[0]
-    ds = ds.isel(node=indices_of_nodes_in_bbox, triface=indices_of_triface_nodes_in_bbox)
-    remapped_nodes = np.arange(len(indices_of_nodes_in_bbox))
-    remapped_triface_nodes = np.c_[
-        npi.remap(ds.triface_nodes[:, 0], indices_of_nodes_in_bbox, remapped_nodes),
-        npi.remap(ds.triface_nodes[:, 1], indices_of_nodes_in_bbox, remapped_nodes),
-        npi.remap(ds.triface_nodes[:, 2], indices_of_nodes_in_bbox, remapped_nodes),
-    ]
-    ds["triface_nodes"] = (("triface", "three"), remapped_triface_nodes)
-    return ds
+
+    from . import _kernels
+
+    geometry = resolve_bbox(bbox)
+    # Only the coordinates and the connectivity are loaded; the data variables are subset lazily
+    x = np.asarray(ds.lon.values, dtype=np.float64)
+    y = np.asarray(ds.lat.values, dtype=np.float64)
+    node_indices, lookup = _kernels.crop_nodes(x, y, *geometry.bounds)
+    if not _is_rectangle(geometry):
+        node_indices = _select_nodes(x, y, node_indices, geometry)
+        lookup = np.full(len(x), -1, dtype=np.int32)
+        lookup[node_indices] = np.arange(len(node_indices), dtype=np.int32)
+    triface_indices, triface_nodes = _kernels.crop_triangles(np.asarray(get_triangles(ds)), lookup)
+    return _subset(ds, node_indices, triface_indices, triface_nodes)
+
+
+def crop_regions(
+    ds: xarray.Dataset,
+    regions: T.Mapping[str, shapely.Geometry | tuple[float, float, float, float]],
+) -> dict[str, xarray.Dataset]:
+    """
+    Split the dataset into many regional subsets, e.g. one per basin.
+
+    The result is the same as calling `crop()` once per region, but the connectivity is only
+    processed once, no matter how many regions there are. The regions may overlap.
+
+    Examples:
+        ``` python
+        import thalassa
+        import shapely
+
+        ds = thalassa.open_dataset("some_netcdf.nc")
+        regions = {"north": shapely.box(0, 1, 1, 2), "south": shapely.box(0, 0, 1, 1)}
+        subsets = thalassa.crop_regions(ds, regions)
+        subsets["north"]
+        ```
+
+    Parameters:
+        ds: The dataset we want to split.
+        regions: A mapping of region names to Shapely (multi)polygons or `(xmin, ymin, xmax, ymax)` tuples.
+    """
+    import numpy as np
+
+    from . import _kernels
+
+    names = list(regions)
+    x = np.asarray(ds.lon.values, dtype=np.float64)
+    y = np.asarray(ds.lat.values, dtype=np.float64)
+    triangles = np.asarray(get_triangles(ds))
+    # Sort the nodes by longitude once, so that the bbox pre-filter of each region is a binary search
+    order = np.argsort(x, kind="stable")
+    sorted_x = x[order]
+    # One bitset per node; bit `r` is set if the node is within region `r`
+    bits = np.zeros((len(x), max(1, (len(names) + 63) // 64)), dtype=np.uint64)
+    node_indices = {}
+    for r, name in enumerate(names):
+        geometry = resolve_bbox(regions[name])
+        xmin, ymin, xmax, ymax = geometry.bounds
+        start = np.searchsorted(sorted_x, xmin, side="left")
+        stop = np.searchsorted(sorted_x, xmax, side="right")
+        candidates = order[start:stop]
+        candidates = np.sort(candidates[(y[candidates] >= ymin) & (y[candidates] <= ymax)])
+        node_indices[name] = _select_nodes(x, y, candidates, geometry)
+        bits[node_indices[name], r // 64] |= np.uint64(1) << np.uint64(r % 64)
+    offsets, indices = _kernels.crop_regions_triangles(triangles, bits, len(names))
+    # A single lookup table is reused; only the entries of each region are set and then reset
+    lookup = np.full(len(x), -1, dtype=np.int32)
+    subsets = {}
+    for r, name in enumerate(names):
+        nodes = node_indices[name]
+        triface_indices = indices[offsets[r] : offsets[r + 1]]
+        lookup[nodes] = np.arange(len(nodes), dtype=np.int32)
+        triface_nodes = lookup[triangles[triface_indices]].astype(triangles.dtype)
+        lookup[nodes] = -1
+        subsets[name] = _subset(ds, nodes, triface_indices, triface_nodes)
+    return subsets
 
 
 def generate_thalassa_ds(
@@ -140,51 +241,265 @@ def filter_visualizable_data_vars(ds: xarray.Dataset, variables: T.Iterable[str]
     return visualizable
 
 
-def split_quads(face_nodes: npt.NDArray[numpy.int_]) -> npt.NDArray[numpy.int_]:
+def _check_node_indices(
+    triangles: npt.NDArray[numpy.int32],
+    no_nodes: int | None,
+) -> npt.NDArray[numpy.int32]:
+    if no_nodes is not None and len(triangles) and triangles.max() >= no_nodes:
+        msg = (
+            f"The triangles refer to node {triangles.max()}, but the mesh has {no_nodes} nodes. "
+            "Does the connectivity use a fill value for missing vertices? If so, please pass `fill_value`"
+        )
+        raise ValueError(msg)
+    return triangles
+
+
+def triangulate(
+    face_nodes: npt.NDArray[T.Any],
+    fill_value: int | None = None,
+    no_nodes: int | None = None,
+) -> npt.NDArray[numpy.int32]:
     """
-    https://gist.github.com/pmav99/5ded91f18ef096b080b2ed45598c7d1c
+    Split the faces of a mixed triangle/quad/polygon mesh to triangles.
+
+    Polygons are split using fan triangulation. The first `len(face_nodes)` triangles are the
+    first triangle of each face; they are followed by the remaining triangles of the quads/polygons.
+    Missing vertices, i.e. `nan`, negative values and `fill_value`, are skipped. The splitting is done
+    by a compiled kernel, in a single pass over the faces, without casting the faces.
+
+    If `face_nodes` is a `dask` array, the result is a `dask` array, too. The number of triangles
+    of each chunk determines the length of the result, so the faces are read (and kept in memory)
+    once, and both the counts and the triangles are computed from them. In that case, the node
+    indices are checked when the triangles are computed.
+
+    Parameters:
+        face_nodes: An `(n, max_no_vertices)` array with the (zero-based) node indices of each face.
+        fill_value: An additional value which marks missing vertices. It is compared to the values of
+            `face_nodes` as they are passed. `thalassa.normalize()` takes the fill value of the file
+            instead, i.e. the value before the conversion to zero-based indices.
+        no_nodes: The number of nodes of the mesh. If specified, a `ValueError` is raised if
+            a triangle refers to a node which doesn't exist (e.g. because of an unhandled fill value).
+
     """
     import numpy as np
 
+    from . import _kernels
+
+    use_fill_value = fill_value is not None
+    fill = int(fill_value) if fill_value is not None else 0
+    if hasattr(face_nodes, "map_blocks"):
+        # dask: Each chunk must contain whole faces
+        chunked: T.Any = face_nodes
+        chunked = chunked.rechunk({1: -1}).persist()
+        first = chunked.map_blocks(
+            lambda block: _check_node_indices(
+                _kernels.triangulate(block, fill, use_fill_value, True, False),
+                no_nodes,
+            ),
+            chunks=(chunked.chunks[0], (3,)),
+            dtype=np.int32,
+        )
+        counts = chunked.map_blocks(
+            lambda block: np.array([_kernels.count_extra_triangles(block, fill, use_fill_value)]),
+            chunks=((1,) * chunked.numblocks[0],),
+            drop_axis=1,
+            dtype=np.int64,
+        )
+        extra = chunked.map_blocks(
+            lambda block: _check_node_indices(
+                _kernels.triangulate(block, fill, use_fill_value, False, True),
+                no_nodes,
+            ),
+            chunks=(tuple(int(count) for count in counts.compute()), (3,)),
+            dtype=np.int32,
+        )
+        # `np.concatenate()` dispatches to `dask.array.concatenate()`
+        return T.cast("npt.NDArray[numpy.int32]", np.concatenate([first, extra]))
+    triangles = _kernels.triangulate(np.ascontiguousarray(face_nodes), fill, use_fill_value, True, True)
+    return _check_node_indices(triangles, no_nodes)
+
+
+def split_quads(face_nodes: npt.NDArray[T.Any]) -> npt.NDArray[T.Any]:
+    """
+    https://gist.github.com/pmav99/5ded91f18ef096b080b2ed45598c7d1c
+
+    Kept for backwards compatibility; `triangulate()` supports polygons and fill values, too.
+    """
     if face_nodes.shape[-1] != 4:
         return face_nodes
+    return triangulate(face_nodes)
 
-    # We assume that the nans only exist in the last column
-    # Therefore the first 3 columns are the existing triangles
-    existing_triangles = face_nodes[:, :3]
-
-    # Identify the quads. They are the rows with nan in the last column
-    # The nonzero() function is a speed optimization. With this, we only keep
-    # the index  values we care about, instead of the whole boolean array
-    quad_indexes = np.nonzero(~np.isnan(face_nodes).any(axis=1))
-    quads = face_nodes[quad_indexes]
-
-    # Create the new triangles
-    quads_first_column = quads[:, 0]
-    quads_last_two_columns = quads[:, -2:]
-    new_triangles = np.c_[quads_first_column, quads_last_two_columns]
-
-    # Append new triangles to the existing ones
-    # Also cast to the proper type for Mypy
-    new_face_nodes = T.cast(
-        npt.NDArray[np.int_],
-        np.r_[existing_triangles, new_triangles].astype(int),
-    )
-    return new_face_nodes
-    # return new_face_nodes.astype(int)
 
+# Not all the backends of xarray are thread-safe, e.g. the Selafin backend reads all the variables of a file
+# through a single file handle. The reads which might run concurrently, e.g. the prefetching of frames
+# and the tap/pointer callbacks, are serialized per source file.
+_READ_LOCKS: dict[str, threading.RLock] = {}
+_READ_LOCKS_LOCK = threading.Lock()
 
-def get_index_of_nearest_node(ds: xarray.Dataset, lon: float, lat: float) -> int:
-    # https://www.unidata.ucar.edu/blogs/developer/en/entry/accessing_netcdf_data_by_coordinates
-    # https://github.com/Unidata/python-workshop/blob/fall-2016/notebooks/netcdf-by-coordinates.ipynb
-    dist = abs(ds.lon - lon) ** 2 + abs(ds.lat - lat) ** 2
-    index_of_nearest_node = int(dist.argmin())
-    return index_of_nearest_node
+
+def get_read_lock(ds: xarray.Dataset) -> T.ContextManager[T.Any]:
+    """
+    Return the lock which serializes the reads from the source file of ``ds``.
+
+    Thalassa holds it whenever it loads data, including in its background threads. Hold it, too,
+    if you load data from a dataset while e.g. the frames of `create_time_trimesh()` are being prefetched.
+    Datasets which have not been opened from a file don't need a lock, so a no-op context manager is returned.
+
+    Examples:
+        ``` python
+        with thalassa.utils.get_read_lock(ds):
+            values = ds.zeta.isel(time=0).values
+        ```
+    """
+    source = ds.encoding.get("source")
+    if source is None:
+        return contextlib.nullcontext()
+    with _READ_LOCKS_LOCK:
+        return _READ_LOCKS.setdefault(str(source), threading.RLock())
+
+
+def get_triangles(ds: xarray.Dataset) -> npt.NDArray[numpy.int_]:
+    """
+    Return the `triface_nodes` of a normalized dataset as a numpy array.
+
+    A deferred connectivity (e.g. the `dask` array of `normalize()`) or one which is read lazily
+    from the file, is loaded in place on first use, just like `normalization.load_mesh()` does.
+    This way it is neither computed nor read again, neither for ``ds`` nor for the datasets that
+    share its `triface_nodes` (e.g. ``ds.isel(time=0)``).
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+
+    """
+    import numpy as np
+
+    variable = ds.variables["triface_nodes"]
+    if not isinstance(variable._data, np.ndarray):
+        with get_read_lock(ds), timer("Loaded triface_nodes in"):
+            variable.load()  # type: ignore[no-untyped-call]
+    return T.cast("npt.NDArray[numpy.int_]", variable.values)
+
+
+def is_read_from_source(ds: xarray.Dataset, variable: str) -> bool:
+    """
+    Return `True` if the values of ``variable`` are still read from the source file of ``ds``.
+
+    That's the case for the lazily indexed arrays of the backends and for the dask arrays that
+    `xarray.open_dataset()` creates with `chunks`. Variables which have been computed or assigned
+    in memory (e.g. ``ds.assign(zeta=ds.zeta * 2)``) are not, even if ``ds`` has been opened from a file.
+    """
+    import numpy as np
+
+    if ds.encoding.get("source") is None:
+        return False
+    # `Variable._data` is the (possibly lazy) array of the variable; `.data` would load it
+    data: T.Any = ds.variables[variable]._data
+    if hasattr(data, "map_blocks"):
+        # The names of dask arrays are tokens of their graphs; any operation gives them a new prefix
+        return str(data.name).startswith("open_dataset-")
+    return not isinstance(data, np.ndarray)
+
+
+# Mesh hashes are memoized per underlying array, so the datasets which are derived from a dataset,
+# e.g. with `ds.isel(time=0)`, share the memoized hash of its mesh. The arrays are treated as immutable,
+# i.e. if you modify the `lon`, `lat` or `triface_nodes` of a dataset in place, the memoized hash becomes stale.
+# Each entry keeps a (weak, if possible) reference to its arrays, so that their ids can't be reused.
+_MESH_HASHES: cache.LRUCache[tuple[T.Hashable, ...], tuple[list[T.Any], str]] = cache.LRUCache(maxsize=32)
+MESH_VARIABLES = ("lon", "lat", "triface_nodes")
+
+
+def _get_mesh_arrays(ds: xarray.Dataset, variables: tuple[str, ...]) -> list[T.Any]:
+    # `Variable._data` is the (possibly lazy) array of a variable; unlike `Variable.data` it doesn't
+    # trigger loading and it is shared by the variables of e.g. `ds.isel(time=0)` and `ds[["lon", "lat"]]`
+    return [ds.variables[name]._data for name in variables if name in ds.variables]
+
+
+def _get_memo_key(variables: tuple[str, ...], arrays: list[T.Any]) -> tuple[T.Hashable, ...]:
+    return (variables, *(id(array) for array in arrays))
+
+
+def _get_memoized_hash(ds: xarray.Dataset, variables: tuple[str, ...]) -> str | None:
+    arrays = _get_mesh_arrays(ds, variables)
+    entry = _MESH_HASHES.get(_get_memo_key(variables, arrays))
+    if entry is None:
+        return None
+    references, digest = entry
+    for reference, array in zip(references, arrays):
+        if (reference() if isinstance(reference, weakref.ref) else reference) is not array:
+            return None
+    return digest
+
+
+def get_mesh_hash(ds: xarray.Dataset, variables: tuple[str, ...] = MESH_VARIABLES) -> str:
+    """
+    Return a hex digest which identifies the mesh of ``ds``.
+
+    The digest is computed from the contents of ``variables`` (the missing ones are skipped),
+    so two datasets that share the same mesh get the same hash, regardless of their data variables.
+    If only the nodes matter (e.g. for nearest node lookups) use ``variables=("lon", "lat")``.
+
+    The digest is memoized per underlying array, so e.g. ``ds.isel(time=i)`` doesn't hash the mesh again.
+    """
+    import numpy as np
+
+    digest = _get_memoized_hash(ds, variables)
+    if digest is not None:
+        return digest
+    hasher = hashlib.sha1(usedforsecurity=False)
+    for name in variables:
+        if name not in ds.variables:
+            continue
+        array = np.ascontiguousarray(get_triangles(ds) if name == "triface_nodes" else ds[name].values)
+        hasher.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        if array.dtype.kind in "mM":
+            # datetimes/timedeltas don't support the buffer protocol
+            array = array.view(np.int64)
+        hasher.update(array.data)
+    digest = hasher.hexdigest()
+    set_mesh_hash(ds, digest, variables=variables)
+    return digest
+
+
+def set_mesh_hash(ds: xarray.Dataset, digest: str, variables: tuple[str, ...] = MESH_VARIABLES) -> None:
+    """
+    Memoize the hash of the mesh of ``ds``, e.g. when it is known from a previous session.
+
+    It is up to the caller to ensure that ``digest`` is what `get_mesh_hash()` would return.
+    """
+    arrays = _get_mesh_arrays(ds, variables)
+    references: list[T.Any] = []
+    for array in arrays:
+        try:
+            references.append(weakref.ref(array))
+        except TypeError:
+            # e.g. the lazily indexed arrays of xarray; keep them alive, so that their ids aren't reused
+            references.append(array)
+    _MESH_HASHES.put(_get_memo_key(variables, arrays), (references, digest))
+
+
+def get_index_of_nearest_node(
+    ds: xarray.Dataset,
+    lon: float,
+    lat: float,
+    metric: T.Literal["euclidean", "haversine"] = "euclidean",
+) -> int:
+    """
+    Return the index of the node of ``ds`` which is the closest to ``(lon, lat)``.
+
+    The lookup uses a spatial index which gets built on the first call and is cached per mesh.
+    Check `thalassa.spatial.get_node_index()` for more info about `metric`.
+    """
+    from . import spatial
+
+    node_index = spatial.get_node_index(ds=ds, metric=metric)
+    _, index_of_nearest_node = node_index.query(lon, lat)
+    return int(index_of_nearest_node)
 
 
 def drop_elements_crossing_idl(
     ds: xarray.Dataset,
     max_lon: float = 10,
+    wrap: bool = False,
 ) -> xarray.Dataset:
     """
     Drop triface elements crossing the International Date Line (IDL).
@@ -203,27 +518,55 @@ def drop_elements_crossing_idl(
     These rules can lead to false positives close to the poles (e.g. latitudes > 89) especially
     if a small value for `max_lon` is used. Nevertheless, the main purpose of this function is
     to visualize data, so some false positives are not the end of the wold.
+
+    If ``wrap`` is `True`, the crossing elements are not dropped; instead, the nodes of these elements
+    are duplicated with their longitudes shifted by 360 degrees, so that each element is
+    rendered twice: once beyond 180 and once beyond -180. This way, global meshes are rendered
+    without a seam along the IDL. The duplicated nodes are appended to the `node` dimension and they
+    share the data of the original nodes. Elements that span more than 180 degrees even after
+    being wrapped are still dropped.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+        max_lon: The maximum longitudinal "distance" in degrees for an element.
+        wrap: Whether to wrap the elements crossing the IDL instead of dropping them.
     """
     import numpy as np
 
+    from . import _kernels
+
     if max_lon <= 0:
         raise ValueError(f'Maximum longitudinal "distance" must be positive: {max_lon}')
-    a, b, c = ds.triface_nodes.data.T
-    lon = ds.lon.data
-    lon_a = lon[a]
-    lon_b = lon[b]
-    lon_c = lon[c]
-    # `np.asarray(condition).nonzero()` is equivalent to `np.where(condition)`
-    # For more info check the help of `np.where()`
-    condition = (
-        # fmt: off
-        ((lon_a * lon_b < 0) & (np.abs(lon_a - lon_b) >= max_lon))
-        | ((lon_a * lon_c < 0) & (np.abs(lon_a - lon_c) >= max_lon))
-        | ((lon_b * lon_c < 0) & (np.abs(lon_b - lon_c) >= max_lon))
-        # fmt: on
+    lon = np.asarray(ds.lon.values, dtype=np.float64)
+    triangles = np.asarray(get_triangles(ds))
+    classes = _kernels.classify_idl_triangles(lon, triangles, max_lon)
+    not_crossing = classes == _kernels.IDL_NOT_CROSSING
+    if not_crossing.all():
+        return ds
+    # `np.compress()` is considerably faster than boolean indexing for large arrays
+    kept_triangles = np.compress(not_crossing, triangles, axis=0)
+    if not wrap:
+        return _subset(ds, None, np.flatnonzero(not_crossing), kept_triangles)
+    wrapped = np.flatnonzero(classes == _kernels.IDL_WRAPPABLE)
+    crossing = triangles[wrapped]
+    is_west = lon[crossing] < 0
+    # The eastern copy of an element uses duplicates of its western nodes shifted by +360
+    # and the western copy uses duplicates of its eastern nodes shifted by -360
+    west_nodes = np.unique(crossing[is_west])
+    east_nodes = np.unique(crossing[~is_west])
+    no_nodes = len(lon)
+    east_copies = crossing.copy()
+    east_copies[is_west] = no_nodes + np.searchsorted(west_nodes, crossing[is_west])
+    west_copies = crossing.copy()
+    west_copies[~is_west] = no_nodes + len(west_nodes) + np.searchsorted(east_nodes, crossing[~is_west])
+    ds = _subset(
+        ds,
+        node_indices=np.r_[np.arange(no_nodes), west_nodes, east_nodes],
+        triface_indices=np.r_[np.flatnonzero(not_crossing), wrapped, wrapped],
+        triface_nodes=np.r_[kept_triangles, east_copies, west_copies].astype(triangles.dtype),
     )
-    indices_of_triface_nodes_crossing_idl = np.asarray(condition).nonzero()[0]
-    ds = ds.drop_isel(triface=indices_of_triface_nodes_crossing_idl)
+    wrapped_lon = np.r_[lon, lon[west_nodes] + 360, lon[east_nodes] - 360]
+    ds["lon"] = ds.lon.copy(data=wrapped_lon.astype(ds.lon.dtype))
     return ds
 
 
@@ -271,6 +614,8 @@ def is_point_in_the_raster(raster: geoviews.DynamicMap, lon: float, lat: float)
         stofs_raster.opts(width=600, height=600)
         assert not is_point_in_the_raster(stofs_raster, 22, 40)
 
+    If you need a result that does not depend on the viewport, use `is_point_in_the_mesh()` instead.
+
     """
     import numpy as np
 
@@ -280,74 +625,91 @@ def is_point_in_the_raster(raster: geoviews.DynamicMap, lon: float, lat: float)
     return T.cast(bool, ~np.isnan(interpolated))
 
 
-def generate_mesh_polygon(ds: xarray.Dataset) -> geopandas.GeoDataFrame:
-    """Return a ``geopandas.GeoDataFrame`` containing the union of all the polygons"""
-    import geopandas as gpd
+def is_point_in_the_mesh(ds: xarray.Dataset, lon: float, lat: float) -> bool:
+    """
+    Return ``True`` if the point is inside the mesh of ``ds``, ``False`` otherwise.
+
+    Contrary to `is_point_in_the_raster()`, the result is exact and it does not depend on the
+    zoom level or on the size of the viewport. The check uses a `TriangleLocator` which is built
+    on the first call and is cached per mesh, so it is cheap enough to be used on every pointer event.
+    The triangles of global meshes that cross the International Date Line are wrapped, so that
+    they don't cover the whole globe.
+    """
+    from . import spatial
+
+    locator = spatial.get_triangle_locator(ds, wrap_idl=True)
+    return bool(locator.contains(lon, lat)[0])
+
+
+def _create_mesh_outline(ds: xarray.Dataset) -> shapely.Polygon | shapely.MultiPolygon:
     import numpy as np
     import shapely
 
-    logger.debug("Starting polygon generation")
-    # Get the indexes of the nodes
-    triface_nodes = ds.triface_nodes.data
-    nodes = ds.node.data
-    first_nodes = nodes[triface_nodes[:, 0]]
-    second_nodes = nodes[triface_nodes[:, 1]]
-    third_nodes = nodes[triface_nodes[:, 2]]
-    del triface_nodes
-    del nodes
-
-    lons = ds.lon.data
-    lats = ds.lat.data
-    first_lons = lons[first_nodes]
-    second_lons = lons[second_nodes]
-    third_lons = lons[third_nodes]
-    del lons
-
-    lats = ds.lat.data
-    first_lats = lats[first_nodes]
-    second_lats = lats[second_nodes]
-    third_lats = lats[third_nodes]
-    del lats
-    del first_nodes
-    del second_nodes
-    del third_nodes
-
-    # Stack the coords, one polygon per line
-    polygons_per_line = np.vstack(
-        (
-            first_lons,
-            first_lats,
-            second_lons,
-            second_lats,
-            third_lons,
-            third_lats,
-            first_lons,
-            first_lats,
-        ),
-    ).T
-
-    # Re-stack the polygon coords. This time we should have 4 points per line
-    polygons_coords = np.stack(
-        (
-            polygons_per_line[:, :2],
-            polygons_per_line[:, 2:4],
-            polygons_per_line[:, 4:6],
-            polygons_per_line[:, 6:8],
-        ),
-        axis=1,
+    from . import _kernels
+    from . import topology
+
+    lons = np.asarray(ds.lon.values, dtype=np.float64)
+    lats = np.asarray(ds.lat.values, dtype=np.float64)
+    edges = topology.get_mesh_topology(ds).boundary_edges
+    offsets, nodes = _kernels.walk_rings(edges, len(lons))
+    no_rings = len(offsets) - 1
+    if not no_rings:
+        return shapely.MultiPolygon()
+    ring_ids = np.repeat(np.arange(no_rings), np.diff(offsets))
+    rings = shapely.polygons(shapely.linearrings(lons[nodes], lats[nodes], indices=ring_ids))
+    # The rings are not consistently oriented, so shells and holes are told apart by their nesting depth:
+    # shells are contained in an even number of rings and holes in an odd number of rings
+    inner, outer = shapely.STRtree(rings).query(rings, predicate="within")
+    nested = inner != outer
+    inner, outer = inner[nested], outer[nested]
+    depth = np.bincount(inner, minlength=no_rings)
+    holes: dict[int, list[T.Any]] = {int(shell): [] for shell in np.flatnonzero(depth % 2 == 0)}
+    # A hole belongs to the innermost shell which contains it
+    for hole, shell in zip(inner, outer):
+        if depth[hole] % 2 == 1 and depth[shell] == depth[hole] - 1:
+            holes[int(shell)].append(rings[hole].exterior)
+    polygons = [shapely.Polygon(rings[shell].exterior, holes[shell]) for shell in sorted(holes)]
+    if len(polygons) == 1:
+        return polygons[0]
+    return shapely.MultiPolygon(polygons)
+
+
+_MESH_OUTLINE_CACHE: cache.LRUCache[str, T.Any] = cache.LRUCache(maxsize=4)
+
+
+def get_mesh_outline(ds: xarray.Dataset) -> shapely.Polygon | shapely.MultiPolygon:
+    """
+    Return the outline of the mesh of ``ds``, i.e. the union of all of its triangles.
+
+    The outline is built from the boundary edges of the `MeshTopology` (i.e. the edges which belong to
+    exactly one triangle), which are chained into rings and classified as shells or holes.
+    The outline is only built once per mesh and it is prepared, so it can be used directly for
+    point-in-mesh tests, e.g. with `shapely.contains_xy()`, or for masking.
+
+    Parameters:
+        ds: A dataset which adheres to the "thalassa schema".
+
+    """
+    import shapely
+
+    def create() -> shapely.Polygon | shapely.MultiPolygon:
+        with timer("Generated mesh outline in"):
+            outline = _create_mesh_outline(ds)
+        shapely.prepare(outline)
+        return outline
+
+    outline: shapely.Polygon | shapely.MultiPolygon = _MESH_OUTLINE_CACHE.get_or_create(
+        get_mesh_hash(ds),
+        create,
     )
-    # sanity check
-    if polygons_coords.shape[1:] != (4, 2):
-        raise ValueError("Something went wrong")
-    del polygons_per_line
-
-    polygons = shapely.polygons(polygons_coords)
-    polygon = shapely.coverage_union_all(polygons)
-    del polygons
-
-    # convert to GeoDataFrame
-    gdf = gpd.GeoDataFrame(geometry=[polygon])
-    return gdf
+    return outline
+
+
+def generate_mesh_polygon(ds: xarray.Dataset) -> geopandas.GeoDataFrame:
+    """Return a ``geopandas.GeoDataFrame`` containing the union of all the polygons"""
+    import geopandas as gpd
+
+    return gpd.GeoDataFrame(geometry=[get_mesh_outline(ds)])
 
 
 @decorator.contextmanager